@@ -0,0 +1,308 @@
+"""Http client of coroutines, for the asynchronous scraper.
+
+It needs trollius (asyncio for python 2). Pages are fetched over non blocking
+keep-alive connections, so a single thread can wait for many of them at the
+same time.
+"""
+
+import httplib
+import time
+import zlib
+from StringIO import StringIO
+from urlparse import urlsplit, urljoin
+from http_session import HttpSession, HttpError
+from metrics import get_metrics
+from rate_limiter import AdaptiveRateLimiter
+
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+except ImportError:
+    asyncio = None
+
+
+def coroutine(func):
+    """Decorate a coroutine, if trollius is installed (it is checked when a
+    client is created)."""
+
+    if asyncio:
+        return asyncio.coroutine(func)
+
+    return func
+
+
+class AsyncHttpClient():
+    """Http client of coroutines that keeps persistent connections.
+
+    It behaves like HttpSession: pages are asked gzipped, redirections are
+    followed, transient errors are retried "retries" times waiting "backoff"
+    seconds before the first retry (doubled before each next one) and, if a
+    "rate" is passed, requests to each host go through an
+    AdaptiveRateLimiter.
+
+    No more than "max_fetches" requests are made at the same time, and
+    connections are kept open to be reused by the next requests.
+    """
+
+    # DATA
+    USER_AGENT = HttpSession.USER_AGENT
+    MAX_REDIRECTS = HttpSession.MAX_REDIRECTS
+    REDIRECT_STATUS = HttpSession.REDIRECT_STATUS
+    TRANSIENT_STATUS = HttpSession.TRANSIENT_STATUS
+    DEFAULT_PORTS = {"http": 80, "https": 443}
+
+    def __init__(self, max_fetches, timeout=None, retries=None, backoff=None,
+                 rate=None, max_rate=None):
+
+        if not asyncio:
+            raise ImportError("trollius is needed to scrape asynchronously")
+
+        # client parameters
+        self.timeout = timeout or HttpSession.TIMEOUT
+        self.retries = HttpSession.RETRIES if retries is None else retries
+        self.backoff = HttpSession.BACKOFF if backoff is None else backoff
+        self.rate = rate
+        self.max_rate = max_rate
+
+        self.semaphore = asyncio.Semaphore(max_fetches)
+        self.rate_limiters = {}
+
+        # idle connections of each host, as (reader, writer) tuples
+        self.connections = {}
+
+        self.transient_errors = (EnvironmentError, EOFError,
+                                 httplib.HTTPException, asyncio.TimeoutError)
+
+    # PUBLIC
+    @coroutine
+    def get(self, url, headers=None, unit=None):
+        """Make a GET request and return a (status, headers, body) tuple.
+
+        Redirections are followed. Responses with status 2xx or 304 are
+        returned, any other one raises HttpError. Metrics are added to the
+        "unit" passed (see ScrapeMetrics)."""
+
+        for num_redirect in xrange(self.MAX_REDIRECTS + 1):
+            status, response_headers, body = yield From(
+                self._get_with_retries(url, headers, unit))
+
+            if status not in self.REDIRECT_STATUS:
+                break
+
+            url = urljoin(url, response_headers.get("Location"))
+
+        if status >= 400 or status in self.REDIRECT_STATUS:
+            raise HttpError(url, status, "unexpected status")
+
+        raise Return((status, response_headers, body))
+
+    def close(self):
+        """Close all idle connections."""
+
+        for connections in self.connections.values():
+            for reader, writer in connections:
+                writer.close()
+        self.connections.clear()
+
+    # PRIVATE
+    @coroutine
+    def _get_with_retries(self, url, headers, unit):
+
+        rate_limiter = self._get_rate_limiter(url)
+
+        for attempt in xrange(self.retries + 1):
+
+            # wait before retrying, longer each time
+            if attempt > 0:
+                get_metrics().add("retries", 1, unit)
+                yield From(asyncio.sleep(self.backoff * 2 ** (attempt - 1)))
+
+            if rate_limiter:
+                wait = rate_limiter.get_wait()
+                while wait:
+                    yield From(asyncio.sleep(wait))
+                    wait = rate_limiter.get_wait()
+
+            try:
+                with (yield From(self.semaphore)):
+                    start = time.time()
+                    status, response_headers, body = yield From(
+                        asyncio.wait_for(self._request(url, headers, unit),
+                                         self.timeout))
+                    latency = time.time() - start
+
+            except self.transient_errors as error:
+                last_error = HttpError(url, reason=repr(error))
+                if rate_limiter:
+                    rate_limiter.record(None, error=True)
+                continue
+
+            get_metrics().add("fetch_seconds", latency, unit)
+            get_metrics().add("pages", 1, unit)
+
+            if status in self.TRANSIENT_STATUS:
+                last_error = HttpError(url, status, "server error")
+                if rate_limiter:
+                    rate_limiter.record(None, error=True)
+                continue
+
+            if rate_limiter:
+                rate_limiter.record(latency)
+
+            raise Return((status, response_headers, body))
+
+        raise last_error
+
+    def _get_rate_limiter(self, url):
+
+        if not self.rate:
+            return None
+
+        netloc = urlsplit(url).netloc
+        if netloc not in self.rate_limiters:
+            self.rate_limiters[netloc] = AdaptiveRateLimiter(
+                self.rate, max_rate=self.max_rate)
+
+        return self.rate_limiters[netloc]
+
+    @coroutine
+    def _request(self, url, headers, unit):
+        """Make a single GET request over a persistent connection."""
+
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        if query:
+            path += "?" + query
+
+        request_lines = ["GET {} HTTP/1.1".format(path or "/"),
+                         "Host: " + netloc,
+                         "User-Agent: " + self.USER_AGENT,
+                         "Accept-Encoding: gzip"]
+        request_lines.extend("{}: {}".format(name, value)
+                             for name, value in (headers or {}).items())
+        request = "\r\n".join(request_lines) + "\r\n\r\n"
+
+        reader, writer, reused = yield From(self._get_connection(scheme,
+                                                                 netloc))
+
+        try:
+            writer.write(request)
+            status_line = yield From(reader.readline())
+
+            # the server may have closed an idle connection, try a new one
+            if not status_line and reused:
+                writer.close()
+                reader, writer, reused = yield From(self._open_connection(
+                    scheme, netloc))
+                writer.write(request)
+                status_line = yield From(reader.readline())
+
+            status, response_headers, body, keep_alive = yield From(
+                self._read_response(reader, status_line))
+
+        except:
+            # a broken connection can't be reused
+            writer.close()
+            raise
+
+        if keep_alive:
+            self.connections.setdefault(netloc, []).append((reader, writer))
+        else:
+            writer.close()
+
+        # bytes downloaded, before decompressing them
+        get_metrics().add("bytes", len(body), unit)
+
+        if response_headers.getheader("Content-Encoding") == "gzip":
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+        raise Return((status, response_headers, body))
+
+    @coroutine
+    def _get_connection(self, scheme, netloc):
+        """Return an idle connection to a host, or a new one, as a (reader,
+        writer, reused) tuple."""
+
+        connections = self.connections.get(netloc)
+        if connections:
+            reader, writer = connections.pop()
+            raise Return((reader, writer, True))
+
+        connection = yield From(self._open_connection(scheme, netloc))
+        raise Return(connection)
+
+    @coroutine
+    def _open_connection(self, scheme, netloc):
+
+        host, _, port = netloc.partition(":")
+        port = int(port) if port else self.DEFAULT_PORTS[scheme]
+
+        reader, writer = yield From(asyncio.open_connection(
+            host, port, ssl=(scheme == "https")))
+
+        raise Return((reader, writer, False))
+
+    @coroutine
+    def _read_response(self, reader, status_line):
+        """Read a response, returning its status, headers, body and whether
+        the connection can be reused."""
+
+        try:
+            version, status, reason = (status_line.split(None, 2) +
+                                       [""])[:3]
+            status = int(status)
+        except ValueError:
+            raise httplib.BadStatusLine(status_line)
+
+        header_lines = []
+        while True:
+            line = yield From(reader.readline())
+            if not line:
+                raise httplib.IncompleteRead("".join(header_lines))
+            if line in ("\r\n", "\n"):
+                break
+            header_lines.append(line)
+
+        response_headers = httplib.HTTPMessage(StringIO("".join(
+            header_lines)))
+
+        keep_alive = (version == "HTTP/1.1" and
+                      (response_headers.getheader("Connection") or
+                       "").lower() != "close")
+
+        length = response_headers.getheader("Content-Length")
+        chunked = (response_headers.getheader("Transfer-Encoding") or
+                   "").lower() == "chunked"
+
+        if status in (204, 304) or 100 <= status < 200:
+            body = ""
+        elif chunked:
+            body = yield From(self._read_chunks(reader))
+        elif length is not None:
+            body = yield From(reader.readexactly(int(length)))
+        else:
+            # body ends when the server closes the connection
+            body = yield From(reader.read())
+            keep_alive = False
+
+        raise Return((status, response_headers, body, keep_alive))
+
+    @coroutine
+    def _read_chunks(self, reader):
+
+        chunks = []
+        while True:
+            size_line = yield From(reader.readline())
+            size = int(size_line.split(";")[0].strip() or "0", 16)
+
+            if size == 0:
+                # skip trailer headers
+                line = yield From(reader.readline())
+                while line not in ("\r\n", "\n", ""):
+                    line = yield From(reader.readline())
+                break
+
+            chunk = yield From(reader.readexactly(size))
+            chunks.append(chunk)
+            yield From(reader.readexactly(2))
+
+        raise Return("".join(chunks))
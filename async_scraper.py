@@ -0,0 +1,355 @@
+"""Asynchronous version of the scraper, running in a single thread.
+
+It needs trollius (asyncio for python 2). Index pages of the years missing in
+the RoadCatalogue are fetched at the same time. Then roads are scraped by
+coroutines that fetch their pages with an AsyncHttpClient (no more than
+"max_fetches" pages at the same time) and hand the html to an executor to be
+parsed. Roads are put in a queue in (year, road) order, and a writer coroutine
+takes them from it to write their records with a RoadsWriter, so the output
+is the same as the one of scrape_traffic_data.
+"""
+
+from functools import partial
+from dnv_scraper import (RoadScraper, RoadsWriter, parse_road_links,
+                         get_year_url, get_years, _iter_road_jobs)
+from road_catalogue import RoadCatalogue
+from road_records import RoadRecords
+from async_http import AsyncHttpClient, coroutine
+from metrics import get_metrics
+from utils import get_http_cache, MAX_CONNECTIONS_PER_HOST
+
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    asyncio = None
+
+# DATA
+# roads scraped at the same time, ahead of the one being written
+ROADS_WINDOW = 8
+# threads parsing pages
+PARSE_WORKERS = 2
+
+
+class AsyncPageReader():
+    """Fetch pages with an AsyncHttpClient and parse them in an executor.
+
+    Like RoadScraper, it uses its MANIFEST to skip parsing unchanged pages,
+    and its DETAILS_MEMO to read each detail page only once: a detail page
+    asked while it is being read waits for it."""
+
+    def __init__(self, client, executor):
+
+        self.client = client
+        self.executor = executor
+
+        # detail pages being read, by url
+        self.reading = {}
+
+    # PUBLIC
+    @coroutine
+    def get_html(self, url, unit):
+        """Return the body of an url, through the http cache if there is
+        one."""
+
+        http_cache = get_http_cache()
+
+        if http_cache:
+            body, request_headers = http_cache.lookup(url)
+            if body is not None:
+                raise Return(body)
+
+            status, headers, body = yield From(self.client.get(
+                url, request_headers, unit))
+            html = http_cache.store(url, status, headers, body)
+
+            # the cached body was evicted while it was being revalidated
+            if html is None:
+                status, headers, body = yield From(self.client.get(
+                    url, {}, unit))
+                html = http_cache.store(url, status, headers, body,
+                                        conditional=False)
+
+            raise Return(html)
+
+        status, headers, body = yield From(self.client.get(url, None, unit))
+        raise Return(body)
+
+    @coroutine
+    def get_page_data(self, url, parse, unit, use_manifest=True):
+        """Fetch a page and return the data parsed from it by "parse", in
+        the executor (see RoadScraper._get_page_data)."""
+
+        html = yield From(self.get_html(url, unit))
+
+        data = yield From(asyncio.get_event_loop().run_in_executor(
+            self.executor, self._parse, url, html, parse, unit,
+            use_manifest))
+
+        raise Return(data)
+
+    @coroutine
+    def get_detail_tables(self, url, unit):
+        """Return the detail tables of a link, from the memo if possible."""
+
+        memo = RoadScraper.DETAILS_MEMO
+        if not memo:
+            tables = yield From(self.get_page_data(
+                url, RoadScraper._parse_detail_tables, unit))
+            raise Return(tables)
+
+        found, tables = memo.peek(url)
+        if found:
+            raise Return(tables)
+
+        # wait for the page if other road is reading it
+        if url in self.reading:
+            memo.add_counters((1, 0))
+            tables = yield From(asyncio.shield(self.reading[url]))
+            raise Return(tables)
+
+        self.reading[url] = asyncio.async(self.get_page_data(
+            url, RoadScraper._parse_detail_tables, unit))
+        try:
+            tables = yield From(self.reading[url])
+        finally:
+            del self.reading[url]
+
+        memo.put(url, tables)
+
+        raise Return(tables)
+
+    # PRIVATE
+    @classmethod
+    def _parse(cls, url, html, parse, unit, use_manifest):
+        """Parse a page in a thread of the executor."""
+
+        def timed_parse(html):
+            with get_metrics().timer("parse_seconds", unit):
+                return parse(html)
+
+        if use_manifest and RoadScraper.MANIFEST:
+            return RoadScraper.MANIFEST.get_data(url, html, timed_parse)
+
+        return timed_parse(html)
+
+
+class AsyncRoadScraper(RoadScraper):
+    """Scraper for data of a single road, with coroutines.
+
+    It is the asynchronous counterpart of RoadScraper.scrape: pages are read
+    with an AsyncPageReader, and detail pages of all sections are read at the
+    same time.
+    """
+
+    def __init__(self, road_name, base_url, dict_rutas, reader, year):
+        RoadScraper.__init__(self, road_name, base_url, dict_rutas)
+
+        self.reader = reader
+        self.unit = (year, road_name)
+
+    # PUBLIC
+    @coroutine
+    def scrape(self):
+        """Scrape data of each section of a road.
+
+        Returns a list of (table, record) tuples, in the same order than
+        RoadScraper.iter_records."""
+
+        road_rows = yield From(self.reader.get_page_data(
+            self.base_url, self._extract_road_rows, self.unit))
+
+        simple_rows, details_sections, details_links = \
+            self._create_simple_rows(road_rows)
+
+        all_detail_tables = yield From(asyncio.gather(
+            *[self.reader.get_detail_tables(details_link, self.unit)
+              for details_link in details_links]))
+
+        records = [(self.SIMPLE_TBL, row) for row in simple_rows]
+
+        with get_metrics().timer("records_seconds", self.unit):
+            for section_code, detail_tables in zip(details_sections,
+                                                   all_detail_tables):
+                records.extend(
+                    (self.DETAILS_TBL, record) for record in
+                    self._iter_details_records(section_code, detail_tables))
+
+        raise Return(records)
+
+
+@coroutine
+def scrape_road_links_async(reader, year):
+    """Scrape road links of a year (see scrape_road_links)."""
+
+    year_url = get_year_url(year)
+
+    # index pages are not in the manifest, the order of its roads is kept
+    road_links = yield From(reader.get_page_data(
+        year_url, partial(parse_road_links, year_base_url=year_url),
+        (year, None), use_manifest=False))
+
+    raise Return(road_links)
+
+
+@coroutine
+def discover_roads_async(reader, years, catalogue):
+    """Add the years missing in a RoadCatalogue, scraping their index pages
+    at the same time (see discover_roads)."""
+
+    missing_years = catalogue.get_missing_years(years)
+    if not missing_years:
+        return
+
+    all_road_links = yield From(asyncio.gather(
+        *[scrape_road_links_async(reader, year) for year in missing_years]))
+
+    for year, road_links in zip(missing_years, all_road_links):
+        catalogue.add_year(year, road_links)
+
+    if catalogue.catalogue_path:
+        catalogue.save()
+
+
+@coroutine
+def scrape_road_async(reader, year, road, road_links):
+    """Scrape one road of one year, returning (year, road, records) with
+    its records in a RoadRecords (see scrape_road)."""
+
+    print "Taking data from road: ", road, " at year: ", year
+
+    road_scraper = AsyncRoadScraper(road, road_links[road], road_links,
+                                    reader, year)
+    records = yield From(road_scraper.scrape())
+
+    raise Return((year, road, RoadRecords(year, RoadScraper.DETAILS_TBL,
+                                          records)))
+
+
+def _replay_unit(journal, year, road):
+    """Return a future with the (year, road, records) of a journaled unit."""
+
+    future = asyncio.Future()
+    future.set_result((year, road, journal.iter_records(year, road)))
+
+    return future
+
+
+@coroutine
+def _write_roads(queue, writer, journal):
+    """Write the roads taken from a queue, until None is taken."""
+
+    while True:
+        item = yield From(queue.get())
+        if item is None:
+            break
+
+        task, spill = item
+        year, road, records = yield From(task)
+
+        if spill:
+            records = journal.record_unit(year, road, records)
+
+        writer.write_road(year, road, records)
+
+
+@coroutine
+def _put_road(queue, item, writer_task):
+    """Put a road in the queue, unless the writer failed meanwhile."""
+
+    put = asyncio.async(queue.put(item))
+    yield From(asyncio.wait([put, writer_task],
+                            return_when=asyncio.FIRST_COMPLETED))
+
+    if not put.done():
+        put.cancel()
+
+    # raise the error of the writer, if it failed
+    if writer_task.done():
+        writer_task.result()
+
+
+@coroutine
+def scrape_traffic_data_async(years=None, roads=None, excel_output=None,
+                              output_format=None, incremental=False,
+                              journal=None, wide_details_output=None,
+                              typed=False, metrics_report=False,
+                              metrics_output=None, client=None,
+                              window=ROADS_WINDOW,
+                              parse_workers=PARSE_WORKERS, catalogue=None,
+                              baseline=None, delta_output=None):
+    """Scrape traffic data from DNV website, with coroutines.
+
+    It takes the same parameters than scrape_traffic_data (but the ones of
+    processes and threads) and writes the same output. Pages are fetched
+    with "client" (an AsyncHttpClient making MAX_CONNECTIONS_PER_HOST
+    requests at the same time by default), no more than "window" roads are
+    scraped ahead of the one being written, and pages are parsed by
+    "parse_workers" threads."""
+
+    years = get_years(years)
+    catalogue = catalogue or RoadCatalogue()
+    client = client or AsyncHttpClient(MAX_CONNECTIONS_PER_HOST)
+    executor = ThreadPoolExecutor(parse_workers)
+    reader = AsyncPageReader(client, executor)
+
+    # create object where data will be stored
+    writer = RoadsWriter(excel_output, output_format, wide_details_output,
+                         typed, metrics_report, metrics_output, baseline,
+                         delta_output, roads)
+
+    skip_road = writer.traffic_data.has_road if incremental else None
+
+    queue = asyncio.Queue(maxsize=window)
+    writer_task = asyncio.async(_write_roads(queue, writer, journal))
+    tasks = []
+
+    try:
+        yield From(discover_roads_async(reader, years, catalogue))
+
+        jobs = _iter_road_jobs(catalogue, years, roads, None, skip_road)
+
+        # roads are written in the same order they are put in the queue
+        for year, road, road_links, detail_workers in jobs:
+            resumed = journal and journal.has_unit(year, road)
+
+            if resumed:
+                print "Resuming road from checkpoint: ", road, " at year: ", \
+                    year
+                task = _replay_unit(journal, year, road)
+            else:
+                task = asyncio.async(scrape_road_async(reader, year, road,
+                                                       road_links))
+
+            # keep the tasks not done yet, to cancel them if something fails
+            tasks = [pending for pending in tasks
+                     if not pending.done()] + [task]
+
+            yield From(_put_road(queue, (task, journal and not resumed),
+                                 writer_task))
+
+        yield From(_put_road(queue, None, writer_task))
+        yield From(writer_task)
+
+    finally:
+        for task in tasks + [writer_task]:
+            if not task.done():
+                task.cancel()
+
+        client.close()
+        executor.shutdown()
+
+    # save excel with all traffic data scraped
+    writer.save()
+
+
+def run_scrape_traffic_data_async(*args, **kwargs):
+    """Run scrape_traffic_data_async until it ends (it takes the same
+    parameters)."""
+
+    if not asyncio:
+        raise ImportError("trollius is needed to scrape asynchronously")
+
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(scrape_traffic_data_async(*args, **kwargs))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the xlsx output, writing made up "ver_detalle" records.
+
+Compares rows/s of the previous writer (a dict built for each record and
+written with utils.write_ws, which checks the dimensions of the sheet on
+every row) with the ExcelSink one (fields written once and records appended
+as rows in chunks), saving both workbooks.
+
+python benchmarks/bench_excel_writer.py
+python benchmarks/bench_excel_writer.py --rows 1000000
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+from collections import OrderedDict
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sinks import ExcelSink
+from traffic_data import TrafficData
+from utils import write_ws
+
+# DATA
+TABLE_NAME = TrafficData.WS_DETAILS_TBL_NAME
+
+
+def iter_records(num_rows):
+    """Generate records like the ones of the details table."""
+
+    for num_row in xrange(num_rows):
+        yield [u"0040_{}".format(num_row / 600), u"clasificacion",
+               u"Autos y Ctas.", unicode(num_row % 12), u"74,2", 2010]
+
+
+def write_with_write_ws(output, fields, num_rows):
+
+    wb = Workbook(optimized_write=True)
+    ws = wb.create_sheet(title=TABLE_NAME)
+
+    for record in iter_records(num_rows):
+        write_ws(ws, dict(zip(fields, record)), fields)
+
+    wb.save(output)
+
+
+def write_with_excel_sink(output, fields, num_rows):
+
+    sink = ExcelSink(output, OrderedDict([(TABLE_NAME, fields)]))
+
+    for record in iter_records(num_rows):
+        sink.write(TABLE_NAME, record)
+
+    sink.save()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    arg_parser.add_argument("--rows", type=int, default=200000,
+                            help="records written by each writer")
+    args = arg_parser.parse_args()
+
+    fields = TrafficData.get_details_tbl_fields()
+    writers = [("write_ws", write_with_write_ws),
+               ("ExcelSink", write_with_excel_sink)]
+
+    print "{:<12} {:>10} {:>12} {:>10}".format("writer", "seconds",
+                                                "rows/s", "speedup")
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        base_seconds = None
+        for name, write in writers:
+            start = time.time()
+            write(os.path.join(tmp_dir, name + ".xlsx"), fields, args.rows)
+            seconds = time.time() - start
+
+            base_seconds = base_seconds or seconds
+            print "{:<12} {:>10.2f} {:>12.0f} {:>9.1f}x".format(
+                name, seconds, args.rows / seconds, base_seconds / seconds)
+
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
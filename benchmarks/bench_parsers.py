@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the parsers used to extract detail tables.
+
+Times the extraction of the detail tables of each page with every parser and
+checks that all of them return the same tables. Pages are read from the html
+files passed, or a page like the DNV detail pages is used if none is passed.
+
+python benchmarks/bench_parsers.py
+python benchmarks/bench_parsers.py some_dir/html_tramos/*.html --repeat 50
+"""
+
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from dnv_scraper import RoadScraper
+from table_extractor import XPATH_PARSER
+
+# DATA
+PARSERS = ["lxml", "html.parser", XPATH_PARSER]
+
+SAMPLE_PAGE = u"""<html><head><title>Tramo 8467</title></head><body>
+<h4>Ruta</h4>
+<table><thead><tr><th>N\xba Distrito</th><th>Distrito</th>
+<th>L\xedmites del Tramo</th><th>Ini.</th><th>Fin</th><th>TMDA</th></tr>
+</thead><tbody><tr><td>23</td><td>Santa Cruz</td>
+<td>RIO TURBIO (I) - INT.R.P.7</td><td>394,43</td><td>469,54</td><td>500</td>
+</tr></tbody></table>
+<h4>Velocidad</h4>
+<table><thead><tr><th>Estimador</th><th>Liv</th><th>Otros</th></tr></thead>
+<tbody><tr><td>P85</td><td>135,6</td><td>103,8</td></tr>
+<tr><td>VM</td><td>110,4</td><td>84,7</td></tr></tbody></table>
+<h4>Clasificaci\xf3n</h4>
+<table><thead><tr><th>A\xf1o</th><th>Mes</th><th>Horas</th>
+<th>Autos y Ctas.</th><th>Bus</th><th>S/A</th><th>C/A</th><th>Semi</th>
+<th>TMD</th><th>Cant. Puestos</th></tr></thead><tbody>
+""" + u"".join(u"<tr><td>2010</td><td>{}</td><td>48</td><td>74,2</td>"
+               u"<td>4,2</td><td>8,4</td><td>2,3</td><td>10,9</td>"
+               u"<td>436</td><td>1</td></tr>\n".format(month)
+               for month in xrange(1, 13)) + u"""</tbody></table>
+</body></html>"""
+
+
+def read_pages(paths):
+    if not paths:
+        return [SAMPLE_PAGE.encode("utf-8")]
+
+    pages = []
+    for path in paths:
+        with open(path, "rb") as f:
+            pages.append(f.read())
+
+    return pages
+
+
+def parse_pages(parser, pages):
+    RoadScraper.PARSER = parser
+    return [RoadScraper._parse_detail_tables(html) for html in pages]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    arg_parser.add_argument("pages", nargs="*", help="html files to parse")
+    arg_parser.add_argument("--repeat", type=int, default=200,
+                            help="times each page is parsed")
+    args = arg_parser.parse_args()
+
+    pages = read_pages(args.pages)
+    expected = parse_pages(PARSERS[0], pages)
+
+    print "{:<12} {:>12} {:>10}".format("parser", "ms/page", "speedup")
+
+    base_time = None
+    for parser in PARSERS:
+
+        # all parsers must return the same tables
+        assert parse_pages(parser, pages) == expected, parser
+
+        seconds = timeit.timeit(lambda: parse_pages(parser, pages),
+                                number=args.repeat)
+        ms_per_page = seconds * 1000 / (args.repeat * len(pages))
+
+        base_time = base_time or ms_per_page
+        print "{:<12} {:>12.3f} {:>9.1f}x".format(parser, ms_per_page,
+                                                   base_time / ms_per_page)
+
+
+if __name__ == '__main__':
+    main()
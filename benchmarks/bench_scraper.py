@@ -0,0 +1,214 @@
+"""Offline benchmark of each stage of the scraper.
+
+Serves a corpus of DNV pages from a local server (see fixtures.py and
+fixture_server.py) and times separately:
+
+    scrape_road_links            year index pages
+    RoadScraper.scrape           whole roads (road page, detail pages, records)
+    _extract_detail_tables       detail pages, fetched and parsed one by one
+    _create_details_tbl          detail tables exploded into records
+    TrafficData write and save   all records written to the output
+
+reporting pages/s, records/s and the peak RSS of the process after each one,
+and the hits of the memo of detail pages shared by many roads. If no corpus
+is passed, a made up one is built in a temporary directory (with detail
+pages shared by consecutive roads, so the memo must get hits).
+
+python benchmarks/bench_scraper.py
+python benchmarks/bench_scraper.py --corpus some_dir --latency 0.05 \\
+    --detail-workers 8 --parser xpath --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+import argparse
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import dnv_scraper
+from dnv_scraper import RoadScraper, scrape_road_links, write_records
+from traffic_data import TrafficData
+from fixtures import build_corpus
+from fixture_server import FixtureServer
+
+
+class StageTimer():
+    """Time a stage and count the pages, bytes and records it processed."""
+
+    def __init__(self, name, server):
+        self.name = name
+        self.server = server
+        self.records = 0
+
+    def __enter__(self):
+        self.server.reset_counters()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.time() - self.start
+        self.pages = self.server.requests
+        self.bytes = self.server.bytes
+        self.peak_rss_mb = get_peak_rss_mb()
+
+    def get_results(self):
+        seconds = self.seconds or float("nan")
+        return OrderedDict([("stage", self.name),
+                            ("seconds", self.seconds),
+                            ("pages", self.pages),
+                            ("pages_s", self.pages / seconds),
+                            ("kbytes", self.bytes / 1024.0),
+                            ("records", self.records),
+                            ("records_s", self.records / seconds),
+                            ("peak_rss_mb", self.peak_rss_mb)])
+
+
+def get_peak_rss_mb():
+    """Return peak resident memory of the process (ru_maxrss is in KB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_benchmark(server, years, output, detail_workers=1):
+    stages = []
+
+    # year index pages
+    with StageTimer("scrape_road_links", server) as stage:
+        links_by_year = OrderedDict()
+        for year in years:
+            links_by_year[year] = scrape_road_links(
+                dnv_scraper.base_url_part1 + str(year) +
+                dnv_scraper.base_url_part2)
+    stages.append(stage)
+
+    # whole roads, sharing detail pages through the memo
+    if RoadScraper.DETAILS_MEMO:
+        RoadScraper.DETAILS_MEMO.clear()
+
+    scrapers = []
+    with StageTimer("RoadScraper.scrape", server) as stage:
+        for year, road_links in links_by_year.items():
+            for road in sorted(road_links):
+                scraper = RoadScraper(road, road_links[road], road_links,
+                                      detail_workers)
+                scraper.scrape()
+                scrapers.append((year, scraper))
+
+                stage.records += (len(scraper.simple_tbl) +
+                                  len(scraper.details_tbl))
+    stages.append(stage)
+
+    # detail pages, one by one
+    tables_by_scraper = []
+    with StageTimer("_extract_detail_tables", server) as stage:
+        for year, scraper in scrapers:
+            all_detail_tables = OrderedDict()
+            for row in scraper.simple_tbl:
+                if row[-1]:
+                    all_detail_tables[row[0]] = \
+                        scraper._extract_detail_tables(row[-1])
+            tables_by_scraper.append((scraper, all_detail_tables))
+    stages.append(stage)
+
+    # records from detail tables
+    with StageTimer("_create_details_tbl", server) as stage:
+        for scraper, all_detail_tables in tables_by_scraper:
+            scraper.details_tbl = []
+            scraper._create_details_tbl(all_detail_tables)
+            stage.records += len(scraper.details_tbl)
+    stages.append(stage)
+
+    # output
+    with StageTimer("TrafficData.save", server) as stage:
+        traffic_data = TrafficData(output)
+        for year, scraper in scrapers:
+            records = [(RoadScraper.SIMPLE_TBL, record + [year])
+                       for record in scraper.get_simple_records()]
+            records.extend((RoadScraper.DETAILS_TBL, record + [year])
+                           for record in scraper.get_details_records())
+
+            write_records(traffic_data, records)
+            stage.records += len(records)
+
+        traffic_data.save(output)
+    stages.append(stage)
+
+    return [stage.get_results() for stage in stages]
+
+
+def print_results(results):
+    print "{:<24} {:>9} {:>7} {:>9} {:>11} {:>11} {:>8}".format(
+        "stage", "seconds", "pages", "pages/s", "records", "records/s",
+        "rss MB")
+
+    for result in results:
+        print "{stage:<24} {seconds:>9.3f} {pages:>7} {pages_s:>9.1f} " \
+            "{records:>11} {records_s:>11.0f} {peak_rss_mb:>8.1f}".format(
+                **result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--corpus", default=None,
+                        help="corpus directory (a made up one by default)")
+    parser.add_argument("--years", default="2010",
+                        help="years separated by commas")
+    parser.add_argument("--roads", type=int, default=10,
+                        help="roads of the made up corpus")
+    parser.add_argument("--sections", type=int, default=40,
+                        help="sections of each road of the made up corpus")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the server waits before answering")
+    parser.add_argument("--detail-workers", type=int, default=1)
+    parser.add_argument("--parser", default=RoadScraper.PARSER)
+    parser.add_argument("--format", dest="output_format", default="xlsx",
+                        choices=TrafficData.SINKS.keys())
+    parser.add_argument("--json", default=None,
+                        help="also write results to this json file")
+    args = parser.parse_args()
+
+    years = args.years.split(",")
+    tmp_dir = tempfile.mkdtemp()
+
+    try:
+        corpus_dir = args.corpus
+        if not corpus_dir:
+            corpus_dir = os.path.join(tmp_dir, "corpus")
+            build_corpus(corpus_dir, years, args.roads, args.sections)
+
+        server = FixtureServer(corpus_dir, args.latency).start()
+        dnv_scraper.base_url_part1 = (server.get_base_url() +
+                                      "SelCE_WEB/tmda_libro_web_")
+        RoadScraper.PARSER = args.parser
+
+        output = os.path.join(tmp_dir, "bench" + TrafficData.SINKS[
+            args.output_format].EXTENSION)
+        results = run_benchmark(server, years, output, args.detail_workers)
+        server.stop()
+
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print_results(results)
+
+    memo = RoadScraper.DETAILS_MEMO
+    print "Detail pages memo:", memo.hits, "hits,", memo.misses, "misses"
+
+    # pages shared by roads of the made up corpus must be fetched once
+    if not args.corpus:
+        assert memo.hits > 0, "no detail page was taken from the memo"
+
+    if args.json:
+        with open(args.json, "wb") as f:
+            json.dump({"args": vars(args), "results": results,
+                       "memo": {"hits": memo.hits, "misses": memo.misses}},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
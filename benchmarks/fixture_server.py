@@ -0,0 +1,142 @@
+"""Local http server replaying a corpus of DNV pages.
+
+It serves the files of a corpus directory (see fixtures.py) with keep-alive
+connections, waiting "latency" seconds before answering each request to
+simulate the DNV server, and counts requests and bytes served.
+
+python benchmarks/fixture_server.py some_dir --port 8080 --latency 0.05
+"""
+
+import os
+import time
+import socket
+import argparse
+import threading
+import BaseHTTPServer
+import SocketServer
+
+
+class FixtureRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    # buffer the response, written headers one by one would be delayed by
+    # Nagle's algorithm on keep-alive connections
+    wbufsize = -1
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+
+        path = os.path.join(server.corpus_dir,
+                            *self.path.split("?")[0].split("/"))
+
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        with open(path, "rb") as f:
+            body = f.read()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        server.count_request(len(body))
+
+    # the scraper used to send POST requests, answer them as well
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded http server of a corpus, running in a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, corpus_dir, latency=0.0, port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", port),
+                                           FixtureRequestHandler)
+
+        self.corpus_dir = corpus_dir
+        self.latency = latency
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+
+        # open connections, closed when the server stops
+        self.connections = set()
+
+    # PUBLIC
+    def handle_error(self, request, client_address):
+        """Clients closing keep-alive connections are not an error."""
+        pass
+
+    def get_base_url(self):
+        return "http://127.0.0.1:{}/".format(self.server_address[1])
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+
+        # close keep-alive connections so their threads end now
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+        self.server_close()
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections.add(request)
+
+        SocketServer.ThreadingMixIn.process_request(self, request,
+                                                    client_address)
+
+    def shutdown_request(self, request):
+        with self.lock:
+            self.connections.discard(request)
+
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+    def count_request(self, num_bytes):
+        with self.lock:
+            self.requests += 1
+            self.bytes += num_bytes
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = 0
+            self.bytes = 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("corpus_dir")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds to wait before answering each request")
+    args = parser.parse_args()
+
+    server = FixtureServer(args.corpus_dir, args.latency, args.port)
+    print "Serving", args.corpus_dir, "at", server.get_base_url()
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
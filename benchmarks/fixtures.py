@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Corpus of DNV pages to run the scraper offline.
+
+A corpus is a directory with the same paths than the DNV site, like
+"SelCE_WEB/tmda_libro_web_2010/html_tramos/8467.html". It can be recorded
+from the live site with "record_corpus", or built with "build_corpus", which
+writes pages with the same structure than the DNV ones and made up (but
+deterministic) data, so benchmarks can run without network access.
+
+python benchmarks/fixtures.py record some_dir --years 2010 --roads 0040,0003
+python benchmarks/fixtures.py build some_dir --years 2010,2011 --roads 20
+"""
+
+import os
+import sys
+import random
+import argparse
+from urlparse import urlparse, urljoin
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import dnv_scraper
+from dnv_scraper import RoadScraper, scrape_road_links
+from utils import fetch_from_static_site
+
+# DATA
+ENCODING = "iso-8859-1"
+SITE_DIR = "SelCE_WEB"
+
+# sections at the start of each built road sharing the detail pages of the
+# last sections of the previous road
+SHARED_SECTIONS = 2
+
+PAGE = u"""<html><head>
+<meta http-equiv="Content-Type" content="text/html; charset={}">
+<title>{{}}</title></head><body>
+{{}}
+</body></html>""".format(ENCODING)
+
+DETAIL_TABLES = [
+    (u"Ruta", [u"N\xba Distrito", u"Distrito", u"L\xedmites del Tramo",
+               u"Ini.", u"Fin", u"TMDA"]),
+    (u"Velocidad", [u"Estimador", u"Liv", u"Otros"]),
+    (u"Clasificaci\xf3n", [u"A\xf1o", u"Mes", u"Horas", u"Autos y Ctas.",
+                           u"Bus", u"S/A", u"C/A", u"Semi", u"TMD",
+                           u"Cant. Puestos"])]
+
+
+# METHODS
+def get_corpus_path(corpus_dir, url):
+    """Return the path of the page of an url inside a corpus."""
+    return os.path.join(corpus_dir, *urlparse(url).path.split("/"))
+
+
+def _write_page(path, html):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    with open(path, "wb") as f:
+        f.write(html)
+
+
+def record_corpus(corpus_dir, years, roads=None):
+    """Download the pages of some roads and years from the live site."""
+
+    for year in years:
+        year_url = (dnv_scraper.base_url_part1 + str(year) +
+                    dnv_scraper.base_url_part2)
+        _write_page(get_corpus_path(corpus_dir, year_url),
+                    fetch_from_static_site(year_url)[2])
+
+        road_links = scrape_road_links(year_url)
+        for road in roads or road_links.keys():
+            html_road = fetch_from_static_site(road_links[road])[2]
+            _write_page(get_corpus_path(corpus_dir, road_links[road]),
+                        html_road)
+
+            for texts, link_part in RoadScraper(
+                    road, road_links[road], road_links)._extract_road_rows(
+                        html_road):
+                if link_part is not None:
+                    link = urljoin(road_links[road], link_part)
+                    _write_page(get_corpus_path(corpus_dir, link),
+                                fetch_from_static_site(link)[2])
+
+
+def _format_number(number, decimals=2):
+    text = u"{:.{}f}".format(number, decimals).replace(".", ",")
+    return text.rstrip(u"0").rstrip(u",") if decimals else text
+
+
+def _build_table(title, headers, rows):
+    return u"<h4>{}</h4>\n<table><thead><tr>{}</tr></thead><tbody>{}" \
+        u"</tbody></table>".format(
+            title, u"".join(u"<th>{}</th>".format(header)
+                            for header in headers),
+            u"".join(u"<tr>{}</tr>".format(
+                u"".join(u"<td>{}</td>".format(cell) for cell in row))
+                for row in rows))
+
+
+def _build_detail_page(rand, year, section, ini, fin, tmda):
+    ruta = [[u"23", u"Santa Cruz", u"TRAMO {}".format(section),
+             _format_number(ini), _format_number(fin), tmda]]
+    velocidad = [[u"P85", _format_number(rand.uniform(90, 140), 1),
+                  _format_number(rand.uniform(60, 110), 1)],
+                 [u"VM", _format_number(rand.uniform(80, 120), 1),
+                  _format_number(rand.uniform(50, 90), 1)]]
+    clasificacion = [[unicode(year), unicode(month), u"48"] +
+                     [_format_number(rand.uniform(0, 80), 1)
+                      for vehicle in xrange(5)] +
+                     [u"{:,}".format(rand.randint(100, 9000)).replace(
+                         ",", "."), u"1"]
+                     for month in xrange(1, 13, 3)]
+
+    tables = [_build_table(title, headers, rows) for (title, headers), rows
+              in zip(DETAIL_TABLES, [ruta, velocidad, clasificacion])]
+
+    return PAGE.format(u"Tramo {}".format(section), u"\n".join(tables))
+
+
+def build_corpus(corpus_dir, years, num_roads=10, num_sections=40,
+                 details_ratio=0.5, seed=0):
+    """Build a corpus of pages like the DNV ones, with made up data.
+
+    Each year has "num_roads" roads of "num_sections" sections, and about
+    "details_ratio" of the sections have a detail page. The first
+    SHARED_SECTIONS sections of each road link the detail pages of the last
+    ones of the previous road, like concurrent sections of the real site."""
+
+    rand = random.Random(seed)
+    shared_sections = min(SHARED_SECTIONS, num_sections / 2)
+    roads = [u"{:04d}".format(num_road * 3 + 1)
+             for num_road in xrange(num_roads)]
+
+    for year in years:
+        year_dir = os.path.join(corpus_dir, SITE_DIR,
+                                "tmda_libro_web_{}".format(year))
+
+        index_rows = u"\n".join(
+            u'<tr><td class="FILA"><a href="html_rutas/{0}.html">{0}</a>'
+            u'</td></tr>'.format(road) for road in roads)
+        _write_page(os.path.join(year_dir, "index.html"), PAGE.format(
+            u"TMDA {}".format(year), u"<table>{}</table>".format(
+                index_rows)).encode(ENCODING))
+
+        for num_road, road in enumerate(roads):
+            rows = []
+            fin = 0.0
+            for num_section in xrange(num_sections):
+                ini, fin = fin, fin + rand.uniform(2, 80)
+                tmda = unicode(rand.randint(100, 9000))
+
+                shared_with_previous = (num_road > 0 and
+                                        num_section < shared_sections)
+                shared_with_next = (num_road < num_roads - 1 and
+                                    num_section >= num_sections -
+                                    shared_sections)
+
+                details = u""
+                if (shared_with_previous or shared_with_next or
+                        rand.random() < details_ratio):
+                    section = 1000 * (num_road + 1) + num_section
+
+                    # the page of a last section of the previous road
+                    if shared_with_previous:
+                        section = (1000 * num_road + num_sections -
+                                   shared_sections + num_section)
+                    else:
+                        _write_page(
+                            os.path.join(year_dir, "html_tramos",
+                                         "{}.html".format(section)),
+                            _build_detail_page(rand, year, section, ini, fin,
+                                               tmda).encode(ENCODING))
+
+                    details = u'<a href="../html_tramos/{}.html">' \
+                        u'ver detalle</a>'.format(section)
+
+                cells = [u"23", u"Santa Cruz",
+                         u"ACC.A R\xcdO {} - EMP.R.N.{}".format(num_section,
+                                                              road),
+                         _format_number(ini), _format_number(fin), tmda,
+                         details, u"Cobertura"]
+                rows.append(u"<tr>{}</tr>".format(u"".join(
+                    u'<td class="FILA">{}</td>'.format(cell)
+                    for cell in cells)))
+
+            _write_page(os.path.join(year_dir, "html_rutas",
+                                     "{}.html".format(road)),
+                        PAGE.format(u"Ruta {}".format(road),
+                                    u"<table>{}</table>".format(
+                                        u"\n".join(rows))).encode(ENCODING))
+
+    return roads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("action", choices=["record", "build"])
+    parser.add_argument("corpus_dir")
+    parser.add_argument("--years", default="2010",
+                        help="years separated by commas")
+    parser.add_argument("--roads", default=None,
+                        help="roads to record separated by commas, or "
+                        "number of roads to build")
+    args = parser.parse_args()
+
+    years = args.years.split(",")
+
+    if args.action == "record":
+        roads = args.roads.split(",") if args.roads else None
+        record_corpus(args.corpus_dir, years, roads)
+    else:
+        build_corpus(args.corpus_dir, years, int(args.roads or 10))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import gzip
+import json
+import os
+
+
+class CheckpointJournal():
+    """Journal of the (year, road) units completely scraped in a run.
+
+    Records of each unit are spilled to a gzipped file of json lines in the
+    journal directory while they are written, and the unit is appended to the
+    JOURNAL_NAME file once all its records are safely on disk. A run resumed
+    from the journal can replay the records of completed units instead of
+    scraping them again.
+    """
+
+    # DATA
+    JOURNAL_NAME = "journal.jsonl"
+    SPILL_EXT = ".jsonl.gz"
+
+    def __init__(self, journal_dir, resume=False):
+
+        self.journal_dir = journal_dir
+        self.journal_path = os.path.join(self.journal_dir, self.JOURNAL_NAME)
+
+        if not os.path.isdir(self.journal_dir):
+            os.makedirs(self.journal_dir)
+
+        # start a new journal, unless resuming the previous one
+        if not resume:
+            self.clear()
+
+        self.units = self._load_units()
+
+    # PUBLIC
+    def has_unit(self, year, road):
+        """Return True if a unit was completed in the journaled run."""
+        return self._get_key(year, road) in self.units
+
+    def iter_records(self, year, road):
+        """Generate (table, record) tuples spilled for a completed unit."""
+
+        with gzip.open(self._get_spill_path(year, road), "rb") as f:
+            for line in f:
+                table, record = json.loads(line)
+                yield table, record
+
+    def record_unit(self, year, road, records):
+        """Spill (table, record) tuples of a unit while generating them.
+
+        The unit is journaled as completed once all records were generated."""
+
+        spill_path = self._get_spill_path(year, road)
+        tmp_path = spill_path + ".tmp"
+
+        with gzip.open(tmp_path, "wb") as f:
+            for table, record in records:
+                f.write(json.dumps([table, record]) + "\n")
+                yield table, record
+
+        os.rename(tmp_path, spill_path)
+        self._append_unit(year, road)
+
+    def clear(self):
+        """Remove the journal and all spilled records."""
+
+        for name in os.listdir(self.journal_dir):
+            if (name == self.JOURNAL_NAME or self.SPILL_EXT in name):
+                os.remove(os.path.join(self.journal_dir, name))
+
+        self.units = set()
+
+    # PRIVATE
+    @classmethod
+    def _get_key(cls, year, road):
+        return u"{}_{}".format(year, road)
+
+    def _get_spill_path(self, year, road):
+        return os.path.join(self.journal_dir,
+                            self._get_key(year, road) + self.SPILL_EXT)
+
+    def _load_units(self):
+        units = set()
+
+        if os.path.isfile(self.journal_path):
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+
+                    # a line may be half written if the run was killed
+                    try:
+                        unit = json.loads(line)
+                    except ValueError:
+                        continue
+
+                    units.add(self._get_key(unit["year"], unit["road"]))
+
+        return units
+
+    def _append_unit(self, year, road):
+
+        with open(self.journal_path, "ab") as f:
+            f.write(json.dumps({"year": year, "road": road}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.units.add(self._get_key(year, road))
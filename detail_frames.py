@@ -0,0 +1,353 @@
+"""Detail tables of many sections kept as columnar frames.
+
+Details records of each batch (usually a road) are regrouped into the detail
+tables they were made from ("ruta", "velocidad", "clasificacion"), and the
+tables of a batch are put in a wide frame for each detail table, with one
+row for each row of the original tables and one column for each variable.
+Wide frames are spilled to temporary files as soon as they are built, so
+only one batch is kept in memory, and written to the wide output at the end.
+Numeric columns are parsed from the argentinian format ("394,43") with
+vectorized operations, once for each column of each batch.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+from collections import OrderedDict
+from openpyxl import Workbook
+from traffic_data import TrafficData
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class DetailFrames():
+    """Build wide tables from the detail tables of details records, one
+    batch at a time.
+
+    Columns of a table are the variables of all its batches, in the order
+    they were found. A column is numeric if all its values not empty are
+    numbers in all batches, and integer if they are all integers and none is
+    empty (see get_numeric_kind).
+
+    A variable found twice in the headers of a table gets a column for each
+    time, the second one named "<variable>_2" and so on.
+    """
+
+    # DATA
+    FIELDS = TrafficData.FIELDS_DETAILS_TBL
+    ROW_FIELDS = ["Anio", "id_tramo", "fila"]
+    EMPTY, INTEGER, DECIMAL, TEXT = "empty", "integer", "decimal", "text"
+
+    def __init__(self):
+
+        if not pd:
+            raise ImportError("pandas is needed to build detail frames")
+
+        # spilled frames and kind of each variable, of each table
+        self.spill_dir = tempfile.mkdtemp(prefix="detail_frames_")
+        self.variables = OrderedDict()
+
+    # PUBLIC
+    def add_records(self, records):
+        """Add a batch of details records, in TrafficData fields order."""
+
+        # columns and rows of each table of the batch
+        batch = OrderedDict()
+
+        for year, id_section, id_table, variables, rows in \
+                _iter_section_tables(records):
+            columns, wide_rows = batch.setdefault(id_table, (OrderedDict(),
+                                                             []))
+
+            positions = [columns.setdefault(column, len(columns))
+                         for column in _get_column_names(variables)]
+
+            for num_row, values in rows:
+                wide_row = [None] * len(columns)
+                for position, value in zip(positions, values):
+                    wide_row[position] = value
+                wide_rows.append([year, id_section, num_row] + wide_row)
+
+        # rows of the first tables lack the columns found after them
+        for id_table, (columns, wide_rows) in batch.iteritems():
+            width = len(self.ROW_FIELDS) + len(columns)
+            wide = pd.DataFrame.from_records(
+                [row + [None] * (width - len(row)) for row in wide_rows],
+                columns=self.ROW_FIELDS + columns.keys())
+            self._add_kinds(id_table, wide)
+
+            with open(self._get_spill_path(id_table), "ab") as f:
+                pickle.dump(wide, f, 2)
+
+    def collect(self, records, details_table):
+        """Generate (table, record) tuples of a road while collecting the
+        records of "details_table", added as a batch once the road ends."""
+
+        details_records = []
+        for table, record in records:
+            if table == details_table:
+                details_records.append(record)
+            yield table, record
+
+        self.add_records(details_records)
+
+    def iter_wide(self, id_table, typed=True):
+        """Generate the wide frames of a table, one for each batch, with
+        all the columns of the table. If "typed", numeric columns are parsed
+        into numbers."""
+
+        kinds = self.variables[id_table]
+
+        with open(self._get_spill_path(id_table), "rb") as f:
+            while True:
+                try:
+                    wide = pickle.load(f)
+                except EOFError:
+                    return
+
+                wide = wide.reindex(columns=self.ROW_FIELDS + kinds.keys())
+
+                if typed:
+                    for variable, kind in kinds.items():
+                        if kind == self.INTEGER:
+                            wide[variable] = _to_numbers(
+                                wide[variable]).astype("int64")
+                        elif kind == self.DECIMAL:
+                            wide[variable] = _to_numbers(
+                                wide[variable]).astype("float64")
+
+                wide.columns = [unicode(column) for column in wide.columns]
+                yield wide
+
+    def save_wide(self, output, typed=True):
+        """Save wide frames of each detail table, and remove the spilled
+        ones.
+
+        An xlsx output gets a sheet for each table, while csv and parquet
+        outputs get a file for each table named after the output and the
+        table ("details_ruta.csv" for the output "details.csv")."""
+
+        base, extension = os.path.splitext(output)
+
+        try:
+            if extension == ".xlsx":
+                self._save_excel(output, typed)
+                return
+
+            for id_table in self.variables:
+                path = u"{}_{}{}".format(base, id_table, extension)
+
+                if extension == ".parquet":
+                    self._save_parquet(path, id_table, typed)
+                else:
+                    self._save_csv(path, id_table, typed)
+
+        finally:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    @classmethod
+    def get_numeric_kind(cls, column):
+        """Return the kind of a column of texts in argentinian format
+        ("1.234,5"): EMPTY, INTEGER, DECIMAL (numbers, with decimals or
+        empty values) or TEXT."""
+
+        text = column.str.strip()
+        numbers = _to_numbers(column)
+
+        not_empty = text.notnull() & (text != "")
+        if not not_empty.any():
+            return cls.EMPTY
+        if numbers[not_empty].isnull().any():
+            return cls.TEXT
+
+        if numbers.notnull().all() and (numbers == numbers.round()).all():
+            return cls.INTEGER
+
+        return cls.DECIMAL
+
+    # PRIVATE
+    def _add_kinds(self, id_table, wide):
+        """Merge the kinds of the columns of a batch into the ones of its
+        table (a variable missing in a batch has empty values there)."""
+
+        first_batch = id_table not in self.variables
+        kinds = self.variables.setdefault(id_table, OrderedDict())
+
+        batch_kinds = OrderedDict(
+            (variable, self.get_numeric_kind(wide[variable]))
+            for variable in wide.columns[len(self.ROW_FIELDS):])
+
+        for variable in kinds.keys() + batch_kinds.keys():
+            kind = kinds.get(variable, None if first_batch else self.EMPTY)
+            kinds[variable] = self._merge_kinds(
+                kind, batch_kinds.get(variable, self.EMPTY))
+
+    @classmethod
+    def _merge_kinds(cls, kind, other):
+
+        kinds = set([kind, other]) - set([None])
+        for merged in (cls.TEXT, cls.DECIMAL):
+            if merged in kinds:
+                return merged
+
+        # integers of a batch with empty values of other one
+        if kinds == set([cls.INTEGER, cls.EMPTY]):
+            return cls.DECIMAL
+
+        return kinds.pop()
+
+    def _get_spill_path(self, id_table):
+        return os.path.join(self.spill_dir, u"{}.pickle".format(id_table))
+
+    def _save_excel(self, output, typed):
+
+        wb = Workbook(optimized_write=True)
+        for id_table in sorted(self.variables):
+            ws = wb.create_sheet(title=id_table)
+            ws.append(self.ROW_FIELDS + self.variables[id_table].keys())
+
+            for wide in self.iter_wide(id_table, typed):
+
+                # empty cells are written as empty
+                wide = wide.astype(object).where(wide.notnull(), None)
+                for row in wide.itertuples(index=False):
+                    ws.append(list(row))
+
+        wb.save(output)
+
+    def _save_csv(self, path, id_table, typed):
+
+        mode, header = "w", True
+        for wide in self.iter_wide(id_table, typed):
+            wide.to_csv(path, mode=mode, header=header, index=False,
+                        encoding="utf-8")
+            mode, header = "a", False
+
+    def _save_parquet(self, path, id_table, typed):
+
+        if not pyarrow:
+            raise ImportError("pyarrow is needed to write parquet files")
+
+        # all batches are written with the same schema
+        types = [pyarrow.int64(), pyarrow.string(), pyarrow.int64()]
+        for kind in self.variables[id_table].values():
+            if typed and kind == self.INTEGER:
+                types.append(pyarrow.int64())
+            elif typed and kind == self.DECIMAL:
+                types.append(pyarrow.float64())
+            else:
+                types.append(pyarrow.string())
+
+        writer = None
+        for wide in self.iter_wide(id_table, typed):
+            wide["Anio"] = pd.to_numeric(wide["Anio"])
+            wide["fila"] = pd.to_numeric(wide["fila"])
+
+            if not writer:
+                schema = pyarrow.schema([
+                    pyarrow.field(column, column_type) for column, column_type
+                    in zip(wide.columns, types)])
+                writer = pyarrow.parquet.ParquetWriter(path, schema)
+
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(wide[column], type=column_type,
+                               from_pandas=True)
+                 for column, column_type in zip(wide.columns, types)],
+                schema=schema))
+
+        if writer:
+            writer.close()
+
+
+def parse_numeric_column(column):
+    """Parse a column of texts in argentinian format ("1.234,5") into
+    numbers, if all its values not empty are numbers.
+
+    Columns with only integer numbers and no empty values are returned as
+    integers. Other columns are returned as they are."""
+
+    kind = DetailFrames.get_numeric_kind(column)
+
+    if kind == DetailFrames.INTEGER:
+        return _to_numbers(column).astype("int64")
+    if kind == DetailFrames.DECIMAL:
+        return _to_numbers(column)
+
+    return column
+
+
+def _iter_section_tables(records):
+    """Generate the detail tables details records were made from, as
+    (year, id_tramo, id_tabla, variables, rows) tuples where rows are
+    (fila, values) pairs.
+
+    Records of a table of a section come one after other, row by row and
+    in the order of its headers (see RoadScraper._iter_details_records), so
+    a table is rebuilt by the position of each record in its row."""
+
+    fields = DetailFrames.FIELDS
+    table_fields = [fields.index(field)
+                    for field in ("Anio", "id_tramo", "id_tabla")]
+    variable_field = fields.index("variable")
+    row_field = fields.index("fila")
+    value_field = fields.index("valor")
+
+    table_key, variables, rows = None, None, None
+
+    for record in records:
+        key = tuple(record[field] for field in table_fields)
+        if key != table_key:
+            if table_key:
+                yield table_key + (variables, rows)
+            table_key, variables, rows = key, [], []
+
+        num_row = record[row_field]
+        if not rows or rows[-1][0] != num_row:
+            rows.append((num_row, []))
+
+        values = rows[-1][1]
+        if len(values) == len(variables):
+            variables.append(record[variable_field])
+        values.append(record[value_field])
+
+    if table_key:
+        yield table_key + (variables, rows)
+
+
+def _get_column_names(variables):
+    """Return the column name of each variable of a table, adding "_2",
+    "_3"... to the ones repeated."""
+
+    names = []
+    for variable in variables:
+        name, count = variable, 1
+        while name in names or (count > 1 and name in variables):
+            count += 1
+            name = u"{}_{}".format(variable, count)
+        names.append(name)
+
+    return names
+
+
+def _to_numbers(column):
+    """Parse a column of texts in argentinian format into floats (NaN for
+    the ones that are not numbers)."""
+
+    # variables missing in a batch are reindexed as empty float columns
+    if column.dtype != object:
+        return pd.to_numeric(column, errors="coerce")
+
+    return pd.to_numeric(column.str.strip()
+                         .str.replace(".", "", regex=False)
+                         .str.replace(",", ".", regex=False),
+                         errors="coerce")
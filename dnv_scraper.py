@@ -2,13 +2,37 @@
 from bs4 import BeautifulSoup
 from urlparse import urljoin
 from utils import (get_bs_from_static_site, extract_key_value_pairs_from_bs,
-                   remove_accents)
+                   get_html_from_static_site, remove_accents,
+                   set_max_connections_per_host, MAX_CONNECTIONS_PER_HOST,
+                   set_http_cache, set_http_session, imap_bounded)
+from http_cache import HttpCache
+from checkpoint import CheckpointJournal
+from page_manifest import PageManifest
+from road_catalogue import RoadCatalogue
+from road_records import RoadRecords
+from work_queue import WorkQueue
+from lru_memo import LruMemo
+from metrics import get_metrics
+from detail_frames import DetailFrames
+from typed_records import RecordTyper
+from http_session import HttpSession
+from rate_limiter import AdaptiveRateLimiter
+from table_extractor import (XPATH_PARSER, extract_road_rows,
+                             extract_detail_tables)
 from pprint import pprint
 from traffic_data import TrafficData
+from output_diff import write_delta
+from multiprocessing.dummy import Pool as ThreadPool
+import multiprocessing
+import threading
 import argparse
+import cProfile
+import pstats
+import time
 import sys
 import datetime
-from collections import OrderedDict
+import os
+from collections import OrderedDict, deque
 
 PARSER = "lxml"
 
@@ -25,18 +49,41 @@ class RoadScraper():
     "details_tbl" as a list of records.
 
     RoadScraper provide methods to iterate through "simple" and "detail"
-    records, once a road has been scraped.
+    records, once a road has been scraped. Records can also be streamed with
+    "iter_records" while the road is being scraped, without keeping them.
+
+    Detail links are fetched by a pool of "workers" threads (just one by
+    default, which means sequential fetching). Pools are created once per
+    process and shared by all scrapers, so roads reuse the same threads and
+    the keep-alive connections of the http session.
+
+    PARSER is the parser used by BeautifulSoup to read pages, or XPATH_PARSER
+    to extract tables with lxml XPath queries instead (much faster).
+
+    If a PageManifest is set in MANIFEST, pages with the same body than the
+    last time they were parsed are not parsed again (see PageManifest).
+
+    Detail pages are shared by concurrent sections of many roads, so their
+    tables are kept by url in DETAILS_MEMO (a LruMemo shared by all the
+    scrapers of a process) and each page is fetched and parsed only once.
     """
 
     # DATA
     PARSER = "lxml"
+    MANIFEST = None
+    DETAILS_MEMO = LruMemo()
+    DETAILS_POOLS = {}
+    DETAILS_POOLS_LOCK = threading.Lock()
+    SIMPLE_TBL = "simple_tbl"
+    DETAILS_TBL = "details_tbl"
 
-    def __init__(self, road_name, base_url, dict_rutas):
+    def __init__(self, road_name, base_url, dict_rutas, workers=1):
 
         # scrape parameters
         self.road_name = road_name
         self.base_url = base_url
         self.dict_rutas = dict_rutas
+        self.workers = workers
 
         # results
         self.tabla_ruta_ver_detalle_dict = {}
@@ -59,13 +106,142 @@ class RoadScraper():
         into records.
         """
 
-        # parse base_url into a beautiful soup
-        bs_road = get_bs_from_static_site(self.base_url, self.PARSER)
+        for table, record in self.iter_records():
+            if table == self.SIMPLE_TBL:
+                self.simple_tbl.append(record)
+            else:
+                self.details_tbl.append(record)
+
+    def iter_records(self):
+        """Scrape data of each section of a road, generating its records.
+
+        Generates (table, record) tuples, where table is SIMPLE_TBL or
+        DETAILS_TBL. All simple records come first (they are all in the road
+        page), then details records of each section as soon as its details
+        page is fetched, in sections order. Only the pages being fetched are
+        kept in memory.
+        """
+
+        # get the sections of the road page
+        road_rows = self._get_page_data(self.base_url,
+                                        self._extract_road_rows)
+
+        simple_rows, details_sections, details_links = \
+            self._create_simple_rows(road_rows)
+
+        for row in simple_rows:
+            yield self.SIMPLE_TBL, row
+
+        # extract all tables from details links, keeping sections order
+        detail_tables_iter = self._iter_detail_tables(details_links)
+
+        # create records from detail tables of each section
+        for section_code, detail_tables in zip(details_sections,
+                                               detail_tables_iter):
+
+            with get_metrics().timer("records_seconds"):
+                records = list(self._iter_details_records(section_code,
+                                                          detail_tables))
+
+            for record in records:
+                yield self.DETAILS_TBL, record
+
+    def get_simple_records(self):
+
+        for row in self.simple_tbl:
+            yield row
 
-        # return values of the method
-        all_detail_tables = OrderedDict()
+    def get_details_records(self):
+
+        for row in self.details_tbl:
+            yield row
+
+    # PRIVATE
+    def _create_simple_rows(self, road_rows):
+        """Create the rows of the simple table from the sections of the road
+        page (see _extract_road_rows).
+
+        Returns the rows, and the codes and links of the sections with
+        details, in the order they were found."""
+
+        simple_rows = []
+
+        # sections with details, in the order they were found
+        details_sections = []
+        details_links = []
 
         id_section = 0
+        # iterate rows of the sections
+        for texts, link_details_part in road_rows:
+
+            # new section has been found
+            id_section += 1
+            section_code = "{}_{}".format(self.road_name, id_section)
+            # print "Procesando tramo ", section_code
+
+            # init a new row with section code and add row elements
+            row = [section_code] + texts
+
+            # check if the section has details to be scraped as well
+            if link_details_part is not None:
+
+                # join details part link with road base link
+                link_details = urljoin(self.dict_rutas[self.road_name],
+                                       link_details_part)
+
+                # append link to simple table row
+                row.append(link_details)
+
+                # keep the link to be fetched once all rows are read
+                details_sections.append(section_code)
+                details_links.append(link_details)
+
+            # if has no details, append empty string instead of a link
+            else:
+                row.append("")
+
+            # new row of the simple_tbl
+            simple_rows.append(row)
+
+        return simple_rows, details_sections, details_links
+
+    @classmethod
+    def _get_page_data(cls, url, parse):
+        """Fetch a page and return the data parsed from it by "parse", or
+        the one stored in the manifest if the page didn't change."""
+
+        html = get_html_from_static_site(url)
+
+        if cls.MANIFEST:
+            return cls.MANIFEST.get_data(url, html, cls._timed(parse))
+
+        return cls._timed(parse)(html)
+
+    @classmethod
+    def _timed(cls, parse):
+        """Return "parse" adding the time it takes to the parse metrics."""
+
+        def timed_parse(html):
+            with get_metrics().timer("parse_seconds"):
+                return parse(html)
+
+        return timed_parse
+
+    @classmethod
+    def _extract_road_rows(cls, html):
+        """Extract the sections of the road table.
+
+        Returns a list of (texts, details_link_part) tuples, one for each row
+        of the table with 8 elements. "details_link_part" is None if the
+        section has no details."""
+
+        if cls.PARSER == XPATH_PARSER:
+            return extract_road_rows(html)
+
+        # parse html into a beautiful soup
+        bs_road = BeautifulSoup(html, cls.PARSER)
+
+        rows = []
         # iterate rows
         for tr in bs_road.find_all("tr"):
 
@@ -74,65 +250,66 @@ class RoadScraper():
 
             # check if row has 8 elements and proceed
             if len(row_elements) == 8:
-
-                # new section has been found
-                id_section += 1
-                section_code = "{}_{}".format(self.road_name, id_section)
-                # print "Procesando tramo ", section_code
-
-                # init a new row with section code
-                row = [section_code]
-
-                # iterate row elements adding each one to the row
-                for element in row_elements:
-                    row.append(element.get_text().strip())
+                texts = [element.get_text().strip()
+                         for element in row_elements]
 
                 # check if the section has details to be scraped as well
-                if self._has_details(row_elements):
+                link_details_part = None
+                if cls._has_details(row_elements):
+                    link_details_part = cls._find_details_link(row_elements)
 
-                    # find details link
-                    link_details_part = self._find_details_link(row_elements)
+                rows.append((texts, link_details_part))
 
-                    # join details part link with road base link
-                    link_details = urljoin(self.dict_rutas[self.road_name],
-                                           link_details_part)
+        return rows
 
-                    # append link to simple table row
-                    row.append(link_details)
+    @classmethod
+    def _has_details(cls, row_elements):
+        return row_elements[6].get_text() == "ver detalle"
 
-                    # extract all tables from link_details of the section
-                    detail_tables = self._extract_detail_tables(link_details)
-                    # print section_code, link_details, detail_tables
+    @classmethod
+    def _find_details_link(cls, row_elements):
+        return row_elements[6].find_all("a")[0]["href"]
 
-                    # add new tables to detail_tables
-                    all_detail_tables[section_code] = detail_tables
+    def _iter_detail_tables(self, details_links):
+        """Extract detail tables of many links, using a pool of threads.
 
-                # if has no details, append empty string instead of a link
-                else:
-                    row.append("")
+        Generates the tables of each link, in the same order of the links
+        passed. No more than two pages per worker are fetched ahead of the
+        one being consumed."""
 
-                # add new row to the simple_tbl
-                self.simple_tbl.append(row)
+        # fetch sequentially if there is just one worker
+        if self.workers <= 1 or len(details_links) <= 1:
+            for details_link in details_links:
+                yield self._get_detail_tables(details_link)
+            return
 
-        # add records taken from detail tables to the details_tbl
-        self._create_details_tbl(all_detail_tables)
+        for detail_tables in imap_bounded(
+                self._get_details_pool(self.workers), self._get_detail_tables,
+                details_links, 2 * self.workers):
+            yield detail_tables
 
-    def get_simple_records(self):
+    @classmethod
+    def _get_details_pool(cls, workers):
+        """Return the pool of "workers" threads of this process."""
 
-        for row in self.simple_tbl:
-            yield row
+        # threads of a pool don't survive a fork, each process has its own
+        key = (os.getpid(), workers)
 
-    def get_details_records(self):
+        with cls.DETAILS_POOLS_LOCK:
+            if key not in cls.DETAILS_POOLS:
+                cls.DETAILS_POOLS[key] = ThreadPool(workers)
 
-        for row in self.details_tbl:
-            yield row
+            return cls.DETAILS_POOLS[key]
 
-    # PRIVATE
-    def _has_details(self, row_elements):
-        return row_elements[6].get_text() == "ver detalle"
+    @classmethod
+    def _get_detail_tables(cls, details_link):
+        """Return detail tables of a link, from the memo if possible."""
 
-    def _find_details_link(self, row_elements):
-        return row_elements[6].find_all("a")[0]["href"]
+        if cls.DETAILS_MEMO:
+            return cls.DETAILS_MEMO.get(details_link,
+                                        cls._extract_detail_tables)
+
+        return cls._extract_detail_tables(details_link)
 
     @classmethod
     def _extract_detail_tables(cls, details_link):
@@ -163,8 +340,17 @@ class RoadScraper():
                         [u'VM', u'110,4', u'84,7']]}
         """
 
-        # parse details link into a beautiful soup
-        bs = get_bs_from_static_site(details_link, PARSER)
+        return cls._get_page_data(details_link, cls._parse_detail_tables)
+
+    @classmethod
+    def _parse_detail_tables(cls, html):
+        """Extract all detail tables from the html of a detail page."""
+
+        if cls.PARSER == XPATH_PARSER:
+            return extract_detail_tables(html)
+
+        # parse html into a beautiful soup
+        bs = BeautifulSoup(html, cls.PARSER)
 
         # create empty dict for tables extraction
         extracted_tables = {}
@@ -247,41 +433,34 @@ class RoadScraper():
 
         # iterate sections of a road
         for section_code, detail_table in all_detail_tables.items():
-            # print section_code
-
-            # check if there is any detail table of the section
-            if len(detail_table) > 0:
-
-                # iterate detail tabales of the section
-                for id_table in detail_table:
-
-                    # get table
-                    table = detail_table[id_table]
+            self.details_tbl.extend(
+                self._iter_details_records(section_code, detail_table))
 
-                    # iterate rows of the detail table
-                    for num_row in xrange(len(table)):
-
-                        # get row
-                        row = table[num_row]
+    @classmethod
+    def _iter_details_records(cls, section_code, detail_table):
+        """Generate records from the detail tables of one section."""
 
-                        # iterate columns of the row
-                        for num_col in xrange(len(row)):
+        # iterate detail tables of the section
+        for id_table, table in detail_table.iteritems():
+            variables, rows = cls._get_table_block(table)
 
-                            # dont use first row (headers)
-                            if num_row != 0:
+            # a record for each value of each row, with its header
+            for num_row, row in enumerate(rows, 1):
+                for variable, value in zip(variables, row):
+                    yield [section_code, id_table, variable, num_row, value]
 
-                                # get variable of the table (header)
-                                variable = table[0][num_col].strip()
+    @classmethod
+    def _get_table_block(cls, table):
+        """Return the variables (headers) of a detail table and its rows
+        without headers, all of them stripped."""
 
-                                # get the value
-                                value = row[num_col].strip()
+        if not table:
+            return [], []
 
-                                # create new record
-                                record = [section_code, id_table, variable,
-                                          num_row, value]
+        variables = [header.strip() for header in table[0]]
+        rows = [[value.strip() for value in row] for row in table[1:]]
 
-                                # add new record to details table
-                                self.details_tbl.append(record)
+        return variables, rows
 
 
 # DATA
@@ -289,10 +468,35 @@ class RoadScraper():
 base_url_part1 = "http://transito.vialidad.gov.ar:8080/SelCE_WEB/tmda_libro_web_"
 base_url_part2 = "/index.html"
 
+# default directory of the http cache
+CACHE_DIR = ".dnv_cache"
+
+# default directory of the checkpoint journal
+CHECKPOINT_DIR = ".dnv_checkpoint"
+
+# default path of the manifest of parsed pages
+MANIFEST_PATH = ".dnv_manifest.sqlite"
+
+# default path of the catalogue of roads of each year
+CATALOGUE_PATH = ".dnv_catalogue.json"
+
+# default path of the work queue, and seconds between checks of its units
+QUEUE_PATH = ".dnv_queue.sqlite"
+QUEUE_POLL_SECONDS = 2
+
+# threads scraping year index pages at the same time (connections are still
+# capped by the max_per_host of the http session)
+DISCOVERY_WORKERS = 8
+
+# stats of profiled roads, and calls printed of them
+PROFILE_PATH = "profile_{}_{}.prof"
+PROFILE_CALLS = 20
+
 
 # METHODS
 def scrape_road_links(year_base_url):
-    """Scrape road links from a year url and return them as a dictionary.
+    """Scrape road links from a year url and return them as an ordered
+    dictionary, in the order of the index page.
 
     Arg:
     "http://transito.vialidad.gov.ar:8080/SelCE_WEB/tmda_libro_web_2010/index.html"
@@ -304,14 +508,22 @@ def scrape_road_links(year_base_url):
 
     """
 
+    return parse_road_links(get_html_from_static_site(year_base_url),
+                            year_base_url)
+
+
+def parse_road_links(html, year_base_url):
+    """Parse road links from the html of a year url (see
+    scrape_road_links)."""
+
     # parse year url into beautiful soup
-    bs_roads = get_bs_from_static_site(year_base_url, PARSER)
+    bs_roads = BeautifulSoup(html, PARSER)
 
     # extrae la tabla que contiene los links de las rutas
     bs_key_value_pairs = bs_roads.find_all("td", {"class": "FILA"})
 
-    # para cada regitro de la tabla extrae el texto y el link
-    road_links = {}
+    # para cada regitro de la tabla extrae el texto y el link, en orden
+    road_links = OrderedDict()
     for element in bs_key_value_pairs:
         dict_temp = extract_key_value_pairs_from_bs(element, "a", "href")
         road_links[dict_temp[dict_temp.keys()[0]]] = dict_temp.keys()[0]
@@ -327,53 +539,542 @@ def scrape_road_links(year_base_url):
     return road_links
 
 
-def scrape_traffic_data(years=None, roads=None, excel_output=None):
-    """Scrape traffic data from DNV website.
+def iter_road_records(year, road, road_links, detail_workers=1):
+    """Scrape one road of one year, generating its records.
 
-    Uses TrafficData to write results and RoadScraper to scrape one year-road
-    at a time. Scrape all roads for years passed. If no roads are passed,
-    it takes data from all of them."""
+    Generates (table, record) tuples like RoadScraper.iter_records, with the
+    year already added to each record."""
+
+    # create scraper for road and stream its records
+    road_scraper = _start_road(year, road, road_links, detail_workers)
+
+    for table, record in road_scraper.iter_records():
+        yield table, record + [year]
+
+
+def scrape_road(year, road, road_links, detail_workers=1):
+    """Scrape one road of one year and return its records in a RoadRecords
+    (that generates them like iter_road_records).
+
+    It is a module level method so it can be sent to worker processes."""
+
+    road_scraper = _start_road(year, road, road_links, detail_workers)
+
+    return RoadRecords(year, RoadScraper.DETAILS_TBL,
+                       road_scraper.iter_records())
+
+
+def _start_road(year, road, road_links, detail_workers):
+    """Print the road being scraped, start its metrics and return its
+    RoadScraper."""
+
+    print "Taking data from road: ", road, " at year: ", year
+    get_metrics().start_unit(year, road)
+
+    return RoadScraper(road, road_links[road], road_links, detail_workers)
+
+
+def _scrape_road_job(job):
+    """Unpack a (year, road, road_links, detail_workers) job for a pool.
+
+    Returns year, road, its RoadRecords and the stats of the worker while
+    scraping it (see _pop_worker_stats)."""
+
+    records = scrape_road(*job)
+
+    return job[0], job[1], records, _pop_worker_stats(job[0], job[1])
+
+
+def _iter_road_job(job):
+    """Unpack a (year, road, road_links, detail_workers) job to stream it.
+
+    Returns year, road, a generator of records and no worker stats (they
+    are already counted in this process)."""
+    return job[0], job[1], iter_road_records(*job), None
+
+
+def _profile_road_job(job, profile_path):
+    """Scrape a job in this process with cProfile, saving the stats to
+    "profile_path" and printing the slowest calls.
+
+    Returns the same than _iter_road_job."""
+
+    profiler = cProfile.Profile()
+    records = profiler.runcall(scrape_road, *job)
+    profiler.dump_stats(profile_path)
+
+    print "Profile of road: ", job[1], " at year: ", job[0], "saved in", \
+        profile_path
+    pstats.Stats(profile_path).sort_stats("cumulative").print_stats(
+        PROFILE_CALLS)
+
+    return job[0], job[1], records, None
+
+
+def _wait_queue_unit(work_queue, year, road):
+    """Wait until a unit of a WorkQueue is scraped by a worker.
+
+    Returns the same than _scrape_road_job."""
+
+    result = work_queue.get_result(year, road)
+    if result is None:
+        print "Waiting for road from the queue: ", road, " at year: ", year
+
+    while result is None:
+        time.sleep(QUEUE_POLL_SECONDS)
+        result = work_queue.get_result(year, road)
+
+    records, worker_stats = result
+
+    return year, road, records, worker_stats
+
+
+def run_queue_worker(work_queue, detail_workers=1, lease_seconds=None):
+    """Scrape the units leased from a WorkQueue, publishing their records.
+
+    It works until all the units of the queue are done or failed (waiting
+    for units if the queue is empty). A unit that raises an error is
+    released to be retried (see WorkQueue.fail)."""
+
+    worker = WorkQueue.get_worker_name()
+
+    while True:
+        job = work_queue.lease(worker, lease_seconds)
+
+        if not job:
+            counts = work_queue.get_counts()
+            if counts and not (counts.get(WorkQueue.PENDING) or
+                               counts.get(WorkQueue.LEASED)):
+                break
+
+            # units leased by other workers may expire and be leased again
+            time.sleep(QUEUE_POLL_SECONDS)
+            continue
+
+        year, road, road_links = job
+        try:
+            records = scrape_road(year, road, road_links, detail_workers)
+        except Exception as error:
+            print "Failed road: ", road, " at year: ", year, repr(error)
+            work_queue.fail(year, road, worker, repr(error))
+            continue
+
+        work_queue.complete(year, road, records,
+                            _pop_worker_stats(year, road))
+
+
+def _pop_worker_stats(year, road):
+    """Return the stats of a worker process for a road, to be added to the
+    ones of the main process: (hits, misses) of the memo of detail tables
+    and metrics of the road."""
+
+    memo_counters = None
+    if RoadScraper.DETAILS_MEMO:
+        memo_counters = RoadScraper.DETAILS_MEMO.pop_counters()
+
+    return memo_counters, get_metrics().pop_unit(year, road)
+
+
+def _add_worker_stats(year, road, worker_stats):
+
+    memo_counters, metrics = worker_stats
+
+    if memo_counters:
+        RoadScraper.DETAILS_MEMO.add_counters(memo_counters)
+
+    if metrics:
+        get_metrics().add_unit(year, road, metrics)
+
+
+class _LazyResult():
+    """Result computed in this process only when it is asked for, with the
+    same "get" method than the results of a pool."""
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def get(self):
+        return self.func(*self.args)
+
+
+def _iter_road_results(jobs, pool=None, window=1, journal=None,
+                       profile_road=None, work_queue=None):
+    """Generate (year, road, records) of each job, in the same order.
+
+    Jobs are scraped by the pool if one is passed, sending no more than
+    "window" of them ahead of the one being consumed, taken from the
+    WorkQueue if one is passed (where they must be enqueued), or scraped in
+    this process otherwise. Units completed in the journal are replayed from
+    it instead of being scraped, and records of the others are spilled to
+    it.
+
+    Jobs of "profile_road" are always scraped in this process, with
+    cProfile."""
+
+    pending = deque()
+    for job in jobs:
+        year, road = job[0], job[1]
+        resumed = journal and journal.has_unit(year, road)
+
+        if resumed:
+            print "Resuming road from checkpoint: ", road, " at year: ", year
+            result = _LazyResult(_replay_unit, journal, year, road)
+        elif road == profile_road:
+            result = _LazyResult(_profile_road_job, job,
+                                 PROFILE_PATH.format(year, road))
+        elif work_queue:
+            result = _LazyResult(_wait_queue_unit, work_queue, year, road)
+        elif pool:
+            result = pool.apply_async(_scrape_road_job, (job,))
+        else:
+            result = _LazyResult(_iter_road_job, job)
+
+        pending.append((result, journal and not resumed))
+
+        # results computed in this process are consumed right away
+        while pending and (len(pending) >= window or not pool):
+            yield _get_road_result(journal, *pending.popleft())
+
+    while pending:
+        yield _get_road_result(journal, *pending.popleft())
+
+
+def _replay_unit(journal, year, road):
+    return year, road, journal.iter_records(year, road), None
+
+
+def _get_road_result(journal, result, spill):
+    """Return the (year, road, records) of a result, spilling its records to
+    the journal if asked."""
+
+    year, road, records, worker_stats = result.get()
+
+    # add stats of the worker process
+    if worker_stats:
+        _add_worker_stats(year, road, worker_stats)
+
+    if spill:
+        records = journal.record_unit(year, road, records)
+
+    return year, road, records
+
+
+def write_records(traffic_data, records, unit=None):
+    """Write (table, record) tuples of a road to traffic_data.
+
+    If a (year, road) unit is passed, the records written and the time spent
+    writing them are added to its metrics."""
+
+    num_records = 0
+    seconds = 0.0
+    for table, record in records:
+        start = time.time()
+
+        if table == RoadScraper.SIMPLE_TBL:
+            traffic_data.write_simple_record(record)
+        else:
+            traffic_data.write_details_record(record)
+
+        seconds += time.time() - start
+        num_records += 1
+
+    if unit:
+        get_metrics().add("records", num_records, unit)
+        get_metrics().add("write_seconds", seconds, unit)
+
+
+def get_years(years=None):
+    """Return the years passed or, if not passed, all of them (2006 up to
+    last year)."""
 
-    # if years not passed, scrape all (2006 up to last year)
     if not years:
         today_year = datetime.date.today().timetuple().tm_year
         years = list(xrange(2006, today_year))
 
-    # create object where data will be stored
-    traffic_data = TrafficData()
+    return years
 
-    # iterate years
-    for year in years:
 
-        # create base_url for year
-        year_base_url = base_url_part1 + str(year) + base_url_part2
+class RoadsWriter():
+    """Write the records of each (year, road) of a run to TrafficData.
 
-        # scrape road links for that year
-        road_links = scrape_road_links(year_base_url)
+    Besides the output, it keeps the optional wide details output and the
+    typing of records of the run, and reports the memo of detail tables and
+    the metrics of the run once it is saved (see scrape_traffic_data).
 
-        # if not roads provided, get them all
-        if not roads:
-            roads = road_links.keys()
+    If a "baseline" output and a "delta_output" are passed, the records of
+    the years written (and of "roads", if passed) that differ from the
+    baseline are saved to the delta output too (see write_delta).
+    """
+
+    def __init__(self, excel_output=None, output_format=None,
+                 wide_details_output=None, typed=False, metrics_report=False,
+                 metrics_output=None, baseline=None, delta_output=None,
+                 roads=None):
+
+        self.excel_output = excel_output
+        self.output_format = output_format
+        self.wide_details_output = wide_details_output
+        self.metrics_report = metrics_report
+        self.metrics_output = metrics_output
+        self.baseline = baseline
+        self.delta_output = delta_output
+        self.roads = set(roads) if roads else None
+
+        # years written, as texts, to compare only them with the baseline
+        self.years = set()
+
+        # create object where data will be stored
+        self.traffic_data = TrafficData(excel_output, output_format)
+
+        self.detail_frames = None
+        if wide_details_output:
+            self.detail_frames = DetailFrames()
+
+        self.typer = None
+        if typed:
+            self.typer = RecordTyper(RoadScraper.SIMPLE_TBL,
+                                     TrafficData.get_simple_tbl_fields(),
+                                     RoadScraper.DETAILS_TBL,
+                                     TrafficData.get_details_tbl_fields())
+
+        # detail pages are shared by roads of this run only
+        self.memo = RoadScraper.DETAILS_MEMO
+        if self.memo:
+            self.memo.clear()
+
+        self.metrics = get_metrics()
+        self.metrics.clear()
+
+    # PUBLIC
+    def write_road(self, year, road, records):
+        """Write (table, record) tuples of a road of a year."""
+
+        if self.detail_frames:
+            records = self.detail_frames.collect(records,
+                                                 RoadScraper.DETAILS_TBL)
+
+        # convert numeric fields of the whole road at once
+        if self.typer:
+            records = self.typer.type_records(records)
+
+        # write each record scraped to excel
+        self.traffic_data.start_road(year, road)
+        write_records(self.traffic_data, records, (year, road))
+        self.traffic_data.end_road(year, road)
+        self.years.add(unicode(year))
+
+    def save(self):
+        """Save the outputs and print the reports of the run."""
+
+        self.traffic_data.save(self.excel_output)
+
+        if self.detail_frames:
+            self.detail_frames.save_wide(self.wide_details_output)
+
+        if self.delta_output:
+            self._save_delta()
+
+        if self.memo:
+            print "Detail pages memo:", self.memo.hits, "hits,", \
+                self.memo.misses, "misses"
+
+        if self.typer and self.typer.errors:
+            print "Cells kept as texts, they are not numbers:"
+            for line in self.typer.get_errors_report():
+                print " ", line
+
+        if self.metrics_report:
+            for line in self.metrics.get_report():
+                print line
+
+        if self.metrics_output:
+            self.metrics.save_json(self.metrics_output)
+
+    # PRIVATE
+    def _save_delta(self):
+        """Save the records that differ from the baseline, in the years and
+        roads of this run (roads of other years or roads are not deleted
+        just because they were not scraped again)."""
+
+        def in_scope(year, road):
+            return year in self.years and (not self.roads or
+                                           road in self.roads)
+
+        table_diffs = write_delta(
+            self.baseline, self.excel_output or self.traffic_data.sink.output,
+            self.delta_output, new_format=self.output_format,
+            in_scope=in_scope)
+
+        print "Changes from", self.baseline, "saved to", self.delta_output
+        for table_diff in table_diffs.values():
+            print " ", table_diff.get_report()
+
+
+def scrape_year_road_links(year):
+    """Scrape road links of a year (see scrape_road_links)."""
+    return scrape_road_links(get_year_url(year))
+
+
+def get_year_url(year):
+    """Return the url of the index page of a year."""
+    return base_url_part1 + str(year) + base_url_part2
+
+
+def discover_roads(years, catalogue=None):
+    """Return a RoadCatalogue with the road links of each year.
+
+    Index pages of the years missing in "catalogue" (a new one if not
+    passed) are scraped at the same time, by DISCOVERY_WORKERS threads."""
+
+    catalogue = catalogue or RoadCatalogue()
+
+    # index pages are fetched together, their metrics go to a single unit
+    get_metrics().start_unit(None, None)
+    catalogue.discover(years, scrape_year_road_links, DISCOVERY_WORKERS)
 
-        # iterate roads
-        for road in roads:
+    return catalogue
 
-            print "Taking data from road: ", road, " at year: ", year
 
-            # create scraper for road and scrape it
-            road_scraper = RoadScraper(road, road_links[road], road_links)
-            road_scraper.scrape()
+def _iter_road_jobs(catalogue, years, roads, detail_workers,
+                    skip_road=None):
+    """Generate (year, road, road_links, detail_workers) jobs in order, from
+    the roads of each year in "catalogue" (all of them if no roads are
+    passed).
 
-            # write each simple record scraped to excel
-            for record in road_scraper.get_simple_records():
-                traffic_data.write_simple_record(record + [year])
+    Roads of a year for which "skip_road(year, road)" is True are skipped."""
 
-            # write each details record scraped to excel
-            for record in road_scraper.get_details_records():
-                traffic_data.write_details_record(record + [year])
+    for year, road, road_links in catalogue.iter_jobs(years, roads):
+        if skip_road and skip_road(year, road):
+            print "Skipping road already scraped: ", road, " at year: ", \
+                year
+            continue
+
+        yield year, road, road_links, detail_workers
+
+
+def scrape_traffic_data(years=None, roads=None, excel_output=None,
+                        detail_workers=1, workers=1, output_format=None,
+                        incremental=False, journal=None,
+                        wide_details_output=None, typed=False,
+                        metrics_report=False, metrics_output=None,
+                        profile_road=None, catalogue=None, work_queue=None,
+                        baseline=None, delta_output=None):
+    """Scrape traffic data from DNV website.
+
+    Uses TrafficData to write results and RoadScraper to scrape one year-road
+    at a time. Scrape all roads for years passed. If no roads are passed,
+    it takes data from all the roads of each year.
+
+    Roads of each year are taken from a RoadCatalogue, which can be passed
+    to reuse one saved by a previous run. Index pages of the years it
+    doesn't have are scraped at the same time before any road (see
+    discover_roads).
+
+    Detail pages of each road are fetched by "detail_workers" threads. If
+    "workers" is greater than one, (year, road) jobs are scraped by a pool of
+    processes, but records are still written in (year, road) order by this
+    process, so the output is the same as the single process one.
+
+    In a single process, records are written as soon as they are scraped;
+    with a pool, each worker sends the records of a whole road at once.
+
+    Output is an excel file unless other "output_format" is passed, or the
+    output has the extension of other format (see TrafficData.SINKS).
+
+    If "incremental" is True, roads of a year the output already has (from a
+    previous run) are not scraped again. Only outputs that keep previous runs,
+    like sqlite ones, have roads.
+
+    If a CheckpointJournal is passed, records of each road are spilled to it,
+    and roads it already has from a previous run are replayed from it instead
+    of being scraped again.
+
+    If "wide_details_output" is passed, details records are also saved there
+    as a wide typed table for each detail table (see DetailFrames).
+
+    If "typed" is True, numeric fields are written as numbers instead of
+    texts (see RecordTyper), and texts that could not be parsed are
+    reported at the end.
+
+    Hits and misses of the memo of detail tables (see RoadScraper) are
+    reported at the end. Metrics of each (year, road) scraped (see
+    ScrapeMetrics) are printed if "metrics_report" is True, and saved to
+    "metrics_output" json file if one is passed.
+
+    If "profile_road" is passed, that road is scraped with cProfile in each
+    year, saving the stats to PROFILE_PATH.
+
+    If a WorkQueue is passed, jobs are enqueued there to be scraped by
+    workers of any node (see run_queue_worker), and this process merges
+    their records into the output in (year, road) order.
+
+    If a "baseline" output of a previous run (in any format) and a
+    "delta_output" are passed, only the records inserted, updated and
+    deleted since the baseline in the years and roads scraped are also saved
+    to the delta output, with the change of each one (see write_delta). The
+    baseline is compared road by road, streaming both outputs, and should
+    have been scraped with the same "typed" than this run."""
+
+    years = get_years(years)
+
+    # create object where data will be stored
+    writer = RoadsWriter(excel_output, output_format, wide_details_output,
+                         typed, metrics_report, metrics_output, baseline,
+                         delta_output, roads)
+
+    catalogue = discover_roads(years, catalogue)
+
+    skip_road = writer.traffic_data.has_road if incremental else None
+    jobs = _iter_road_jobs(catalogue, years, roads, detail_workers,
+                           skip_road)
+
+    # jobs not resumed nor profiled are scraped by the workers of the queue
+    if work_queue:
+        jobs = list(jobs)
+        work_queue.enqueue(
+            (year, road, road_links)
+            for year, road, road_links, detail_workers in jobs
+            if road != profile_road and not (journal and
+                                             journal.has_unit(year, road)))
+
+    # scrape in this process or fan out jobs over a pool of processes
+    pool = None
+    if workers > 1 and not work_queue:
+        pool = multiprocessing.Pool(workers)
+
+    results = _iter_road_results(jobs, pool, 2 * workers, journal,
+                                 profile_road, work_queue)
+
+    try:
+        # results arrive in the same order jobs were generated
+        for year, road, records in results:
+            writer.write_road(year, road, records)
+
+            # records written don't need to be kept in the queue
+            if work_queue:
+                work_queue.release(year, road)
+
+    except:
+        if pool:
+            pool.terminate()
+        raise
+
+    if pool:
+        pool.close()
+        pool.join()
 
     # save excel with all traffic data scraped
-    traffic_data.save(excel_output)
+    writer.save()
+
+
+def set_scraper_options(parser, details_memo=None, manifest=None):
+    """Set the parser, the memo of detail pages and the page manifest used
+    by RoadScraper."""
+
+    RoadScraper.PARSER = parser
+    RoadScraper.DETAILS_MEMO = details_memo
+    RoadScraper.MANIFEST = manifest
 
 
 def test():
@@ -382,21 +1083,264 @@ def test():
     scrape_traffic_data(years, roads, "Trafico ruta 14 - 2006 a 2013.xlsx")
 
 
-if __name__ == '__main__':
+def parse_args(args=None):
+    """Parse command line arguments."""
+
+    parser = argparse.ArgumentParser(
+        description="Scrape traffic data from DNV website.")
+
+    # positional parameters, always in excel-roads-years order
+    parser.add_argument("excel_output", nargs="?", default=None,
+                        help="output file name, its extension gives its "
+                        "format ({})".format(", ".join(
+                            sink_class.EXTENSION for sink_class
+                            in TrafficData.SINKS.values())))
+    parser.add_argument("roads", nargs="?", default=None,
+                        help="one road, or many separated by commas")
+    parser.add_argument("years", nargs="?", default=None,
+                        help="one year, or many separated by commas")
+
+    parser.add_argument("--format", dest="output_format", default=None,
+                        choices=TrafficData.SINKS.keys(),
+                        help="format of the output (by default, taken from "
+                        "the extension of the output)")
+    parser.add_argument("--wide-details", default=None,
+                        help="also save a wide table for each detail table "
+                        "(.xlsx, .csv or .parquet)")
+    parser.add_argument("--typed", action="store_true",
+                        help="write numeric fields as numbers instead of "
+                        "texts")
+    parser.add_argument("--incremental", action="store_true",
+                        help="skip roads of a year already in the output "
+                        "(only sqlite outputs keep previous runs)")
+    parser.add_argument("--parser", default=RoadScraper.PARSER,
+                        help="BeautifulSoup parser used to read road pages "
+                        "(lxml, html5lib, html.parser) or '{}' to extract "
+                        "tables with lxml XPath queries".format(XPATH_PARSER))
+
+    # concurrency options
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes scraping (year, road) jobs")
+    parser.add_argument("--detail-workers", type=int, default=1,
+                        help="threads fetching detail pages of each road")
+    parser.add_argument("--max-per-host", type=int,
+                        default=MAX_CONNECTIONS_PER_HOST,
+                        help="max simultaneous connections against a host, "
+                        "of each process")
+
+    parser.add_argument("--memo-size", type=int, default=LruMemo.MAX_SIZE,
+                        help="detail pages kept in memory to be reused by "
+                        "other roads (0 to disable it)")
+
+    # async options
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="scrape with coroutines in a single thread "
+                        "(needs trollius), making --max-per-host requests "
+                        "at the same time; --workers and --detail-workers "
+                        "are not used")
+    parser.add_argument("--async-roads", type=int, default=None,
+                        help="roads scraped at the same time with --async")
+
+    # metrics options
+    parser.add_argument("--metrics", action="store_true",
+                        help="print time spent and work done by each "
+                        "(year, road) at the end")
+    parser.add_argument("--metrics-json", default=None,
+                        help="save metrics of each (year, road) to this "
+                        "json file")
+    parser.add_argument("--profile-road", default=None,
+                        help="scrape this road with cProfile, saving its "
+                        "stats to " + PROFILE_PATH.format("YEAR", "ROAD"))
+
+    # checkpoint options
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help="spill records of each road scraped to this "
+                        "directory, to resume the run if it fails")
+    parser.add_argument("--resume", action="store_true",
+                        help="resume a failed run from its checkpoint (and "
+                        "its --queue), without scraping again the roads it "
+                        "completed")
+
+    # manifest options
+    parser.add_argument("--manifest", nargs="?", const=MANIFEST_PATH,
+                        default=None,
+                        help="reuse data of pages that didn't change since "
+                        "they were parsed in previous runs, keeping their "
+                        "hashes in this file (default {})".format(
+                            MANIFEST_PATH))
+
+    # delta options
+    parser.add_argument("--baseline", default=None,
+                        help="output of a previous run (in any format), to "
+                        "save the records that changed since then to "
+                        "--delta")
+    parser.add_argument("--delta", default=None,
+                        help="output of the records inserted, updated and "
+                        "deleted since --baseline, with a 'cambio' column "
+                        "(in any format, by its extension)")
+
+    # catalogue options
+    parser.add_argument("--catalogue", nargs="?", const=CATALOGUE_PATH,
+                        default=None,
+                        help="keep the roads of each year in this file, "
+                        "scraping only the index pages of years it doesn't "
+                        "have (default {})".format(CATALOGUE_PATH))
+    parser.add_argument("--plan", action="store_true",
+                        help="print the roads that would be scraped of each "
+                        "year and exit, without scraping them")
+
+    # work queue options
+    parser.add_argument("--queue", nargs="?", const=QUEUE_PATH, default=None,
+                        help="enqueue the roads to be scraped in this SQLite "
+                        "file, for workers of any node, and write their "
+                        "records (default {})".format(QUEUE_PATH))
+    parser.add_argument("--worker", action="store_true",
+                        help="scrape roads taken from --queue until all of "
+                        "them are done, instead of writing an output")
+    parser.add_argument("--lease-seconds", type=float,
+                        default=WorkQueue.LEASE_SECONDS,
+                        help="seconds a worker has to scrape a road before "
+                        "other worker can take it")
+
+    # http session options
+    parser.add_argument("--timeout", type=float, default=HttpSession.TIMEOUT,
+                        help="seconds to wait for the server to answer")
+    parser.add_argument("--retries", type=int, default=HttpSession.RETRIES,
+                        help="times a failed request is retried")
+    parser.add_argument("--backoff", type=float, default=HttpSession.BACKOFF,
+                        help="seconds to wait before the first retry, "
+                        "doubled before each next one")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="limit requests per second of each process "
+                        "to each host, starting at this rate and adapting "
+                        "it to the latency and errors of the host (not "
+                        "limited by default, each worker process has its "
+                        "own limit)")
+    parser.add_argument("--max-rate", type=float,
+                        default=AdaptiveRateLimiter.MAX_RATE,
+                        help="max requests per second of each process to "
+                        "each host when --rate is passed")
+
+    # http cache options
+    parser.add_argument("--cache-dir", default=None,
+                        help="store fetched pages in this directory and "
+                        "reuse them in later runs")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="max size of the cache in MB")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="ask the server if cached pages have changed")
+    parser.add_argument("--offline", action="store_true",
+                        help="use only cached pages, never the network")
+
+    args = parser.parse_args(args)
+
+    if args.async_mode and args.profile_road:
+        parser.error("--profile-road can't be used with --async")
+
+    if args.async_mode and (args.queue or args.worker):
+        parser.error("--queue and --worker can't be used with --async")
+
+    if args.queue and args.workers > 1 and not args.worker:
+        parser.error("--workers can't be used with --queue, start workers "
+                     "with --worker instead")
+
+    if bool(args.baseline) != bool(args.delta):
+        parser.error("--baseline and --delta must be used together")
+
+    # outputs without a format need a known extension
+    for output, output_format in [(args.excel_output, args.output_format),
+                                  (args.delta, None)]:
+        try:
+            output_format or TrafficData.get_output_format(output)
+        except ValueError as error:
+            parser.error(str(error))
+
+    if args.baseline and args.baseline == args.excel_output:
+        parser.error("--baseline can't be the output, it would be "
+                     "overwritten before being compared")
+
+    # workers need a queue, use the default one if none was passed
+    if args.worker and not args.queue:
+        args.queue = QUEUE_PATH
+
+    # resuming needs a checkpoint, use the default one if none was passed
+    if args.resume and not args.checkpoint_dir:
+        args.checkpoint_dir = CHECKPOINT_DIR
+
+    # offline mode needs a cache, use the default one if none was passed
+    if args.offline and not args.cache_dir:
+        args.cache_dir = CACHE_DIR
+
+    if args.roads:
+        args.roads = args.roads.split(",")
+
+    if args.years:
+        args.years = args.years.split(",")
+
+    return args
 
-    # init parameters as none
-    xl_output = None
-    roads = None
-    years = None
 
-    # parse parameters if they were submited
-    if len(sys.argv) > 1:
-        xl_output = sys.argv[1].split(",")
-
-    if len(sys.argv) > 2:
-        roads = sys.argv[2].split(",")
-
-    if len(sys.argv) > 3:
-        years = sys.argv[3]
+if __name__ == '__main__':
 
-    scrape_traffic_data(years, roads, xl_output)
+    args = parse_args()
+
+    set_http_session(HttpSession(args.timeout, args.retries, args.backoff,
+                                 args.rate, args.max_rate, args.max_per_host))
+    set_max_connections_per_host(args.max_per_host)
+
+    details_memo = LruMemo(args.memo_size) if args.memo_size else None
+    manifest = PageManifest(args.manifest) if args.manifest else None
+    set_scraper_options(args.parser, details_memo, manifest)
+
+    if args.cache_dir:
+        set_http_cache(HttpCache(args.cache_dir, args.cache_size * 1024 * 1024,
+                                 args.revalidate, args.offline))
+
+    if args.worker:
+        run_queue_worker(WorkQueue(args.queue, resume=True),
+                         args.detail_workers, args.lease_seconds)
+        sys.exit()
+
+    years = get_years(args.years)
+    catalogue = RoadCatalogue(args.catalogue)
+
+    if args.plan:
+        discover_roads(years, catalogue)
+        for line in catalogue.get_plan(years, args.roads):
+            print line
+        sys.exit()
+
+    journal = None
+    if args.checkpoint_dir:
+        journal = CheckpointJournal(args.checkpoint_dir, args.resume)
+
+    work_queue = None
+    if args.queue:
+        work_queue = WorkQueue(args.queue, args.resume)
+
+    if args.async_mode:
+        from async_scraper import (run_scrape_traffic_data_async,
+                                   AsyncHttpClient, ROADS_WINDOW)
+
+        # async_scraper uses the RoadScraper of the dnv_scraper module, not
+        # the one of this script
+        import dnv_scraper
+        dnv_scraper.set_scraper_options(args.parser, details_memo, manifest)
+
+        client = AsyncHttpClient(args.max_per_host, args.timeout,
+                                 args.retries, args.backoff, args.rate,
+                                 args.max_rate)
+        run_scrape_traffic_data_async(
+            years, args.roads, args.excel_output, args.output_format,
+            args.incremental, journal, args.wide_details, args.typed,
+            args.metrics, args.metrics_json, client,
+            args.async_roads or ROADS_WINDOW, catalogue=catalogue,
+            baseline=args.baseline, delta_output=args.delta)
+
+    else:
+        scrape_traffic_data(years, args.roads, args.excel_output,
+                            args.detail_workers, args.workers,
+                            args.output_format, args.incremental, journal,
+                            args.wide_details, args.typed, args.metrics,
+                            args.metrics_json, args.profile_road, catalogue,
+                            work_queue, args.baseline, args.delta)
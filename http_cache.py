@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from http_session import HttpError
+
+
+class CacheMissError(Exception):
+    """Raised when an url is not in the cache and fetching is not allowed."""
+
+    def __init__(self, url):
+        Exception.__init__(self, "Url not cached (offline mode): " + url)
+        self.url = url
+
+
+class HttpCache():
+    """Persistent cache of http responses stored in a directory.
+
+    Each url is stored in two files named after the sha1 of the url: the body
+    compressed with zlib ("<key>.z") and a json with its metadata
+    ("<key>.json") like the url, "ETag" and "Last-Modified" headers.
+
+    When the compressed bodies take more than "max_size" bytes, the least
+    recently used responses are evicted. Every hit touches the body file, so
+    its modification time works as the last access time.
+
+    By default cached responses are returned without asking the server (past
+    years pages never change). With "revalidate" a conditional request is
+    made using the stored validators, and with "offline" nothing is fetched at
+    all and urls not cached raise CacheMissError.
+    """
+
+    # DATA
+    MAX_SIZE = 1024 * 1024 * 1024
+    BODY_EXT = ".z"
+    META_EXT = ".json"
+
+    def __init__(self, cache_dir, max_size=None, revalidate=False,
+                 offline=False):
+
+        # cache parameters
+        self.cache_dir = cache_dir
+        self.max_size = max_size or self.MAX_SIZE
+        self.revalidate = revalidate
+        self.offline = offline
+
+        self.lock = threading.Lock()
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        # size of all compressed bodies stored
+        self.size = sum(os.path.getsize(path) for path in self._body_paths())
+
+    # PUBLIC
+    def get_html(self, url, fetch):
+        """Return the body of an url, using the cache if possible.
+
+        "fetch" is called with the url and a dict of extra request headers, and
+        it must return a (status, headers, body) tuple. A 304 status means the
+        cached body is still valid."""
+
+        body, request_headers = self.lookup(url)
+        if body is not None:
+            return body
+
+        status, headers, body = fetch(url, request_headers)
+        html = self.store(url, status, headers, body)
+
+        # the cached body was evicted while it was being revalidated
+        if html is None:
+            status, headers, body = fetch(url, {})
+            html = self.store(url, status, headers, body, conditional=False)
+
+        return html
+
+    def lookup(self, url):
+        """Return a (body, request_headers) tuple for an url.
+
+        The body is the cached one if it can be used without asking the
+        server, or None if the url must be fetched with the extra
+        "request_headers" (validators of the cached body, if any) and the
+        response passed to "store"."""
+
+        cached = self.get(url)
+
+        # return cached body without asking the server
+        if cached and (self.offline or not self.revalidate):
+            return cached[0], None
+
+        if self.offline:
+            raise CacheMissError(url)
+
+        # ask for the page only if it has changed
+        request_headers = {}
+        if cached:
+            request_headers = self._conditional_headers(cached[1])
+
+        return None, request_headers
+
+    def store(self, url, status, headers, body, conditional=True):
+        """Store a response fetched after a "lookup" and return the body of
+        the url (the cached one, if the status is 304).
+
+        If the cached body is gone after a "conditional" request got a 304,
+        None is returned and the url must be fetched again without
+        validators. Empty bodies are never stored."""
+
+        if status == 304:
+            cached = self.get(url)
+            if cached:
+                return cached[0]
+            if conditional:
+                return None
+            raise HttpError(url, status, "not modified without a cached page")
+
+        if body:
+            self.set(url, body, headers)
+
+        return body
+
+    def get(self, url):
+        """Return a (body, metadata) tuple for a cached url or None."""
+
+        body_path, meta_path = self._paths(url)
+
+        try:
+            with open(meta_path, "rb") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = zlib.decompress(f.read())
+        except (IOError, OSError, ValueError, zlib.error):
+            return None
+
+        # mark response as recently used
+        try:
+            os.utime(body_path, None)
+        except OSError:
+            pass
+
+        return body, meta
+
+    def set(self, url, body, headers=None):
+        """Store the body of an url and its validators headers."""
+
+        headers = headers or {}
+        body_path, meta_path = self._paths(url)
+
+        meta = {"url": url,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "stored": time.time()}
+
+        with self.lock:
+            old_size = self._get_size(body_path)
+
+            self._write_atomic(body_path, zlib.compress(body))
+            self._write_atomic(meta_path, json.dumps(meta))
+
+            self.size += self._get_size(body_path) - old_size
+
+            if self.size > self.max_size:
+                self._evict()
+
+    def clear(self):
+        """Remove all cached responses."""
+
+        with self.lock:
+            for body_path in self._body_paths():
+                self._remove(body_path)
+            self.size = 0
+
+    # PRIVATE
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        path = os.path.join(self.cache_dir, key)
+        return path + self.BODY_EXT, path + self.META_EXT
+
+    def _body_paths(self):
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(self.BODY_EXT):
+                yield os.path.join(self.cache_dir, name)
+
+    @classmethod
+    def _conditional_headers(cls, meta):
+        headers = {}
+
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        return headers
+
+    @classmethod
+    def _get_size(cls, path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    @classmethod
+    def _write_atomic(cls, path, data):
+        """Write to a temporary file and rename it, so readers in other
+        threads or processes never see a half written file."""
+
+        tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(),
+                                         threading.current_thread().ident)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+
+    def _remove(self, body_path):
+        """Remove a cached response and return the size freed."""
+
+        size = self._get_size(body_path)
+        meta_path = body_path[:-len(self.BODY_EXT)] + self.META_EXT
+
+        for path in (body_path, meta_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        return size
+
+    def _evict(self):
+        """Remove least recently used responses until size is under limit."""
+
+        by_last_use = []
+        for body_path in self._body_paths():
+            try:
+                by_last_use.append((os.path.getmtime(body_path), body_path))
+            except OSError:
+                pass
+        by_last_use.sort()
+
+        for last_use, body_path in by_last_use:
+            if self.size <= self.max_size:
+                break
+            self.size -= self._remove(body_path)
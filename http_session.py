@@ -0,0 +1,248 @@
+import httplib
+import os
+import socket
+import threading
+import time
+import zlib
+from urlparse import urlsplit, urljoin
+from metrics import get_metrics
+from rate_limiter import AdaptiveRateLimiter
+
+
+class HttpError(IOError):
+    """Raised when a page can't be fetched, after all retries."""
+
+    def __init__(self, url, status=None, reason=None):
+        IOError.__init__(self, "{} fetching {}: {}".format(status, url,
+                                                            reason))
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+
+class HttpSession():
+    """Http client that keeps persistent (keep-alive) connections.
+
+    Connections to each host are kept in a pool shared by all threads of a
+    process: a request takes an idle connection of the pool (or opens one if
+    there is none) and gives it back once its response was read. No more
+    than "max_per_host" requests (MAX_PER_HOST by default) are made to the
+    same host at the same time, so a process never opens more connections
+    than that against a host. Pages are asked gzipped and decompressed
+    transparently.
+
+    Transient errors (connection errors, timeouts and 5xx responses) are
+    retried "retries" times, waiting "backoff" seconds before the first retry
+    and doubling the wait before each next one.
+
+    If a "rate" is passed, requests to each host (including retries) are
+    limited by an AdaptiveRateLimiter starting at "rate" requests per second,
+    that goes up to "max_rate" while the host answers fast and without errors
+    and goes down when it slows down or fails. Limiters are shared by all
+    threads of a process.
+    """
+
+    # DATA
+    USER_AGENT = 'Chrome/16.0.912.77'
+    TIMEOUT = 30
+    RETRIES = 3
+    BACKOFF = 1.0
+    MAX_PER_HOST = 4
+    MAX_REDIRECTS = 5
+    REDIRECT_STATUS = (301, 302, 303, 307)
+    TRANSIENT_STATUS = (500, 502, 503, 504)
+    TRANSIENT_ERRORS = (socket.error, httplib.HTTPException)
+
+    def __init__(self, timeout=None, retries=None, backoff=None, rate=None,
+                 max_rate=None, max_per_host=None):
+
+        # session parameters
+        self.timeout = timeout or self.TIMEOUT
+        self.retries = self.RETRIES if retries is None else retries
+        self.backoff = self.BACKOFF if backoff is None else backoff
+        self.max_per_host = max_per_host or self.MAX_PER_HOST
+
+        # rate limiters of each host
+        self.rate = rate
+        self.max_rate = max_rate
+        self.rate_limiters = {}
+        self.lock = threading.Lock()
+
+        # idle connections and semaphores of each (scheme, host), of the
+        # process that opened them
+        self.pid = None
+        self.idle_connections = {}
+        self.host_semaphores = {}
+
+    # PUBLIC
+    def get(self, url, headers=None):
+        """Make a GET request and return a (status, headers, body) tuple.
+
+        Redirections are followed. Responses with status 2xx or 304 are
+        returned, any other one raises HttpError."""
+
+        for num_redirect in xrange(self.MAX_REDIRECTS + 1):
+            status, response_headers, body = self._get_with_retries(url,
+                                                                    headers)
+
+            if status not in self.REDIRECT_STATUS:
+                break
+
+            url = urljoin(url, response_headers.get("Location"))
+
+        if status >= 400 or status in self.REDIRECT_STATUS:
+            raise HttpError(url, status, "unexpected status")
+
+        return status, response_headers, body
+
+    def set_max_per_host(self, max_per_host):
+        """Set the cap of simultaneous requests (and connections) to each
+        host (requests already running keep the previous one)."""
+
+        with self.lock:
+            self.max_per_host = max_per_host
+            self.host_semaphores.clear()
+
+    def close(self):
+        """Close all idle connections."""
+
+        with self.lock:
+            for connections in self._get_idle_connections().values():
+                for connection in connections:
+                    connection.close()
+            self.idle_connections.clear()
+
+    # PRIVATE
+    def _get_with_retries(self, url, headers):
+
+        rate_limiter = self._get_rate_limiter(url)
+
+        for attempt in xrange(self.retries + 1):
+
+            # wait before retrying, longer each time
+            if attempt > 0:
+                get_metrics().add("retries")
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            if rate_limiter:
+                rate_limiter.acquire()
+            start = time.time()
+
+            try:
+                status, response_headers, body = self._request(url, headers)
+
+            except self.TRANSIENT_ERRORS as error:
+                last_error = HttpError(url, reason=repr(error))
+                if rate_limiter:
+                    rate_limiter.record(None, error=True)
+                continue
+
+            if status in self.TRANSIENT_STATUS:
+                last_error = HttpError(url, status, "server error")
+                if rate_limiter:
+                    rate_limiter.record(None, error=True)
+                continue
+
+            if rate_limiter:
+                rate_limiter.record(time.time() - start)
+
+            return status, response_headers, body
+
+        raise last_error
+
+    def _get_rate_limiter(self, url):
+        """Return the rate limiter of the host of an url, or None if rate is
+        not limited."""
+
+        if not self.rate:
+            return None
+
+        netloc = urlsplit(url).netloc
+        with self.lock:
+            if netloc not in self.rate_limiters:
+                self.rate_limiters[netloc] = AdaptiveRateLimiter(
+                    self.rate, max_rate=self.max_rate)
+
+            return self.rate_limiters[netloc]
+
+    def _request(self, url, headers):
+        """Make a single GET request over a persistent connection."""
+
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        if query:
+            path += "?" + query
+
+        request_headers = {"User-Agent": self.USER_AGENT,
+                           "Accept-Encoding": "gzip"}
+        request_headers.update(headers or {})
+
+        with self._get_host_semaphore(scheme, netloc):
+            connection = self._take_connection(scheme, netloc)
+
+            try:
+                connection.request("GET", path or "/",
+                                   headers=request_headers)
+                response = connection.getresponse()
+                body = response.read()
+
+            except:
+                # a broken connection can't be reused
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self._give_back_connection(scheme, netloc, connection)
+
+        # bytes downloaded, before decompressing them
+        get_metrics().add("bytes", len(body))
+
+        if response.getheader("Content-Encoding") == "gzip":
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+        return response.status, response.msg, body
+
+    def _get_idle_connections(self):
+        """Return the idle connections of this process (call it holding the
+        lock)."""
+
+        # connections opened before a fork belong to the parent process
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.idle_connections = {}
+            self.host_semaphores = {}
+
+        return self.idle_connections
+
+    def _get_host_semaphore(self, scheme, netloc):
+        """Return the semaphore that caps requests to a host."""
+
+        with self.lock:
+            self._get_idle_connections()
+
+            if (scheme, netloc) not in self.host_semaphores:
+                self.host_semaphores[(scheme, netloc)] = \
+                    threading.BoundedSemaphore(self.max_per_host)
+
+            return self.host_semaphores[(scheme, netloc)]
+
+    def _take_connection(self, scheme, netloc):
+        """Take an idle connection to a host, or open a new one."""
+
+        with self.lock:
+            connections = self._get_idle_connections().get((scheme, netloc))
+            if connections:
+                return connections.pop()
+
+        if scheme == "https":
+            connection_class = httplib.HTTPSConnection
+        else:
+            connection_class = httplib.HTTPConnection
+
+        return connection_class(netloc, timeout=self.timeout)
+
+    def _give_back_connection(self, scheme, netloc, connection):
+        with self.lock:
+            self._get_idle_connections().setdefault(
+                (scheme, netloc), []).append(connection)
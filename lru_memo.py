@@ -0,0 +1,125 @@
+import threading
+from collections import OrderedDict
+
+
+class LruMemo():
+    """Thread safe memo of computed values, bounded to "max_size" keys.
+
+    When it is full, the least recently used key is dropped. Hits and misses
+    are counted to report how many computations were saved.
+    """
+
+    # DATA
+    MAX_SIZE = 4096
+
+    def __init__(self, max_size=None):
+
+        self.max_size = max_size or self.MAX_SIZE
+        self.values = OrderedDict()
+
+        # events of the keys being computed, set once they are computed
+        self.computing = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    # PUBLIC
+    def get(self, key, compute):
+        """Return the value of a key, calling "compute" with the key only if
+        it is not in the memo.
+
+        A thread asking for a key being computed by other one waits for its
+        value instead of computing it again."""
+
+        with self.lock:
+            if key in self.values:
+                self.hits += 1
+
+                # move key to the end, as the most recently used
+                value = self.values.pop(key)
+                self.values[key] = value
+                return value
+
+            computing = self.computing.get(key)
+            owner = computing is None
+            if owner:
+                self.misses += 1
+                computing = self.computing[key] = threading.Event()
+            else:
+                self.hits += 1
+
+        # wait for the thread computing the key
+        if not owner:
+            computing.wait()
+            with self.lock:
+                if key in self.values:
+                    return self.values[key]
+
+            # the other thread failed, compute it here
+            return compute(key)
+
+        # compute outside the lock, so other keys can be got meanwhile
+        try:
+            value = compute(key)
+
+            with self.lock:
+                self._store(key, value)
+
+        finally:
+            with self.lock:
+                del self.computing[key]
+            computing.set()
+
+        return value
+
+    def peek(self, key):
+        """Return a (found, value) tuple for a key, without computing it.
+
+        Found keys are counted as hits (and marked as recently used), keys
+        not found are not counted: they should be "put" once computed."""
+
+        with self.lock:
+            if key not in self.values:
+                return False, None
+
+            self.hits += 1
+            value = self.values.pop(key)
+            self.values[key] = value
+            return True, value
+
+    def put(self, key, value):
+        """Store the value of a key computed after "peek", counting a miss."""
+
+        with self.lock:
+            self.misses += 1
+            self._store(key, value)
+
+    def pop_counters(self):
+        """Return (hits, misses) counted since the last call and reset them."""
+
+        with self.lock:
+            counters = self.hits, self.misses
+            self.hits = self.misses = 0
+
+        return counters
+
+    def add_counters(self, counters):
+        """Add (hits, misses) counted by a memo of other process."""
+
+        with self.lock:
+            self.hits += counters[0]
+            self.misses += counters[1]
+
+    def clear(self):
+        """Remove all values and reset counters."""
+
+        with self.lock:
+            self.values.clear()
+            self.hits = self.misses = 0
+
+    # PRIVATE
+    def _store(self, key, value):
+        self.values[key] = value
+        while len(self.values) > self.max_size:
+            self.values.popitem(last=False)
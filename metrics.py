@@ -0,0 +1,127 @@
+"""Metrics of the time spent and the work done by each scraped unit.
+
+A unit is a (year, road) tuple. Every process has a ScrapeMetrics object
+(returned by get_metrics) where fetches, parsers and writers add their
+metrics, to the unit being scraped by the process unless other is passed.
+Year index pages are added to a (year, None) unit, or to a (None, None) one
+when index pages of many years are fetched at the same time by threads.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class ScrapeMetrics():
+    """Thread safe store of the metrics of each scraped unit."""
+
+    # DATA
+    FIELDS = ["fetch_seconds", "parse_seconds", "records_seconds",
+              "write_seconds", "pages", "bytes", "retries", "records"]
+
+    def __init__(self):
+
+        self.units = OrderedDict()
+        self.unit = (None, None)
+        self.lock = threading.Lock()
+
+    # PUBLIC
+    def start_unit(self, year, road):
+        """Set the unit metrics are added to, when no other is passed."""
+        self.unit = (year, road)
+
+    def add(self, name, value=1, unit=None):
+        """Add a value to a metric of a unit (the current one by default)."""
+
+        unit = unit or self.unit
+
+        with self.lock:
+            if unit not in self.units:
+                self.units[unit] = OrderedDict.fromkeys(self.FIELDS, 0)
+            self.units[unit][name] += value
+
+    @contextmanager
+    def timer(self, name, unit=None):
+        """Add the seconds spent in a "with" block to a metric."""
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start, unit)
+
+    def pop_unit(self, year, road):
+        """Remove the metrics of a unit and return them (to send them from a
+        worker process to the one reporting them)."""
+
+        with self.lock:
+            return self.units.pop((year, road), None)
+
+    def add_unit(self, year, road, values):
+        """Add metrics of a unit returned by "pop_unit"."""
+
+        for name, value in values.iteritems():
+            self.add(name, value, (year, road))
+
+    def get_totals(self):
+        totals = OrderedDict.fromkeys(self.FIELDS, 0)
+
+        with self.lock:
+            for values in self.units.itervalues():
+                for name, value in values.iteritems():
+                    totals[name] += value
+
+        return totals
+
+    def clear(self):
+        with self.lock:
+            self.units.clear()
+            self.unit = (None, None)
+
+    def save_json(self, path):
+        """Save metrics of each unit and the totals in a json file."""
+
+        with self.lock:
+            units = [OrderedDict([("year", year), ("road", road)] +
+                                 values.items())
+                     for (year, road), values in self.units.iteritems()]
+
+        with open(path, "wb") as f:
+            json.dump(OrderedDict([("units", units),
+                                   ("totals", self.get_totals())]),
+                      f, indent=2)
+
+    def get_report(self):
+        """Return the lines of a table with the metrics of each unit."""
+
+        line = u"{:<6} {:<6} {:>8} {:>8} {:>8} {:>8} {:>6} {:>9} {:>5} {:>8}"
+        lines = [line.format("year", "road", "fetch s", "parse s",
+                             "recs s", "write s", "pages", "KB", "retry",
+                             "records")]
+
+        with self.lock:
+            rows = self.units.items()
+        rows.append((("total", ""), self.get_totals()))
+
+        for (year, road), values in rows:
+            lines.append(line.format(
+                year or "-", road or "-",
+                u"{:.2f}".format(values["fetch_seconds"]),
+                u"{:.2f}".format(values["parse_seconds"]),
+                u"{:.2f}".format(values["records_seconds"]),
+                u"{:.2f}".format(values["write_seconds"]),
+                values["pages"], u"{:.0f}".format(values["bytes"] / 1024.0),
+                values["retries"], values["records"]))
+
+        return lines
+
+
+# process wide metrics
+_metrics = ScrapeMetrics()
+
+
+def get_metrics():
+    """Return the ScrapeMetrics of this process."""
+    return _metrics
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""Diff of the records of two outputs, in any format.
+
+Records of each table are streamed from both outputs (see output_readers)
+and grouped in blocks of a road of a year, as they are written. A first pass
+computes a hash of each block, so blocks with the same records in both
+outputs are skipped without keeping them. A second pass spills the records
+of the blocks that differ to a temporary SQLite file, and then they are read
+back one block at a time, so only the records of a block of each output are
+kept in memory. Records of a block are matched by key (the year and section,
+and the detail table, variable and row of details records) to tell the
+records added, removed and changed.
+
+Values are compared as texts, so a number and the same number as a text
+(like 2010 and "2010") are equal, and so are empty cells and empty texts.
+With "normalize_numbers" (--normalize-numbers), numbers are written the same
+way whatever the format of the output: typed numbers of an output (like
+parquet ones, or typed runs) equal the same numbers written as texts in
+other one (46.92 and "46,92", see parse_written_number).
+
+write_delta saves the records that differ to other output, with the change
+of each one, as runs with a baseline do (see scrape_traffic_data).
+
+python output_diff.py previous.xlsx dnv_traffic_data.xlsx
+python output_diff.py previous.sqlite dnv_traffic_data.csv.gz --changes 50
+python output_diff.py previous.xlsx dnv_traffic_data.parquet --normalize-numbers
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from collections import OrderedDict
+from itertools import groupby
+from output_readers import iter_table_records
+from traffic_data import TrafficData
+from utils import parse_written_number
+
+# DATA
+ADDED, REMOVED, CHANGED = "added", "removed", "changed"
+CHANGE_FIELD = "cambio"
+
+# sides of the records spilled of blocks that differ
+OLD, NEW = 0, 1
+
+# fields identifying a record of each table, besides the year
+KEY_FIELDS = {TrafficData.WS_SIMPLE_TBL_NAME: ["id_tramo"],
+              TrafficData.WS_DETAILS_TBL_NAME: ["id_tramo", "id_tabla",
+                                                "variable", "fila"]}
+
+# indexes of the year and the KEY_FIELDS in the records of each table
+_KEY_INDEXES = {table_name: [fields.index(field) for field
+                             in ["Anio"] + KEY_FIELDS[table_name]]
+                for table_name, fields in TrafficData.get_tables().items()}
+
+
+class TableDiff():
+    """Counts of the differences of a table between two outputs."""
+
+    def __init__(self, table_name):
+
+        self.table_name = table_name
+
+        # blocks of (year, road) and records of both outputs
+        self.blocks = OrderedDict.fromkeys(["same", ADDED, REMOVED, CHANGED],
+                                           0)
+        self.records = OrderedDict.fromkeys(["old", "new", ADDED, REMOVED,
+                                             CHANGED], 0)
+
+    # PUBLIC
+    def is_same(self):
+        return not (self.records[ADDED] or self.records[REMOVED] or
+                    self.records[CHANGED])
+
+    def get_report(self):
+        """Return a line with the counts of the table."""
+
+        return u"{}: {} -> {} records, {} added, {} removed, {} changed " \
+            u"({} of {} road blocks differ)".format(
+                self.table_name, self.records["old"], self.records["new"],
+                self.records[ADDED], self.records[REMOVED],
+                self.records[CHANGED], sum(self.blocks.values()) -
+                self.blocks["same"], sum(self.blocks.values()))
+
+
+def iter_changes(old_output, new_output, table_name, old_format=None,
+                 new_format=None, table_diff=None, in_scope=None,
+                 normalize_numbers=False):
+    """Generate the records of a table that differ between two outputs.
+
+    Generates (change, key, old_record, new_record) tuples, where change is
+    ADDED, REMOVED or CHANGED, key is the key of the record (see
+    get_record_key) followed by the number of records of its block with the
+    same key before it, and records are lists in the order of the fields of
+    the table (None for the side that doesn't have the record). Records come
+    in the order of the blocks of the new output, then the ones of blocks
+    removed. Counts are added to "table_diff" if one is passed.
+
+    If "in_scope" is passed, only blocks for which "in_scope(year, road)" is
+    True are compared (year and road as texts). If "normalize_numbers" is
+    True, numbers are compared by their value, typed or written as texts."""
+
+    table_diff = table_diff or TableDiff(table_name)
+
+    old_hashes = _get_block_hashes(old_output, table_name, old_format,
+                                   normalize_numbers)
+    new_hashes = _get_block_hashes(new_output, table_name, new_format,
+                                   normalize_numbers)
+
+    table_diff.records["old"] = sum(count for block_hash, count
+                                    in old_hashes.values())
+    table_diff.records["new"] = sum(count for block_hash, count
+                                    in new_hashes.values())
+
+    # blocks that differ, in the order of the new output
+    blocks = []
+    for block in new_hashes.keys() + [block for block in old_hashes
+                                      if block not in new_hashes]:
+        if in_scope and not in_scope(*block):
+            continue
+        elif block not in old_hashes:
+            table_diff.blocks[ADDED] += 1
+        elif block not in new_hashes:
+            table_diff.blocks[REMOVED] += 1
+        elif old_hashes[block] != new_hashes[block]:
+            table_diff.blocks[CHANGED] += 1
+        else:
+            table_diff.blocks["same"] += 1
+            continue
+        blocks.append(block)
+
+    if not blocks:
+        return
+
+    # spill only the records of blocks that differ
+    fd, spill_path = tempfile.mkstemp(suffix=".sqlite")
+    os.close(fd)
+    connection = sqlite3.connect(spill_path)
+
+    try:
+        _spill_block_records(connection, OLD, old_output, table_name,
+                             old_format, set(blocks))
+        _spill_block_records(connection, NEW, new_output, table_name,
+                             new_format, set(blocks))
+
+        for block in blocks:
+            old_block = _get_block_records(connection, OLD, table_name, block)
+            new_block = _get_block_records(connection, NEW, table_name, block)
+
+            for key, new_record in new_block.iteritems():
+                old_record = old_block.pop(key, None)
+
+                if old_record is None:
+                    table_diff.records[ADDED] += 1
+                    yield ADDED, key, None, new_record
+
+                elif (_get_texts(old_record, normalize_numbers) !=
+                      _get_texts(new_record, normalize_numbers)):
+                    table_diff.records[CHANGED] += 1
+                    yield CHANGED, key, old_record, new_record
+
+            for key, old_record in old_block.iteritems():
+                table_diff.records[REMOVED] += 1
+                yield REMOVED, key, old_record, None
+
+    finally:
+        connection.close()
+        os.remove(spill_path)
+
+
+def diff_outputs(old_output, new_output, old_format=None, new_format=None,
+                 max_changes=0, normalize_numbers=False):
+    """Return a TableDiff of each table of two outputs, and a list with the
+    first "max_changes" records that differ (see iter_changes)."""
+
+    table_diffs = OrderedDict()
+    changes = []
+
+    for table_name in TrafficData.get_tables():
+        table_diffs[table_name] = TableDiff(table_name)
+
+        for change in iter_changes(old_output, new_output, table_name,
+                                   old_format, new_format,
+                                   table_diffs[table_name],
+                                   normalize_numbers=normalize_numbers):
+            if len(changes) < max_changes:
+                changes.append((table_name,) + change)
+
+    return table_diffs, changes
+
+
+def write_delta(old_output, new_output, delta_output, old_format=None,
+                new_format=None, delta_format=None, in_scope=None,
+                normalize_numbers=False):
+    """Write the records that differ between two outputs to "delta_output"
+    (in any format), and return a TableDiff of each table.
+
+    Delta tables have the fields of the tables of TrafficData and
+    CHANGE_FIELD, with the change of each record (see iter_changes): new
+    records for ADDED and CHANGED, old records for REMOVED. A sqlite delta
+    keeps the changes of previous deltas written to it, like any sqlite
+    output."""
+
+    tables = OrderedDict((table_name, fields + [CHANGE_FIELD])
+                         for table_name, fields
+                         in TrafficData.get_tables().items())
+    delta_format = delta_format or TrafficData.get_output_format(delta_output)
+    sink = TrafficData.SINKS[delta_format](delta_output, tables)
+
+    table_diffs = OrderedDict()
+    for table_name in tables:
+        table_diffs[table_name] = TableDiff(table_name)
+
+        for change, key, old_record, new_record in iter_changes(
+                old_output, new_output, table_name, old_format, new_format,
+                table_diffs[table_name], in_scope, normalize_numbers):
+            sink.write(table_name, list(new_record or old_record) + [change])
+
+    sink.save()
+
+    return table_diffs
+
+
+def get_record_key(table_name, record):
+    """Return the key of a record of a table, as a tuple of texts: the year
+    and the KEY_FIELDS of the table."""
+
+    return tuple(_to_text(record[index])
+                 for index in _KEY_INDEXES[table_name])
+
+
+def get_block(table_name, record):
+    """Return the (year, road) block of a record, as texts."""
+
+    year_index, section_index = _KEY_INDEXES[table_name][:2]
+
+    return (_to_text(record[year_index]),
+            _to_text(record[section_index]).rsplit(u"_", 1)[0])
+
+
+def _get_block_hashes(output, table_name, output_format,
+                      normalize_numbers=False):
+    """Return an OrderedDict with a (hash, number of records) of each block
+    of a table, in the order of the output."""
+
+    hashes = OrderedDict()
+    counts = {}
+
+    records = iter_table_records(output, table_name, output_format)
+    for block, block_records in groupby(
+            records, lambda record: get_block(table_name, record)):
+
+        # a block may come in many runs of records
+        if block not in hashes:
+            hashes[block] = hashlib.sha1()
+            counts[block] = 0
+
+        for record in block_records:
+            hashes[block].update(
+                u"\x1f".join(_get_texts(record, normalize_numbers))
+                .encode("utf-8") + "\x1e")
+            counts[block] += 1
+
+    return OrderedDict((block, (block_hash.hexdigest(), counts[block]))
+                       for block, block_hash in hashes.iteritems())
+
+
+def _spill_block_records(connection, side, output, table_name,
+                         output_format, blocks):
+    """Store the records of some blocks of a table of an output in the
+    spill database, as json, in the order of the output."""
+
+    connection.execute("CREATE TABLE IF NOT EXISTS records (side INTEGER, "
+                       "year TEXT, road TEXT, record TEXT)")
+
+    records = iter_table_records(output, table_name, output_format)
+    rows = ((side,) + get_block(table_name, record) + (json.dumps(record),)
+            for record in records if get_block(table_name, record) in blocks)
+
+    with connection:
+        connection.executemany("INSERT INTO records VALUES (?, ?, ?, ?)",
+                               rows)
+        connection.execute("CREATE INDEX IF NOT EXISTS records_block ON "
+                           "records (side, year, road)")
+
+
+def _get_block_records(connection, side, table_name, block):
+    """Return the records of a block of one side of the spill database, in
+    an OrderedDict of records by key."""
+
+    block_records = OrderedDict()
+
+    cursor = connection.execute(
+        "SELECT record FROM records WHERE side = ? AND year = ? AND "
+        "road = ? ORDER BY rowid", (side,) + block)
+
+    for row in cursor:
+        record = json.loads(row[0])
+
+        # records with the same key are told apart by their order
+        key = get_record_key(table_name, record)
+        num_key = 0
+        while key + (num_key,) in block_records:
+            num_key += 1
+        block_records[key + (num_key,)] = record
+
+    return block_records
+
+
+def _get_texts(record, normalize_numbers=False):
+    return [_to_text(value, normalize_numbers) for value in record]
+
+
+def _to_text(value, normalize_numbers=False):
+    """Return a value as a text, with integer numbers without decimals. If
+    "normalize_numbers", numbers written as texts are parsed as well, and
+    written as integers without decimals or as the repr of floats."""
+
+    if value is None:
+        return u""
+
+    if normalize_numbers:
+        number = parse_written_number(value)
+    elif isinstance(value, float):
+        number = value
+    else:
+        number = None
+
+    if number is None:
+        return unicode(value)
+
+    if number.is_integer():
+        return unicode(int(number))
+    return repr(number).decode("ascii")
+
+
+def parse_args(args=None):
+
+    parser = argparse.ArgumentParser(
+        description="Print the records added, removed and changed between "
+        "two outputs.")
+
+    parser.add_argument("old_output", help="previous output, in any format")
+    parser.add_argument("new_output", help="new output, in any format")
+    parser.add_argument("--old-format", default=None,
+                        choices=TrafficData.SINKS.keys(),
+                        help="format of the previous output (by default, "
+                        "taken from its extension)")
+    parser.add_argument("--new-format", default=None,
+                        choices=TrafficData.SINKS.keys(),
+                        help="format of the new output (by default, taken "
+                        "from its extension)")
+    parser.add_argument("--changes", type=int, default=20,
+                        help="records that differ to be printed")
+    parser.add_argument("--normalize-numbers", action="store_true",
+                        help="compare numbers by their value, typed or "
+                        "written as texts (\"46,92\" equals 46.92)")
+
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    table_diffs, changes = diff_outputs(args.old_output, args.new_output,
+                                        args.old_format, args.new_format,
+                                        args.changes, args.normalize_numbers)
+
+    for table_diff in table_diffs.values():
+        print table_diff.get_report()
+
+    for table_name, change, key, old_record, new_record in changes:
+        print u"{} {} {}: {} -> {}".format(
+            table_name, change, u" ".join(key[:-1]), old_record,
+            new_record).encode("utf-8")
+
+    # differences are an error, to be used in regression checks
+    if not all(table_diff.is_same() for table_diff in table_diffs.values()):
+        sys.exit(1)
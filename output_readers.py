@@ -0,0 +1,154 @@
+"""Readers of the outputs written by TrafficData sinks.
+
+Records of a table are read back from any output format as lists in the
+order of the fields of the table (see TrafficData.get_tables), so outputs can
+be queried and compared whatever their format. Fields missing in the output
+are read as None. Texts of csv outputs are read as they were written (typed
+numbers as texts with a decimal dot).
+"""
+
+import csv
+import gzip
+import json
+import sqlite3
+from openpyxl import load_workbook
+from traffic_data import TrafficData
+from sinks import SqliteSink
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# DATA
+# bytes of a zstd file decompressed at a time
+READ_SIZE = 1024 * 1024
+
+
+def iter_table_records(output, table_name, output_format=None):
+    """Generate the records of a table of an output, as lists in the order
+    of the fields of the table.
+
+    The format is taken from the extension of the output if no
+    "output_format" is passed (see TrafficData.get_output_format)."""
+
+    output_format = output_format or TrafficData.get_output_format(output)
+    sink_class = TrafficData.SINKS[output_format]
+    fields = TrafficData.get_tables()[table_name]
+
+    if output_format == "xlsx":
+        rows_by_header = _iter_excel_rows(output, table_name)
+    elif output_format == "parquet":
+        rows_by_header = _iter_parquet_rows(
+            sink_class.get_table_path(output, table_name))
+    elif output_format == "sqlite":
+        rows_by_header = _iter_sqlite_rows(output, table_name, fields)
+    elif sink_class.EXTENSION.startswith(".csv"):
+        rows_by_header = _iter_csv_rows(
+            sink_class.get_table_path(output, table_name),
+            sink_class.COMPRESSION)
+    else:
+        rows_by_header = _iter_ndjson_rows(
+            sink_class.get_table_path(output, table_name),
+            sink_class.COMPRESSION, fields)
+
+    for header, rows in rows_by_header:
+        indexes = [header.index(field) if field in header else None
+                   for field in fields]
+
+        for row in rows:
+            yield [None if index is None else row[index]
+                   for index in indexes]
+
+
+def _iter_excel_rows(output, table_name):
+    """Generate (header, rows) of each sheet of a table (a full sheet goes
+    on in others, like "ver_detalle_2")."""
+
+    wb = load_workbook(output, use_iterators=True)
+
+    for ws in wb.worksheets:
+        title = ws.title
+        if not (title == table_name or (
+                title.startswith(table_name + "_") and
+                title[len(table_name) + 1:].isdigit())):
+            continue
+
+        rows = ([cell.value for cell in row] for row in ws.iter_rows())
+        header = next(rows, None)
+        if header is not None:
+            yield header, rows
+
+
+def _iter_parquet_rows(path):
+
+    if not pyarrow:
+        raise ImportError("pyarrow is needed to read parquet files")
+
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    header = parquet_file.schema.names
+
+    for num_row_group in xrange(parquet_file.num_row_groups):
+        columns = parquet_file.read_row_group(num_row_group).to_pydict()
+        yield header, zip(*[columns[name] for name in header])
+
+
+def _iter_sqlite_rows(output, table_name, fields):
+
+    connection = sqlite3.connect(output)
+    try:
+        cursor = connection.execute("SELECT {} FROM {} ORDER BY rowid".format(
+            ", ".join(SqliteSink._quote(field) for field in fields),
+            SqliteSink._quote(table_name)))
+        yield fields, cursor
+    finally:
+        connection.close()
+
+
+def _iter_csv_rows(path, compression):
+
+    lines = _iter_lines(path, compression)
+    rows = ([value.decode("utf-8") for value in row]
+            for row in csv.reader(lines))
+
+    header = next(rows, None)
+    if header is not None:
+        yield header, rows
+
+
+def _iter_ndjson_rows(path, compression, fields):
+
+    rows = ([record.get(field) for field in fields]
+            for record in (json.loads(line)
+                           for line in _iter_lines(path, compression)))
+    yield fields, rows
+
+
+def _iter_lines(path, compression):
+    """Generate the lines of a compressed file (see StreamSink)."""
+
+    if compression != "zstd":
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                yield line
+        return
+
+    if not zstandard:
+        raise ImportError("zstandard is needed to read zstd files")
+
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    pending = ""
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), ""):
+            lines = (pending + decompressor.decompress(chunk)).split("\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line + "\n"
+
+    if pending:
+        yield pending
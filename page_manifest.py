@@ -0,0 +1,91 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from utils import get_thread_connection
+
+
+class PageManifest():
+    """Manifest of the pages parsed in previous runs, stored in SQLite.
+
+    For each url it keeps the sha1 of the body parsed and the data extracted
+    from it (as json), so a page whose body didn't change since it was
+    parsed is never parsed again: its data is taken from the manifest.
+
+    Each thread of each process uses its own connection, and every stored
+    page is committed at once, so many workers can share a manifest.
+    """
+
+    # DATA
+    TABLE_NAME = "pages"
+    TIMEOUT = 60
+
+    def __init__(self, manifest_path):
+
+        self.manifest_path = manifest_path
+        self.local = threading.local()
+
+        # counters of pages parsed and reused in this process
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        with self._get_connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} (url TEXT PRIMARY KEY, "
+                "hash TEXT, data TEXT)".format(self.TABLE_NAME))
+
+    # PUBLIC
+    def get_data(self, url, body, parse):
+        """Return the data parsed from the body of an url.
+
+        If the body is the same than the last time the url was parsed, the
+        stored data is returned. Otherwise it is parsed calling "parse" with
+        the body, and the data returned (which must be serializable to json)
+        is stored."""
+
+        body_hash = self.get_hash(body)
+
+        row = self._get_connection().execute(
+            "SELECT hash, data FROM {} WHERE url = ?".format(self.TABLE_NAME),
+            (url,)).fetchone()
+
+        if row and row[0] == body_hash:
+            self._count(hit=True)
+            # keep the order of dicts, records are generated in that order
+            return json.loads(row[1], object_pairs_hook=OrderedDict)
+
+        self._count(hit=False)
+        data = parse(body)
+
+        with self._get_connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO {} (url, hash, data) "
+                "VALUES (?, ?, ?)".format(self.TABLE_NAME),
+                (url, body_hash, json.dumps(data)))
+
+        return data
+
+    @classmethod
+    def get_hash(cls, body):
+        if isinstance(body, unicode):
+            body = body.encode("utf-8")
+        return hashlib.sha1(body).hexdigest()
+
+    def clear(self):
+        """Remove all pages of the manifest."""
+
+        with self._get_connection() as connection:
+            connection.execute("DELETE FROM {}".format(self.TABLE_NAME))
+
+    # PRIVATE
+    def _get_connection(self):
+        return get_thread_connection(self.local, self.manifest_path,
+                                     timeout=self.TIMEOUT)
+
+    def _count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
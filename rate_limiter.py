@@ -0,0 +1,121 @@
+import threading
+import time
+
+
+class AdaptiveRateLimiter():
+    """Token bucket limiting the requests per second made to a host, with a
+    rate adapted to the health of the server (AIMD).
+
+    Every request takes a token from the bucket, which is refilled at "rate"
+    tokens per second and holds up to a second of them. After each request
+    the rate is increased by INCREASE requests per second each second
+    (additive increase) while the server answers fine, and it is multiplied
+    by DECREASE (multiplicative decrease) when a request fails or its latency
+    goes over LATENCY_FACTOR times the lowest latency seen (and at least
+    MIN_SLOW_LATENCY). The rate is decreased at most once per COOLDOWN
+    seconds, so a burst of failures of requests made at the same time
+    counts once.
+
+    The bucket is shared by the threads of a process only, each worker
+    process has its own one.
+    """
+
+    # DATA
+    MIN_RATE = 0.5
+    MAX_RATE = 50.0
+    INCREASE = 1.0
+    DECREASE = 0.5
+    LATENCY_FACTOR = 4.0
+    MIN_SLOW_LATENCY = 1.0
+    COOLDOWN = 2.0
+    # weight of the last request in the smoothed latency
+    SMOOTHING = 0.2
+
+    def __init__(self, rate, min_rate=None, max_rate=None):
+
+        self.min_rate = min_rate or self.MIN_RATE
+        self.max_rate = max(max_rate or self.MAX_RATE, rate)
+        self.rate = float(rate)
+
+        self.tokens = 1.0
+        self.last_refill = time.time()
+        self.last_decrease = 0.0
+
+        # smoothed latency of last requests and the lowest one seen
+        self.latency = None
+        self.base_latency = None
+
+        self.lock = threading.Lock()
+
+    # PUBLIC
+    def acquire(self):
+        """Wait until a request can be made."""
+
+        wait = self.get_wait()
+        while wait:
+            time.sleep(wait)
+            wait = self.get_wait()
+
+    def get_wait(self):
+        """Take a token and return 0 if a request can be made now, or return
+        the seconds to wait before asking again (for callers that can't
+        block, like coroutines)."""
+
+        with self.lock:
+            self._refill()
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+    def record(self, latency, error=False):
+        """Adapt the rate to the latency (in seconds) of a request, and to
+        whether it failed."""
+
+        with self.lock:
+            if latency is not None and not error:
+                self._update_latency(latency)
+
+            if error or self._is_slow(latency):
+                self._decrease()
+            else:
+                # add INCREASE to the rate after a second of requests
+                self.rate = min(self.max_rate,
+                                self.rate + self.INCREASE / self.rate)
+
+    # PRIVATE
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(max(self.rate, 1.0), self.tokens + (
+            now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _update_latency(self, latency):
+
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.SMOOTHING * (latency - self.latency)
+
+        if self.base_latency is None or self.latency < self.base_latency:
+            self.base_latency = self.latency
+
+    def _is_slow(self, latency):
+
+        if latency is None or self.base_latency is None:
+            return False
+
+        return latency > max(self.MIN_SLOW_LATENCY,
+                             self.LATENCY_FACTOR * self.base_latency)
+
+    def _decrease(self):
+
+        now = time.time()
+        if now - self.last_decrease < self.COOLDOWN:
+            return
+
+        self.rate = max(self.min_rate, self.rate * self.DECREASE)
+        self.tokens = min(self.tokens, 1.0)
+        self.last_decrease = now
@@ -0,0 +1,115 @@
+import json
+import os
+from collections import OrderedDict
+from multiprocessing.dummy import Pool as ThreadPool
+
+
+class RoadCatalogue():
+    """Catalogue of the roads of each year and the urls of their pages.
+
+    Years are discovered by scraping their index pages, many at the same
+    time, and can be saved to a json file to be reused by later runs. The
+    roads of each year keep the order of the index page.
+    """
+
+    def __init__(self, catalogue_path=None):
+
+        self.catalogue_path = catalogue_path
+
+        # road links of each year, by year as text
+        self.years = OrderedDict()
+
+        if catalogue_path and os.path.isfile(catalogue_path):
+            self._load()
+
+    # PUBLIC
+    def has_year(self, year):
+        return str(year) in self.years
+
+    def get_road_links(self, year):
+        """Return an ordered dict with the url of each road of a year."""
+        return self.years[str(year)]
+
+    def add_year(self, year, road_links):
+        """Add the road links of a year, as returned by scrape_road_links."""
+        self.years[str(year)] = OrderedDict(road_links.items())
+
+    def get_missing_years(self, years):
+        """Return the years passed that are not in the catalogue yet."""
+        return [year for year in years if not self.has_year(year)]
+
+    def discover(self, years, scrape_year, workers=1):
+        """Add the years missing in the catalogue, calling "scrape_year" with
+        each of them (from "workers" threads) to get its road links.
+
+        The catalogue is saved afterwards, if it has a path."""
+
+        missing_years = self.get_missing_years(years)
+        if not missing_years:
+            return
+
+        if workers > 1 and len(missing_years) > 1:
+            pool = ThreadPool(min(workers, len(missing_years)))
+            try:
+                all_road_links = pool.map(scrape_year, missing_years)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            all_road_links = map(scrape_year, missing_years)
+
+        for year, road_links in zip(missing_years, all_road_links):
+            self.add_year(year, road_links)
+
+        if self.catalogue_path:
+            self.save()
+
+    def iter_jobs(self, years, roads=None):
+        """Generate (year, road, road_links) of each road of each year.
+
+        If roads are passed, only those are generated, in the same order,
+        for the years that have them. Otherwise all roads of each year."""
+
+        for year in years:
+            road_links = self.get_road_links(year)
+
+            for road in roads or road_links.keys():
+                if road not in road_links:
+                    print "Road not found: ", road, " at year: ", year
+                    continue
+
+                yield year, road, road_links
+
+    def get_plan(self, years, roads=None):
+        """Return the lines of a table with the roads of each year."""
+
+        lines = []
+        for year in years:
+            year_roads = [road for job_year, road, road_links
+                          in self.iter_jobs([year], roads)]
+            lines.append(u"{}: {} roads ({})".format(
+                year, len(year_roads), u", ".join(year_roads)))
+
+        return lines
+
+    def save(self, catalogue_path=None):
+        """Save the catalogue to a json file, with roads in order."""
+
+        catalogue_path = catalogue_path or self.catalogue_path
+        tmp_path = catalogue_path + ".tmp"
+
+        with open(tmp_path, "wb") as f:
+            json.dump(OrderedDict(
+                (year, road_links.items())
+                for year, road_links in self.years.iteritems()), f, indent=1)
+
+        os.rename(tmp_path, catalogue_path)
+
+    # PRIVATE
+    def _load(self):
+
+        with open(self.catalogue_path, "rb") as f:
+            years = json.load(f, object_pairs_hook=OrderedDict)
+
+        for year, road_links in years.iteritems():
+            self.years[year] = OrderedDict(road_links)
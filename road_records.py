@@ -0,0 +1,124 @@
+from array import array
+
+
+class RoadRecords():
+    """Compact store of the (table, record) tuples of a road of a year.
+
+    Records of "details_table" are kept by columns: their texts (sections,
+    tables, variables and values, which repeat a lot across records) as
+    codes of a table of distinct texts, and their rows as integers, both in
+    arrays. Records of other tables (the few simple ones of a road) are kept
+    as they are, and must come before the details ones, like the records of
+    RoadScraper.iter_records.
+
+    The year is kept once instead of being added to each record. Iterating
+    the store generates (table, record) tuples with the year added at the end
+    of each record, like iter_road_records. It is pickled with its arrays as
+    strings of bytes, to be sent cheaply from worker processes, and turned
+    into a dict of lists (see to_dict) to be published as json.
+    """
+
+    # DATA
+    TEXT_COLUMNS = [0, 1, 2, 4]
+    ROW_COLUMN = 3
+
+    def __init__(self, year, details_table, records=()):
+
+        self.year = year
+        self.details_table = details_table
+
+        # (table, record) tuples of other tables
+        self.rows = []
+
+        # distinct texts of details records and their codes
+        self.texts = []
+        self.codes = {}
+
+        # codes of each text column of details records, and their rows
+        self.columns = [array("i") for column in self.TEXT_COLUMNS]
+        self.num_rows = array("i")
+
+        self.extend(records)
+
+    # PUBLIC
+    def add(self, table, record):
+        """Add a record of a table (without the year)."""
+
+        if table != self.details_table:
+            if self.num_rows:
+                raise ValueError("Records of {} must be added before the "
+                                 "details ones".format(table))
+            self.rows.append((table, record))
+            return
+
+        for column, index in zip(self.columns, self.TEXT_COLUMNS):
+            column.append(self._get_code(record[index]))
+        self.num_rows.append(record[self.ROW_COLUMN])
+
+    def extend(self, records):
+        for table, record in records:
+            self.add(table, record)
+
+    def __len__(self):
+        return len(self.rows) + len(self.num_rows)
+
+    def __iter__(self):
+
+        for table, record in self.rows:
+            yield table, record + [self.year]
+
+        texts = self.texts
+        sections, tables, variables, values = self.columns
+        for index, num_row in enumerate(self.num_rows):
+            yield self.details_table, [texts[sections[index]],
+                                       texts[tables[index]],
+                                       texts[variables[index]], num_row,
+                                       texts[values[index]], self.year]
+
+    def to_dict(self):
+        """Return the store as a dict that can be serialized to json."""
+
+        return {"year": self.year, "details_table": self.details_table,
+                "rows": self.rows, "texts": self.texts,
+                "columns": [column.tolist() for column in self.columns],
+                "num_rows": self.num_rows.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return the store of a dict returned by to_dict."""
+
+        road_records = cls(data["year"], data["details_table"])
+        road_records.rows = [(table, record)
+                             for table, record in data["rows"]]
+        road_records.texts = data["texts"]
+        road_records.codes = {text: code for code, text
+                              in enumerate(road_records.texts)}
+        road_records.columns = [array("i", column)
+                                for column in data["columns"]]
+        road_records.num_rows = array("i", data["num_rows"])
+
+        return road_records
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["codes"]
+        state["columns"] = [column.tostring() for column in self.columns]
+        state["num_rows"] = self.num_rows.tostring()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.columns = [array("i", column) for column in state["columns"]]
+        self.num_rows = array("i", state["num_rows"])
+        self.codes = {text: code for code, text in enumerate(self.texts)}
+
+    # PRIVATE
+    def _get_code(self, text):
+
+        code = self.codes.get(text)
+        if code is None:
+            code = len(self.texts)
+            self.codes[text] = code
+            self.texts.append(text)
+
+        return code
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""Queries of the sections of a road by kilometre, across years.
+
+Section ids ("0040_1") are given by the position of the section in the road
+page of each year, so the same stretch of a road may have different ids in
+different years. A SectionIndex loads the sections of an output (in any
+format, see output_readers) into an interval tree of each road, keyed by
+their kilometres ("Ini" and "Fin"), to find the sections of any year that
+overlap a stretch of a road without scanning the output again.
+
+python section_query.py dnv_traffic_data.xlsx 0040 394 470
+python section_query.py dnv_traffic_data.sqlite 0040 394 470 \
+    --details clasificacion
+"""
+
+import argparse
+from collections import OrderedDict
+from output_readers import iter_table_records
+from traffic_data import TrafficData
+from utils import parse_integer, parse_written_number
+
+
+class IntervalTree():
+    """Static centered interval tree of (start, end, item) closed intervals.
+
+    Each node keeps the intervals that contain its center, sorted by start
+    and by end, and the intervals before and after the center in its left
+    and right nodes, so a query visits O(log n) nodes plus the intervals it
+    returns.
+    """
+
+    def __init__(self, intervals):
+
+        intervals = list(intervals)
+        self.center = None
+        self.left = None
+        self.right = None
+        self.by_start = []
+        self.by_end = []
+
+        if not intervals:
+            return
+
+        points = sorted(point for start, end, item in intervals
+                        for point in (start, end))
+        self.center = points[len(points) / 2]
+
+        left, right, middle = [], [], []
+        for interval in intervals:
+            if interval[1] < self.center:
+                left.append(interval)
+            elif interval[0] > self.center:
+                right.append(interval)
+            else:
+                middle.append(interval)
+
+        self.by_start = sorted(middle, key=lambda interval: interval[0])
+        self.by_end = sorted(middle, key=lambda interval: interval[1],
+                             reverse=True)
+
+        if left:
+            self.left = IntervalTree(left)
+        if right:
+            self.right = IntervalTree(right)
+
+    # PUBLIC
+    def query(self, start, end):
+        """Return the items of the intervals that overlap [start, end]."""
+
+        items = []
+        nodes = [self]
+        while nodes:
+            node = nodes.pop()
+            if node.center is None:
+                continue
+
+            if end < node.center:
+                for interval in node.by_start:
+                    if interval[0] > end:
+                        break
+                    items.append(interval[2])
+                if node.left:
+                    nodes.append(node.left)
+
+            elif start > node.center:
+                for interval in node.by_end:
+                    if interval[1] < start:
+                        break
+                    items.append(interval[2])
+                if node.right:
+                    nodes.append(node.right)
+
+            else:
+                items.extend(interval[2] for interval in node.by_start)
+                if node.left:
+                    nodes.append(node.left)
+                if node.right:
+                    nodes.append(node.right)
+
+        return items
+
+
+class SectionIndex():
+    """Index of the sections of each road of an output by kilometre.
+
+    Sections are kept as dicts with the fields of the simple table, with
+    "Ini", "Fin", "TMDA" and "Anio" as numbers, and the road in "road".
+    Sections without kilometres can't be indexed and are skipped.
+
+    Records of the detail tables in "details_tables" (like "clasificacion")
+    are kept too, by year and section, as (id_tabla, variable, fila, valor)
+    tuples. Other detail tables are not loaded.
+    """
+
+    # DATA
+    SIMPLE_TBL_NAME = TrafficData.WS_SIMPLE_TBL_NAME
+    DETAILS_TBL_NAME = TrafficData.WS_DETAILS_TBL_NAME
+
+    def __init__(self, output=None, output_format=None, details_tables=None):
+
+        self.details_tables = set(details_tables or [])
+
+        # sections of each road, and their interval trees (built on demand)
+        self.sections = {}
+        self.trees = {}
+
+        # details records by (year, id_tramo)
+        self.details = {}
+
+        if output:
+            self.load(output, output_format)
+
+    # PUBLIC
+    def load(self, output, output_format=None):
+        """Load the sections (and the details asked) of an output."""
+
+        fields = TrafficData.get_simple_tbl_fields()
+        for record in iter_table_records(output, self.SIMPLE_TBL_NAME,
+                                         output_format):
+            self.add_section(dict(zip(fields, record)))
+
+        if self.details_tables:
+            for record in iter_table_records(output, self.DETAILS_TBL_NAME,
+                                             output_format):
+                self.add_detail(*record)
+
+    def add_section(self, section):
+        """Add a section, a dict with the fields of the simple table."""
+
+        start, end = _to_km(section["Ini"]), _to_km(section["Fin"])
+        if start is None or end is None:
+            return
+
+        section["Ini"], section["Fin"] = min(start, end), max(start, end)
+        section["TMDA"] = parse_integer(section["TMDA"])
+        section["Anio"] = int(section["Anio"])
+        section["road"] = section["id_tramo"].rsplit("_", 1)[0]
+
+        self.sections.setdefault(section["road"], []).append(section)
+        self.trees.pop(section["road"], None)
+
+    def add_detail(self, id_tramo, id_tabla, variable, fila, valor, year):
+        """Add a details record, if its table is one of "details_tables"."""
+
+        if id_tabla in self.details_tables:
+            self.details.setdefault((int(year), id_tramo), []).append(
+                (id_tabla, variable, fila, valor))
+
+    def get_roads(self):
+        return sorted(self.sections.keys())
+
+    def query(self, road, start_km, end_km, years=None):
+        """Return the sections of a road that overlap a stretch of it (from
+        "start_km" to "end_km"), sorted by year and kilometre.
+
+        Sections that just touch the stretch at one end are not returned,
+        unless the stretch is a single kilometre point."""
+
+        if road not in self.trees:
+            self.trees[road] = IntervalTree(
+                (section["Ini"], section["Fin"], section)
+                for section in self.sections.get(road, []))
+
+        start_km, end_km = min(start_km, end_km), max(start_km, end_km)
+        years = set(int(year) for year in years) if years else None
+
+        sections = []
+        for section in self.trees[road].query(start_km, end_km):
+            if years and section["Anio"] not in years:
+                continue
+            if (self.get_overlap(section, start_km, end_km) > 0 or
+                    start_km == end_km or section["Ini"] == section["Fin"]):
+                sections.append(section)
+
+        return sorted(sections, key=lambda section: (section["Anio"],
+                                                     section["Ini"]))
+
+    def get_series(self, road, start_km, end_km, years=None):
+        """Return an OrderedDict with the sections of each year that overlap
+        a stretch of a road (see query)."""
+
+        series = OrderedDict()
+        for section in self.query(road, start_km, end_km, years):
+            series.setdefault(section["Anio"], []).append(section)
+
+        return series
+
+    def get_details(self, year, id_tramo, id_tabla=None):
+        """Return (id_tabla, variable, fila, valor) tuples of a section."""
+
+        return [detail for detail in self.details.get((int(year), id_tramo),
+                                                      [])
+                if not id_tabla or detail[0] == id_tabla]
+
+    def align_section(self, section):
+        """Return an OrderedDict with the section of each other year that
+        overlaps the most the kilometres of a section, and the fraction of
+        the section it covers, as (section, fraction) tuples."""
+
+        length = section["Fin"] - section["Ini"]
+
+        aligned = OrderedDict()
+        for year, sections in self.get_series(
+                section["road"], section["Ini"], section["Fin"]).items():
+            if year == section["Anio"]:
+                continue
+
+            best = max(sections, key=lambda other: self.get_overlap(
+                other, section["Ini"], section["Fin"]))
+            overlap = self.get_overlap(best, section["Ini"], section["Fin"])
+            aligned[year] = (best, overlap / length if length else 1.0)
+
+        return aligned
+
+    @classmethod
+    def get_overlap(cls, section, start_km, end_km):
+        """Return the kilometres of a section between start_km and end_km."""
+        return max(0.0, min(section["Fin"], end_km) -
+                   max(section["Ini"], start_km))
+
+
+def _to_km(value):
+    """Parse a kilometre, as it is written in any output (see
+    parse_written_number)."""
+    return parse_written_number(value)
+
+
+def parse_args(args=None):
+
+    parser = argparse.ArgumentParser(
+        description="Print the sections of a road between two kilometres "
+        "in each year of an output.")
+
+    parser.add_argument("output", help="output of dnv_scraper, in any format")
+    parser.add_argument("road", help="road, like 0040")
+    parser.add_argument("start_km", type=float, help="first kilometre")
+    parser.add_argument("end_km", type=float, help="last kilometre")
+    parser.add_argument("--years", default=None,
+                        help="years separated by commas (all by default)")
+    parser.add_argument("--details", default=None,
+                        help="detail tables to print for each section, "
+                        "separated by commas (like clasificacion)")
+    parser.add_argument("--format", dest="output_format", default=None,
+                        choices=TrafficData.SINKS.keys(),
+                        help="format of the output (by default, taken from "
+                        "the extension of the output)")
+
+    args = parser.parse_args(args)
+
+    if args.years:
+        args.years = args.years.split(",")
+
+    if args.details:
+        args.details = args.details.split(",")
+
+    return args
+
+
+if __name__ == '__main__':
+
+    args = parse_args()
+    index = SectionIndex(args.output, args.output_format, args.details)
+
+    line = u"{:<6} {:<10} {:>9} {:>9} {:>8} {:>9}"
+    print line.format("year", "id_tramo", "Ini", "Fin", "TMDA", "km in")
+
+    series = index.get_series(args.road, args.start_km, args.end_km,
+                              args.years)
+    for year, sections in series.items():
+        for section in sections:
+            print line.format(
+                year, section["id_tramo"], section["Ini"], section["Fin"],
+                section["TMDA"], u"{:.2f}".format(index.get_overlap(
+                    section, args.start_km, args.end_km)))
+
+            for id_tabla, variable, fila, valor in index.get_details(
+                    year, section["id_tramo"]):
+                print u"    {} {} {}: {}".format(id_tabla, fila, variable,
+                                                 valor).encode("utf-8")
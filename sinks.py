@@ -0,0 +1,624 @@
+"""Sinks where TrafficData writes its records.
+
+A sink is created with the output path and the tables to be written (an
+OrderedDict of table name and fields), receives records with "write" and
+finishes its output with "save". Each sink has the EXTENSION of its output
+files.
+
+Sinks that keep records of previous runs can also tell which roads of which
+years they already have ("has_road"), once they are told a road was
+completely written ("end_road"), and replace the records a road had when it
+is written again ("start_road").
+"""
+
+import csv
+import gzip
+import json
+import os
+import sqlite3
+from collections import OrderedDict, Counter
+from openpyxl import Workbook
+from utils import parse_number, parse_integer
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Sink():
+    """Base class of sinks, with the methods that are optional."""
+
+    def has_road(self, year, road):
+        """Return True if all records of a road of a year were written in a
+        previous run."""
+        return False
+
+    def start_road(self, year, road):
+        """Called before the records of a road of a year are written."""
+        pass
+
+    def end_road(self, year, road):
+        """Called once all records of a road of a year have been written."""
+        pass
+
+    def get_paths(self, output):
+        """Return the paths of the files written for an output."""
+        return [output]
+
+    # PRIVATE
+    def _move_output(self, output):
+        """Move the files written to the output passed to "save", if it is
+        not the one the sink was created with."""
+
+        if output and output != self.output:
+            for path, new_path in zip(self.get_paths(self.output),
+                                      self.get_paths(output)):
+                os.rename(path, new_path)
+
+
+class ExcelSink(Sink):
+    """Write each table in a sheet of an xlsx workbook.
+
+    Fields are written once, as the first row of each sheet, and records are
+    buffered and appended as rows every CHUNK_SIZE records. When a sheet gets
+    to MAX_ROWS rows (the limit of Excel) the table goes on in a new sheet
+    named after it and the number of the sheet, like "ver_detalle_2".
+    """
+
+    # DATA
+    EXTENSION = ".xlsx"
+    CHUNK_SIZE = 10000
+    MAX_ROWS = 1048576
+
+    def __init__(self, output, tables):
+
+        self.output = output
+        self.tables = tables
+
+        # create excel to save data
+        self.wb = Workbook(optimized_write=True)
+
+        # records waiting to be appended, and sheets of each table with the
+        # rows of the last one
+        self.buffers = {table_name: [] for table_name in self.tables}
+        self.worksheets = {table_name: [] for table_name in self.tables}
+        self.num_rows = {}
+
+        # create a sheet to store records of each table
+        for table_name in self.tables:
+            self._add_worksheet(table_name)
+
+    # PUBLIC
+    def write(self, table_name, record):
+        buffer = self.buffers[table_name]
+        buffer.append(record)
+
+        if len(buffer) >= self.CHUNK_SIZE:
+            self._append_chunk(table_name)
+
+    def save(self, output=None):
+
+        for table_name in self.tables:
+            self._append_chunk(table_name)
+
+        self.wb.save(output or self.output)
+
+    # PRIVATE
+    def _add_worksheet(self, table_name):
+        """Add a new sheet for a table, with its fields in the first row."""
+
+        worksheets = self.worksheets[table_name]
+        title = table_name
+        if worksheets:
+            title = "{}_{}".format(table_name, len(worksheets) + 1)
+
+        ws = self.wb.create_sheet(title=title)
+        ws.append(self.tables[table_name])
+
+        worksheets.append(ws)
+        self.num_rows[table_name] = 1
+
+        return ws
+
+    def _append_chunk(self, table_name):
+        """Append buffered records of a table to its last sheet, going on
+        in a new one when it is full."""
+
+        buffer = self.buffers[table_name]
+        if not buffer:
+            return
+
+        num_fields = len(self.tables[table_name])
+        ws = self.worksheets[table_name][-1]
+        start = 0
+
+        while start < len(buffer):
+            if self.num_rows[table_name] >= self.MAX_ROWS:
+                ws = self._add_worksheet(table_name)
+
+            end = min(len(buffer),
+                      start + self.MAX_ROWS - self.num_rows[table_name])
+            for record in buffer[start:end]:
+                ws.append(record[:num_fields])
+
+            self.num_rows[table_name] += end - start
+            start = end
+
+        del buffer[:]
+
+
+class ParquetSink(Sink):
+    """Write each table in a parquet file, with typed columns.
+
+    Records are buffered and written as a new row group of the file every
+    ROW_GROUP_SIZE records. Columns are typed: INTEGER_FIELDS as integers,
+    DECIMAL_FIELDS as floats parsed from the argentinian format ("394,43")
+    and any other one as a string. Values that can't be parsed are null.
+
+    Fields in DECIMAL_COPIES are kept as strings (they have numbers and texts
+    mixed) and their numbers are also stored in a new decimal column.
+
+    Files are named after the output and the table, for the output
+    "dnv_traffic_data.parquet" the "principal" table is written in
+    "dnv_traffic_data_principal.parquet".
+    """
+
+    # DATA
+    EXTENSION = ".parquet"
+    ROW_GROUP_SIZE = 65536
+    INTEGER_FIELDS = ["Anio", "fila", "Nro distrito", "TMDA"]
+    DECIMAL_FIELDS = ["Ini", "Fin"]
+    DECIMAL_COPIES = {"valor": "valor_num"}
+
+    def __init__(self, output, tables):
+
+        if not pyarrow:
+            raise ImportError("pyarrow is needed to write parquet files")
+
+        self.output = output
+        self.tables = tables
+
+        # records waiting to be written, and writers of each table
+        self.buffers = {table_name: [] for table_name in self.tables}
+        self.writers = {}
+
+    # PUBLIC
+    def write(self, table_name, record):
+        buffer = self.buffers[table_name]
+        buffer.append(record)
+
+        if len(buffer) >= self.ROW_GROUP_SIZE:
+            self._write_row_group(table_name)
+
+    def save(self, output=None):
+
+        for table_name in self.tables:
+            self._write_row_group(table_name)
+            self._get_writer(table_name).close()
+
+        self._move_output(output)
+
+    def get_paths(self, output):
+        return [self.get_table_path(output, table_name)
+                for table_name in self.tables]
+
+    @classmethod
+    def get_table_path(cls, output, table_name):
+        base, extension = os.path.splitext(output)
+        return "{}_{}{}".format(base, table_name, extension or cls.EXTENSION)
+
+    # PRIVATE
+    def _get_columns(self, table_name):
+        """Return (column name, pyarrow type, parse method, field index) of
+        each column of a table."""
+
+        columns = []
+        for index, field in enumerate(self.tables[table_name]):
+
+            if field in self.INTEGER_FIELDS:
+                columns.append((field, pyarrow.int64(), parse_integer, index))
+            elif field in self.DECIMAL_FIELDS:
+                columns.append((field, pyarrow.float64(), parse_number, index))
+            else:
+                columns.append((field, pyarrow.string(), _to_text, index))
+
+            if field in self.DECIMAL_COPIES:
+                columns.append((self.DECIMAL_COPIES[field], pyarrow.float64(),
+                                parse_number, index))
+
+        return columns
+
+    def _get_writer(self, table_name):
+
+        if table_name not in self.writers:
+            schema = pyarrow.schema([
+                pyarrow.field(name, column_type) for name, column_type, parse,
+                index in self._get_columns(table_name)])
+
+            self.writers[table_name] = pyarrow.parquet.ParquetWriter(
+                self.get_table_path(self.output, table_name), schema)
+
+        return self.writers[table_name]
+
+    def _write_row_group(self, table_name):
+        """Write buffered records of a table as a new row group."""
+
+        buffer = self.buffers[table_name]
+        if not buffer:
+            return
+
+        # turn records into columns, parsing each column at once
+        values_by_field = zip(*buffer)
+        arrays = []
+        names = []
+        for name, column_type, parse, index in self._get_columns(table_name):
+            arrays.append(pyarrow.array(map(parse, values_by_field[index]),
+                                        type=column_type))
+            names.append(name)
+
+        self._get_writer(table_name).write_table(
+            pyarrow.Table.from_arrays(arrays, names))
+
+        del buffer[:]
+
+
+class SqliteSink(Sink):
+    """Write each table in a table of a SQLite database, with upserts.
+
+    Tables are created with the fields of each one as columns (INTEGER_FIELDS
+    as integers, VALUE_FIELDS without a type so texts and numbers of typed
+    records are stored as they are, texts otherwise), a primary key with
+    the KEY_FIELDS they have and an index for each of INDEXES they have.
+    Records are inserted in batches of BATCH_SIZE records, each batch in a
+    transaction, replacing records already stored with the same key.
+
+    A variable may be repeated in a row of a detail table, so tables with
+    "variable" and "fila" get an OCCURRENCE_FIELD in their key too, with 1
+    for the first value of a variable in a row, 2 for the second and so on.
+
+    Roads completely written are recorded in ROADS_TABLE, so an existing
+    database can be updated just with the roads it doesn't have yet. Rows a
+    road had are deleted before the road is written again, so sections it
+    doesn't have anymore are not left behind.
+    """
+
+    # DATA
+    EXTENSION = ".sqlite"
+    BATCH_SIZE = 5000
+    INTEGER_FIELDS = ["Anio", "fila", "ocurrencia"]
+    VALUE_FIELDS = ["Nro distrito", "Ini", "Fin", "TMDA", "valor"]
+    KEY_FIELDS = ["Anio", "id_tramo", "id_tabla", "variable", "fila"]
+    OCCURRENCE_FIELD = "ocurrencia"
+    INDEXES = [["Anio", "id_tramo"], ["id_tramo", "id_tabla", "variable"]]
+    ROADS_TABLE = "scraped_roads"
+
+    def __init__(self, output, tables):
+
+        self.output = output
+        self.tables = tables
+
+        # columns of each table, with the occurrence of tables counting it
+        self.columns = {}
+        # (row, occurrences of each variable) last seen of those tables
+        self.occurrences = {}
+        for table_name, fields in self.tables.items():
+            self.columns[table_name] = list(fields)
+            if "variable" in fields and "fila" in fields:
+                self.columns[table_name].append(self.OCCURRENCE_FIELD)
+                self.occurrences[table_name] = (None, Counter())
+
+        # records waiting to be inserted of each table
+        self.buffers = {table_name: [] for table_name in self.tables}
+
+        self.connection = sqlite3.connect(self.output)
+        self._create_tables()
+
+    # PUBLIC
+    def write(self, table_name, record):
+        buffer = self.buffers[table_name]
+
+        if table_name in self.occurrences:
+            record = record + [self._count_occurrence(table_name, record)]
+        buffer.append(record)
+
+        if len(buffer) >= self.BATCH_SIZE:
+            self._insert_batch(table_name)
+
+    def has_road(self, year, road):
+        cursor = self.connection.execute(
+            "SELECT 1 FROM {} WHERE Anio = ? AND road = ?".format(
+                self.ROADS_TABLE), (int(year), road))
+
+        return cursor.fetchone() is not None
+
+    def start_road(self, year, road):
+
+        # sections of the road are "<road>_<number>", between "<road>_" and
+        # "<road>`" (the character after "_"), found with the index
+        with self.connection:
+            for table_name, fields in self.tables.items():
+                if "Anio" in fields and "id_tramo" in fields:
+                    self.connection.execute(
+                        "DELETE FROM {} WHERE Anio = ? AND id_tramo >= ? AND "
+                        "id_tramo < ?".format(self._quote(table_name)),
+                        (int(year), road + u"_", road + u"`"))
+
+            self.connection.execute(
+                "DELETE FROM {} WHERE Anio = ? AND road = ?".format(
+                    self.ROADS_TABLE), (int(year), road))
+
+    def end_road(self, year, road):
+
+        # road is recorded in the same transaction than its last records
+        with self.connection:
+            for table_name in self.tables:
+                self._insert_batch(table_name, commit=False)
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO {} (Anio, road) VALUES (?, ?)".format(
+                    self.ROADS_TABLE), (int(year), road))
+
+    def save(self, output=None):
+
+        for table_name in self.tables:
+            self._insert_batch(table_name)
+
+        self.connection.close()
+
+        self._move_output(output)
+
+    # PRIVATE
+    @classmethod
+    def _quote(cls, name):
+        return '"{}"'.format(name.replace('"', '""'))
+
+    def _count_occurrence(self, table_name, record):
+        """Return the occurrence of the variable of a record in its row
+        (records of a row of a detail table are written one after other)."""
+
+        fields = self.tables[table_name]
+        row = tuple(record[fields.index(field)] for field in self.KEY_FIELDS
+                    if field in fields and field != "variable")
+
+        last_row, counts = self.occurrences[table_name]
+        if row != last_row:
+            counts = Counter()
+            self.occurrences[table_name] = (row, counts)
+
+        variable = record[fields.index("variable")]
+        counts[variable] += 1
+
+        return counts[variable]
+
+    def _create_tables(self):
+
+        with self.connection:
+            for table_name, fields in self.columns.items():
+
+                columns = []
+                for field in fields:
+                    if field in self.INTEGER_FIELDS:
+                        column_type = " INTEGER"
+                    elif field in self.VALUE_FIELDS:
+                        column_type = ""
+                    else:
+                        column_type = " TEXT"
+                    columns.append(self._quote(field) + column_type)
+
+                key = [self._quote(field) for field
+                       in self.KEY_FIELDS + [self.OCCURRENCE_FIELD]
+                       if field in fields]
+                if key:
+                    columns.append("PRIMARY KEY ({})".format(", ".join(key)))
+
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS {} ({})".format(
+                        self._quote(table_name), ", ".join(columns)))
+
+                for index_fields in self.INDEXES:
+                    if set(index_fields).issubset(fields):
+                        self.connection.execute(
+                            "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                                self._quote("_".join([table_name] +
+                                                     index_fields)),
+                                self._quote(table_name),
+                                ", ".join(self._quote(field)
+                                          for field in index_fields)))
+
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} (Anio INTEGER, road TEXT, "
+                "PRIMARY KEY (Anio, road))".format(self.ROADS_TABLE))
+
+    def _insert_batch(self, table_name, commit=True):
+        """Insert (or replace) buffered records of a table."""
+
+        buffer = self.buffers[table_name]
+        if not buffer:
+            return
+
+        fields = self.columns[table_name]
+        statement = "INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(
+            self._quote(table_name),
+            ", ".join(self._quote(field) for field in fields),
+            ", ".join("?" for field in fields))
+
+        if commit:
+            with self.connection:
+                self.connection.executemany(statement, buffer)
+        else:
+            self.connection.executemany(statement, buffer)
+
+        del buffer[:]
+
+
+class StreamSink(Sink):
+    """Base class of sinks streaming each table to a compressed text file.
+
+    Records are written as soon as they arrive, and files are flushed every
+    FLUSH_RECORDS records and at the end of each road, so other processes
+    can read the records written so far while the run goes on. Files are
+    compressed with gzip, or with zstd if COMPRESSION is "zstd".
+
+    Files are named after the output and the table, like the ones of
+    ParquetSink: for the output "dnv_traffic_data.csv.gz" the "principal"
+    table is written in "dnv_traffic_data_principal.csv.gz".
+    """
+
+    # DATA
+    COMPRESSION = "gzip"
+    FLUSH_RECORDS = 10000
+
+    def __init__(self, output, tables):
+
+        if self.COMPRESSION == "zstd" and not zstandard:
+            raise ImportError("zstandard is needed to write zstd files")
+
+        self.output = output
+        self.tables = tables
+
+        # compressed streams of each table, and the files under them
+        self.streams = {}
+        self.files = {}
+        self.unflushed = 0
+
+        for table_name in self.tables:
+            self._open_table(table_name)
+
+    # PUBLIC
+    def write(self, table_name, record):
+        self._write_record(table_name, record)
+
+        self.unflushed += 1
+        if self.unflushed >= self.FLUSH_RECORDS:
+            self.flush()
+
+    def end_road(self, year, road):
+        self.flush()
+
+    def flush(self):
+        """Make the records written so far readable from the files."""
+
+        for table_name in self.tables:
+            self.streams[table_name].flush()
+            self.files[table_name].flush()
+
+        self.unflushed = 0
+
+    def save(self, output=None):
+
+        for table_name in self.tables:
+            if self.COMPRESSION == "zstd":
+                self.streams[table_name].flush(zstandard.FLUSH_FRAME)
+            else:
+                self.streams[table_name].close()
+            self.files[table_name].close()
+
+        self._move_output(output)
+
+    def get_paths(self, output):
+        return [self.get_table_path(output, table_name)
+                for table_name in self.tables]
+
+    @classmethod
+    def get_table_path(cls, output, table_name):
+        if output.endswith(cls.EXTENSION):
+            base = output[:-len(cls.EXTENSION)]
+        else:
+            base = os.path.splitext(output)[0]
+        return "{}_{}{}".format(base, table_name, cls.EXTENSION)
+
+    # PRIVATE
+    def _open_table(self, table_name):
+
+        f = open(self.get_table_path(self.output, table_name), "wb")
+
+        if self.COMPRESSION == "zstd":
+            stream = zstandard.ZstdCompressor().stream_writer(f)
+        else:
+            stream = gzip.GzipFile(fileobj=f, mode="wb")
+
+        self.files[table_name] = f
+        self.streams[table_name] = stream
+
+    def _write_record(self, table_name, record):
+        raise NotImplementedError
+
+
+class CsvSink(StreamSink):
+    """Stream each table to a compressed csv file, encoded in utf-8 and with
+    the fields in the first row."""
+
+    # DATA
+    EXTENSION = ".csv.gz"
+
+    def __init__(self, output, tables):
+
+        # csv writers of each table
+        self.writers = {}
+
+        StreamSink.__init__(self, output, tables)
+
+    # PRIVATE
+    def _open_table(self, table_name):
+        StreamSink._open_table(self, table_name)
+
+        self.writers[table_name] = csv.writer(self.streams[table_name])
+        self._write_record(table_name, self.tables[table_name])
+
+    def _write_record(self, table_name, record):
+        self.writers[table_name].writerow([_to_csv(value)
+                                           for value in record])
+
+
+class NdjsonSink(StreamSink):
+    """Stream each table to a compressed newline delimited json file, with a
+    json object for each record."""
+
+    # DATA
+    EXTENSION = ".ndjson.gz"
+
+    # PRIVATE
+    def _write_record(self, table_name, record):
+        line = json.dumps(OrderedDict(zip(self.tables[table_name], record)),
+                          ensure_ascii=False)
+        if isinstance(line, unicode):
+            line = line.encode("utf-8")
+
+        self.streams[table_name].write(line + "\n")
+
+
+class CsvZstdSink(CsvSink):
+    """CsvSink compressed with zstd (it needs zstandard)."""
+
+    # DATA
+    EXTENSION = ".csv.zst"
+    COMPRESSION = "zstd"
+
+
+class NdjsonZstdSink(NdjsonSink):
+    """NdjsonSink compressed with zstd (it needs zstandard)."""
+
+    # DATA
+    EXTENSION = ".ndjson.zst"
+    COMPRESSION = "zstd"
+
+
+def _to_csv(value):
+    # csv of python 2 writes bytes, None is an empty cell
+    if value is None:
+        return ""
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    return value
+
+
+def _to_text(value):
+    # typed records may have numbers or None in text columns
+    return None if value is None else unicode(value)
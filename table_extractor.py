@@ -0,0 +1,89 @@
+"""Fast extraction of DNV tables with lxml XPath queries.
+
+It is an alternative to walking a BeautifulSoup tree, selected setting the
+PARSER of the scraper to XPATH_PARSER. It returns the same values than the
+BeautifulSoup path, but it doesn't build a soup of each page, so it takes a
+fraction of its parsing time.
+"""
+
+import lxml.html
+from bs4 import UnicodeDammit
+from utils import remove_accents
+
+# DATA
+XPATH_PARSER = "xpath"
+
+FILA_CELLS = ".//td[contains(concat(' ', normalize-space(@class), ' '), " \
+    "' FILA ')]"
+
+
+# METHODS
+def parse_html(html):
+    """Parse html into an lxml tree.
+
+    Encoding is detected the same way BeautifulSoup does, so texts are decoded
+    in the same way."""
+
+    if isinstance(html, str):
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+
+    return lxml.html.document_fromstring(html)
+
+
+def _get_texts(element, cells_path):
+    """Return the texts of the cells of an element as plain unicode strings
+    (lxml "smart" strings keep a reference to the whole tree)."""
+    return [unicode(cell.text_content()) for cell in element.xpath(cells_path)]
+
+
+def extract_road_rows(html):
+    """Extract the sections of a road table.
+
+    Returns a list of (texts, details_link_part) tuples, one for each row
+    with 8 "FILA" cells. Texts are stripped and details_link_part is None if
+    the section has no "ver detalle" link."""
+
+    rows = []
+
+    for tr in parse_html(html).iter("tr"):
+        row_elements = tr.xpath(FILA_CELLS)
+
+        if len(row_elements) == 8:
+            texts = [unicode(element.text_content()).strip()
+                     for element in row_elements]
+
+            # find details link
+            details_link_part = None
+            if row_elements[6].text_content() == "ver detalle":
+                details_link_part = unicode(
+                    row_elements[6].xpath(".//a/@href")[0])
+
+            rows.append((texts, details_link_part))
+
+    return rows
+
+
+def extract_detail_tables(html):
+    """Extract all detail tables from the html of a detail page.
+
+    Returns a dictionary with "id_table" as keys and each table as a list of
+    lists, with the headers row first. The "id_table" is the text of the
+    element preceding the table, without accents and lowercased."""
+
+    extracted_tables = {}
+
+    for table in parse_html(html).iter("table"):
+
+        # headers rows first, then content rows
+        extracted_table = [_get_texts(tr, ".//th")
+                           for tr in table.xpath(".//thead//tr")]
+        extracted_table.extend([_get_texts(tr, ".//td")
+                                for tr in table.xpath(".//tbody//tr")])
+
+        # get table name
+        table_name = remove_accents(
+            unicode(table.getprevious().text_content()))
+
+        extracted_tables[table_name] = extracted_table
+
+    return extracted_tables
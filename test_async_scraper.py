@@ -0,0 +1,51 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import dnv_scraper
+from dnv_scraper import scrape_traffic_data
+from utils import compare_excels
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "benchmarks"))
+from fixtures import build_corpus
+from fixture_server import FixtureServer
+
+try:
+    from async_scraper import run_scrape_traffic_data_async
+    import trollius
+except ImportError:
+    trollius = None
+
+
+@unittest.skipIf(not trollius, "trollius is not installed")
+class TestScrapeTrafficDataAsync(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        build_corpus(os.path.join(self.tmp_dir, "corpus"), ["2010"],
+                     num_roads=3, num_sections=10)
+
+        self.server = FixtureServer(os.path.join(self.tmp_dir,
+                                                 "corpus")).start()
+        self.base_url_part1 = dnv_scraper.base_url_part1
+        dnv_scraper.base_url_part1 = (self.server.get_base_url() +
+                                      "SelCE_WEB/tmda_libro_web_")
+
+    def tearDown(self):
+        dnv_scraper.base_url_part1 = self.base_url_part1
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_same_output_than_sync(self):
+        sync_output = os.path.join(self.tmp_dir, "sync.xlsx")
+        async_output = os.path.join(self.tmp_dir, "async.xlsx")
+
+        scrape_traffic_data(["2010"], None, sync_output)
+        run_scrape_traffic_data_async(["2010"], None, async_output)
+
+        self.assertTrue(compare_excels(sync_output, async_output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import shutil
+import tempfile
+from checkpoint import CheckpointJournal
+
+
+class TestCheckpointJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+        self.records = [("simple_tbl", [u"0040_1", u"23", 2010]),
+                        ("details_tbl", [u"0040_1", u"ruta", u"TMDA", 1,
+                                         u"500", 2010])]
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
+    def test_resume_replays_completed_units(self):
+        journal = CheckpointJournal(self.journal_dir)
+        spilled = list(journal.record_unit(2010, "0040", self.records))
+        self.assertEqual(spilled, self.records)
+
+        journal = CheckpointJournal(self.journal_dir, resume=True)
+        self.assertTrue(journal.has_unit(2010, "0040"))
+        self.assertEqual(list(journal.iter_records(2010, "0040")),
+                         [(table, record) for table, record in self.records])
+
+    def test_interrupted_unit_is_not_completed(self):
+        journal = CheckpointJournal(self.journal_dir)
+
+        # records generator is abandoned before its end
+        spilling = journal.record_unit(2010, "0040", self.records)
+        next(spilling)
+        spilling.close()
+
+        journal = CheckpointJournal(self.journal_dir, resume=True)
+        self.assertFalse(journal.has_unit(2010, "0040"))
+
+    def test_new_run_clears_journal(self):
+        journal = CheckpointJournal(self.journal_dir)
+        list(journal.record_unit(2010, "0040", self.records))
+
+        journal = CheckpointJournal(self.journal_dir)
+        self.assertFalse(journal.has_unit(2010, "0040"))
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+from detail_frames import DetailFrames
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+
+@unittest.skipUnless(pd, "pandas is needed to build detail frames")
+class TestDetailFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_batches_are_spilled_and_typed_as_a_whole(self):
+        detail_frames = DetailFrames()
+        detail_frames.add_records([
+            [u"0040_1", u"ruta", u"TMDA", 1, u"131", 2010],
+            [u"0040_1", u"ruta", u"Km", 1, u"19,75", 2010]])
+        detail_frames.add_records([
+            [u"0003_1", u"ruta", u"TMDA", 1, u"1.286", 2010],
+            [u"0003_1", u"ruta", u"Obs", 1, u"s/d", 2010]])
+
+        self.assertEqual(os.listdir(detail_frames.spill_dir),
+                         [u"ruta.pickle"])
+
+        output = os.path.join(self.tmp_dir, "details.csv")
+        detail_frames.save_wide(output)
+        wide = pd.read_csv(os.path.join(self.tmp_dir, "details_ruta.csv"))
+
+        self.assertEqual(list(wide.columns),
+                         ["Anio", "id_tramo", "fila", "TMDA", "Km", "Obs"])
+        self.assertEqual(list(wide["TMDA"]), [131, 1286])
+        self.assertEqual(wide["Km"].dtype, "float64")
+        self.assertFalse(os.path.exists(detail_frames.spill_dir))
+
+    def test_repeated_variables_get_a_column_each(self):
+        detail_frames = DetailFrames()
+        detail_frames.add_records([
+            [u"0040_1", u"ruta", u"TMDA", 1, u"131", 2010],
+            [u"0040_1", u"ruta", u"TMDA", 1, u"140", 2010],
+            [u"0040_1", u"ruta", u"TMDA_2", 1, u"s/d", 2010],
+            [u"0040_1", u"ruta", u"TMDA", 2, u"150", 2010],
+            [u"0040_1", u"ruta", u"TMDA", 2, u"160", 2010],
+            [u"0040_1", u"ruta", u"TMDA_2", 2, u"s/d", 2010]])
+
+        output = os.path.join(self.tmp_dir, "details.csv")
+        detail_frames.save_wide(output)
+        wide = pd.read_csv(os.path.join(self.tmp_dir, "details_ruta.csv"))
+
+        self.assertEqual(list(wide.columns), ["Anio", "id_tramo", "fila",
+                                              "TMDA", "TMDA_3", "TMDA_2"])
+        self.assertEqual(list(wide["TMDA"]), [131, 150])
+        self.assertEqual(list(wide["TMDA_3"]), [140, 160])
+        self.assertEqual(list(wide["fila"]), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import os
+import shutil
+import tempfile
+import zlib
+from http_cache import HttpCache, CacheMissError
+from http_session import HttpError
+
+
+class FakeFetcher():
+    """Fetch method returning a fixed body and recording the requests."""
+
+    def __init__(self, body, status=200, headers=None):
+        self.body = body
+        self.status = status
+        self.headers = headers or {}
+        self.requests = []
+
+    def __call__(self, url, headers):
+        self.requests.append((url, headers))
+        return self.status, self.headers, self.body
+
+
+class TestHttpCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.url = "http://example.com:8080/tmda_libro_web_2010/index.html"
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_second_fetch_is_cached(self):
+        cache = HttpCache(self.cache_dir)
+        fetch = FakeFetcher("<html>2010</html>")
+
+        self.assertEqual(cache.get_html(self.url, fetch), "<html>2010</html>")
+        self.assertEqual(cache.get_html(self.url, fetch), "<html>2010</html>")
+        self.assertEqual(len(fetch.requests), 1)
+
+        # a new cache on the same directory reuses stored pages
+        cache = HttpCache(self.cache_dir)
+        self.assertEqual(cache.get_html(self.url, fetch), "<html>2010</html>")
+        self.assertEqual(len(fetch.requests), 1)
+
+    def test_revalidate_not_modified(self):
+        cache = HttpCache(self.cache_dir, revalidate=True)
+        cache.get_html(self.url, FakeFetcher("old", headers={"ETag": "abc"}))
+
+        fetch = FakeFetcher("", status=304)
+        self.assertEqual(cache.get_html(self.url, fetch), "old")
+        self.assertEqual(fetch.requests[0][1], {"If-None-Match": "abc"})
+
+    def test_revalidate_not_modified_after_eviction(self):
+        cache = HttpCache(self.cache_dir, revalidate=True)
+        cache.get_html(self.url, FakeFetcher("old", headers={"ETag": "abc"}))
+        requests = []
+
+        def fetch(url, headers):
+            requests.append(headers)
+
+            # the page is evicted before the server answers it didn't change
+            if len(requests) == 1:
+                cache.clear()
+                return 304, {}, ""
+            return 200, {"ETag": "abc"}, "old"
+
+        self.assertEqual(cache.get_html(self.url, fetch), "old")
+        self.assertEqual(requests, [{"If-None-Match": "abc"}, {}])
+        self.assertEqual(cache.get(self.url)[0], "old")
+
+    def test_not_modified_without_validators(self):
+        cache = HttpCache(self.cache_dir, revalidate=True)
+
+        self.assertRaises(HttpError, cache.get_html, self.url,
+                          FakeFetcher("", status=304))
+        self.assertIsNone(cache.get(self.url))
+
+    def test_revalidate_modified(self):
+        cache = HttpCache(self.cache_dir, revalidate=True)
+        cache.get_html(self.url, FakeFetcher("old"))
+
+        self.assertEqual(cache.get_html(self.url, FakeFetcher("new")), "new")
+        self.assertEqual(cache.get(self.url)[0], "new")
+
+    def test_offline(self):
+        cache = HttpCache(self.cache_dir, offline=True)
+
+        self.assertRaises(CacheMissError, cache.get_html, self.url,
+                          FakeFetcher("page"))
+
+    def test_evicts_least_recently_used(self):
+        first_url = "http://example.com/1.html"
+        second_url = "http://example.com/2.html"
+        body = "a page of some bytes"
+
+        cache = HttpCache(self.cache_dir, max_size=len(zlib.compress(body)))
+        cache.set(first_url, body)
+
+        # make first page the least recently used one
+        os.utime(cache._paths(first_url)[0], (0, 0))
+        cache.set(second_url, body)
+
+        self.assertIsNone(cache.get(first_url))
+        self.assertEqual(cache.get(second_url)[0], body)
+        self.assertLessEqual(cache.size, cache.max_size)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import BaseHTTPServer
+import SocketServer
+import threading
+import time
+import unittest
+from multiprocessing.dummy import Pool as ThreadPool
+from http_session import HttpSession
+
+
+class CountingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Keep-alive handler counting the connections open at the same time."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.count_connection(1)
+
+    def finish(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+        self.server.count_connection(-1)
+
+    def do_GET(self):
+        time.sleep(0.01)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write("ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class CountingServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0),
+                                           CountingHandler)
+        self.lock = threading.Lock()
+        self.open_connections = 0
+        self.max_open_connections = 0
+        self.opened_connections = 0
+
+    def count_connection(self, change):
+        with self.lock:
+            self.open_connections += change
+            self.max_open_connections = max(self.max_open_connections,
+                                            self.open_connections)
+            if change > 0:
+                self.opened_connections += 1
+
+
+class TestHttpSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CountingServer()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:{}/page.html".format(
+            self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_to_a_host_are_capped_and_shared_by_threads(self):
+        session = HttpSession(max_per_host=2)
+        pool = ThreadPool(8)
+
+        responses = pool.map(lambda num_page: session.get(self.url),
+                             xrange(40))
+        pool.close()
+        pool.join()
+        session.close()
+
+        self.assertEqual([body for status, headers, body in responses],
+                         ["ok"] * 40)
+        self.assertLessEqual(self.server.max_open_connections, 2)
+        self.assertLessEqual(self.server.opened_connections, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import threading
+import unittest
+from lru_memo import LruMemo
+
+
+class TestLruMemo(unittest.TestCase):
+
+    def test_least_recently_used_key_is_dropped(self):
+        memo = LruMemo(max_size=2)
+        computed = []
+
+        def compute(key):
+            computed.append(key)
+            return key.upper()
+
+        memo.get("a", compute)
+        memo.get("b", compute)
+        self.assertEqual(memo.get("a", compute), "A")
+
+        # "b" is the least recently used one
+        memo.get("c", compute)
+        memo.get("a", compute)
+        memo.get("b", compute)
+
+        self.assertEqual(computed, ["a", "b", "c", "b"])
+        self.assertEqual((memo.hits, memo.misses), (2, 4))
+        self.assertEqual(memo.pop_counters(), (2, 4))
+        self.assertEqual((memo.hits, memo.misses), (0, 0))
+
+    def test_key_being_computed_is_computed_once(self):
+        memo = LruMemo()
+        computing = threading.Event()
+        release = threading.Event()
+        computed = []
+
+        def compute(key):
+            computed.append(key)
+            computing.set()
+            release.wait()
+            return key.upper()
+
+        values = []
+        first = threading.Thread(target=lambda: values.append(
+            memo.get("a", compute)))
+        first.start()
+        computing.wait()
+
+        second = threading.Thread(target=lambda: values.append(
+            memo.get("a", compute)))
+        second.start()
+        release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(values, ["A", "A"])
+        self.assertEqual(computed, ["a"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from metrics import ScrapeMetrics
+
+
+class TestScrapeMetrics(unittest.TestCase):
+
+    def test_metrics_are_added_to_current_unit(self):
+        metrics = ScrapeMetrics()
+        metrics.start_unit(2010, "0040")
+        metrics.add("pages")
+        metrics.add("bytes", 1024)
+        with metrics.timer("parse_seconds"):
+            pass
+        metrics.add("records", 10, (2010, "0003"))
+
+        self.assertEqual(metrics.units.keys(), [(2010, "0040"),
+                                                (2010, "0003")])
+        totals = metrics.get_totals()
+        self.assertEqual((totals["pages"], totals["bytes"],
+                          totals["records"]), (1, 1024, 10))
+        self.assertGreaterEqual(totals["parse_seconds"], 0)
+
+    def test_units_of_workers_are_added(self):
+        worker = ScrapeMetrics()
+        worker.start_unit(2010, "0040")
+        worker.add("pages", 3)
+
+        metrics = ScrapeMetrics()
+        metrics.add_unit(2010, "0040", worker.pop_unit(2010, "0040"))
+
+        self.assertEqual(worker.units, {})
+        self.assertEqual(metrics.units[(2010, "0040")]["pages"], 3)
+
+    def test_save_json(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            metrics = ScrapeMetrics()
+            metrics.start_unit(2010, "0040")
+            metrics.add("pages", 2)
+
+            path = os.path.join(tmp_dir, "metrics.json")
+            metrics.save_json(path)
+            with open(path, "rb") as f:
+                saved = json.load(f)
+
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        self.assertEqual(saved["units"][0]["road"], "0040")
+        self.assertEqual(saved["totals"]["pages"], 2)
+        self.assertEqual(len(metrics.get_report()), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
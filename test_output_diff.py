@@ -0,0 +1,135 @@
+import os
+import shutil
+import tempfile
+import unittest
+from openpyxl import load_workbook
+from output_diff import diff_outputs, iter_changes, write_delta, TableDiff
+from output_diff import ADDED, REMOVED, CHANGED
+from sinks import pyarrow
+from traffic_data import TrafficData
+from utils import compare_excels
+
+
+class TestOutputDiff(unittest.TestCase):
+
+    DETAILS = [[u"0040_1", u"ruta", u"TMDA", 1, u"131", 2010],
+               [u"0040_1", u"ruta", u"TMDA", 2, u"140", 2010],
+               [u"0003_1", u"ruta", u"TMDA", 1, u"1286", 2010],
+               [u"0003_1", u"ruta", u"TMDA", 1, u"1300", 2011]]
+    SIMPLE = [[u"0040_1", u"23", u"Santa Cruz", u"", u"0", u"46,92",
+               u"1.286", None, None, None, 2010]]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_output(self, name, details_records, simple_records=()):
+        output = os.path.join(self.tmp_dir, name)
+
+        traffic_data = TrafficData(output)
+        for record in simple_records:
+            traffic_data.write_simple_record(record)
+        for record in details_records:
+            traffic_data.write_details_record(record)
+        traffic_data.save()
+
+        return output
+
+    def test_same_records_in_other_format(self):
+        old_output = self.write_output("old.xlsx", self.DETAILS, self.SIMPLE)
+
+        # parquet outputs have typed numbers, the others texts
+        names = ["new.csv.gz", "new.sqlite"]
+        if pyarrow:
+            names.append("new.parquet")
+
+        for name in names:
+            new_output = self.write_output(name, self.DETAILS, self.SIMPLE)
+            table_diffs, changes = diff_outputs(
+                old_output, new_output, max_changes=10,
+                normalize_numbers=name.endswith(".parquet"))
+
+            self.assertTrue(all(table_diff.is_same()
+                                for table_diff in table_diffs.values()),
+                            name)
+            self.assertEqual(changes, [])
+
+    def test_typed_numbers_equal_numbers_written_as_texts(self):
+        old_output = self.write_output("old.xlsx", [], self.SIMPLE)
+        new_output = self.write_output("new.csv.gz", [], [
+            [u"0040_1", 23, u"Santa Cruz", u"", 0.0, 46.92, 1286, None,
+             None, None, 2010]])
+
+        table_diffs, changes = diff_outputs(old_output, new_output)
+        self.assertEqual(
+            table_diffs[TrafficData.WS_SIMPLE_TBL_NAME].records[CHANGED], 1)
+
+        table_diffs, changes = diff_outputs(old_output, new_output,
+                                            normalize_numbers=True)
+        self.assertTrue(all(table_diff.is_same()
+                            for table_diff in table_diffs.values()))
+
+    def test_compare_excels_cell_by_cell(self):
+        old_output = self.write_output("old.xlsx", self.DETAILS)
+        new_output = self.write_output("new.xlsx", self.DETAILS[::-1])
+        short_output = self.write_output("short.xlsx", self.DETAILS[:-1])
+
+        # same records, in other order
+        table_diffs, changes = diff_outputs(old_output, new_output)
+        self.assertTrue(all(table_diff.is_same()
+                            for table_diff in table_diffs.values()))
+
+        self.assertTrue(compare_excels(old_output, old_output))
+        self.assertFalse(compare_excels(old_output, new_output))
+        self.assertFalse(compare_excels(old_output, short_output))
+
+    def test_changes_of_blocks_that_differ(self):
+        old_output = self.write_output("old.xlsx", self.DETAILS)
+        new_output = self.write_output("new.xlsx", [
+            [u"0040_1", u"ruta", u"TMDA", 1, u"131", 2010],
+            [u"0040_1", u"ruta", u"TMDA", 2, u"150", 2010],
+            [u"0040_1", u"ruta", u"TMDA", 3, u"160", 2010],
+            [u"0003_1", u"ruta", u"TMDA", 1, u"1286", 2010],
+            [u"0005_1", u"ruta", u"TMDA", 1, u"70", 2010]])
+
+        table_diff = TableDiff(TrafficData.WS_DETAILS_TBL_NAME)
+        changes = [(change, key[0], key[1], key[4]) for change, key, old, new
+                   in iter_changes(old_output, new_output,
+                                   TrafficData.WS_DETAILS_TBL_NAME,
+                                   table_diff=table_diff)]
+
+        self.assertEqual(changes, [(CHANGED, u"2010", u"0040_1", u"2"),
+                                   (ADDED, u"2010", u"0040_1", u"3"),
+                                   (ADDED, u"2010", u"0005_1", u"1"),
+                                   (REMOVED, u"2011", u"0003_1", u"1")])
+        self.assertEqual(table_diff.blocks, {"same": 1, ADDED: 1,
+                                             REMOVED: 1, CHANGED: 1})
+        self.assertEqual(table_diff.records,
+                         {"old": 4, "new": 5, ADDED: 2, REMOVED: 1,
+                          CHANGED: 1})
+        self.assertFalse(compare_excels(old_output, new_output))
+
+    def test_delta_of_years_in_scope(self):
+        old_output = self.write_output("old.sqlite", self.DETAILS)
+        new_output = self.write_output("new.xlsx", [
+            [u"0040_1", u"ruta", u"TMDA", 1, u"131", 2010],
+            [u"0003_1", u"ruta", u"TMDA", 1, u"1290", 2010]])
+        delta_output = os.path.join(self.tmp_dir, "delta.xlsx")
+
+        table_diffs = write_delta(old_output, new_output, delta_output,
+                                  in_scope=lambda year, road: year == u"2010")
+
+        self.assertEqual(
+            table_diffs[TrafficData.WS_DETAILS_TBL_NAME].records[CHANGED], 1)
+        ws = load_workbook(delta_output).get_sheet_by_name(
+            TrafficData.WS_DETAILS_TBL_NAME)
+        self.assertEqual(
+            [[cell.value for cell in row] for row in ws.rows][1:],
+            [[u"0040_1", u"ruta", u"TMDA", 2, u"140", 2010, REMOVED],
+             [u"0003_1", u"ruta", u"TMDA", 1, u"1290", 2010, CHANGED]])
+
+
+if __name__ == '__main__':
+    unittest.main()
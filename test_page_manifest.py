@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+from page_manifest import PageManifest
+
+
+class TestPageManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.manifest = PageManifest(os.path.join(self.tmp_dir,
+                                                  "manifest.sqlite"))
+        self.parsed = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def parse(self, body):
+        self.parsed.append(body)
+        return {u"ruta": [[u"TMDA"], [body]]}
+
+    def test_unchanged_page_is_not_parsed_again(self):
+        url = "http://host/html_tramos/8101.html"
+        data = self.manifest.get_data(url, "500", self.parse)
+
+        # a new manifest on the same file, like a new run
+        manifest = PageManifest(self.manifest.manifest_path)
+        self.assertEqual(manifest.get_data(url, "500", self.parse), data)
+        self.assertEqual(self.parsed, ["500"])
+        self.assertEqual((manifest.hits, manifest.misses), (1, 0))
+
+    def test_changed_page_is_parsed_again(self):
+        url = "http://host/html_tramos/8101.html"
+        self.manifest.get_data(url, "500", self.parse)
+
+        data = self.manifest.get_data(url, "600", self.parse)
+        self.assertEqual(data, {u"ruta": [[u"TMDA"], [u"600"]]})
+        self.assertEqual(self.parsed, ["500", "600"])
+
+
+if __name__ == '__main__':
+    unittest.main()
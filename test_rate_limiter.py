@@ -0,0 +1,42 @@
+import time
+import unittest
+from rate_limiter import AdaptiveRateLimiter
+
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+
+    def test_rate_increases_while_server_is_healthy(self):
+        limiter = AdaptiveRateLimiter(2)
+        for request in xrange(10):
+            limiter.record(0.05)
+
+        self.assertGreater(limiter.rate, 2)
+        self.assertLessEqual(limiter.rate, limiter.max_rate)
+
+    def test_rate_decreases_once_per_burst_of_errors(self):
+        limiter = AdaptiveRateLimiter(8)
+        for request in xrange(5):
+            limiter.record(None, error=True)
+
+        self.assertEqual(limiter.rate, 4)
+
+    def test_slow_requests_decrease_rate(self):
+        limiter = AdaptiveRateLimiter(8)
+        limiter.record(0.3)
+        limiter.record(5.0)
+
+        self.assertLess(limiter.rate, 8)
+
+    def test_acquire_waits_for_tokens(self):
+        limiter = AdaptiveRateLimiter(20, max_rate=20)
+        limiter.tokens = 0
+
+        start = time.time()
+        for request in xrange(5):
+            limiter.acquire()
+
+        self.assertGreaterEqual(time.time() - start, 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+from road_catalogue import RoadCatalogue
+
+
+class TestRoadCatalogue(unittest.TestCase):
+
+    ROADS = {2010: ["0040", "0237", "0003"],
+             2011: ["0040", "0005", "0003"]}
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.catalogue_path = os.path.join(self.tmp_dir, "catalogue.json")
+        self.scraped = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def scrape_year(self, year):
+        self.scraped.append(year)
+        return OrderedDict((road, "http://host/{}/{}.html".format(year, road))
+                           for road in self.ROADS[year])
+
+    def test_each_year_has_its_own_roads(self):
+        catalogue = RoadCatalogue()
+        catalogue.discover([2010, 2011], self.scrape_year, workers=2)
+
+        jobs = [(year, road) for year, road, road_links
+                in catalogue.iter_jobs([2010, 2011])]
+        self.assertEqual(jobs, [(2010, "0040"), (2010, "0237"),
+                                (2010, "0003"), (2011, "0040"),
+                                (2011, "0005"), (2011, "0003")])
+
+        # roads passed are skipped in the years that don't have them
+        jobs = [(year, road) for year, road, road_links
+                in catalogue.iter_jobs([2010, 2011], ["0237", "0003"])]
+        self.assertEqual(jobs, [(2010, "0237"), (2010, "0003"),
+                                (2011, "0003")])
+
+    def test_saved_years_are_not_scraped_again(self):
+        catalogue = RoadCatalogue(self.catalogue_path)
+        catalogue.discover([2010], self.scrape_year)
+
+        # a new catalogue on the same file, like a new run
+        catalogue = RoadCatalogue(self.catalogue_path)
+        catalogue.discover([2010, 2011], self.scrape_year)
+
+        self.assertEqual(self.scraped, [2010, 2011])
+        self.assertEqual(catalogue.get_road_links(2010).keys(),
+                         self.ROADS[2010])
+        self.assertEqual(catalogue.get_road_links("2010")["0237"],
+                         "http://host/2010/0237.html")
+
+
+if __name__ == '__main__':
+    unittest.main()
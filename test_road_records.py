@@ -0,0 +1,46 @@
+import pickle
+import unittest
+from road_records import RoadRecords
+
+
+class TestRoadRecords(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [("simple_tbl", [u"0040_1", u"23", u"Santa Cruz"]),
+                        ("details_tbl", [u"0040_1", u"ruta", u"TMDA", 1,
+                                         u"500"]),
+                        ("details_tbl", [u"0040_1", u"clasificacion",
+                                         u"Bus", 1, u"4,2"]),
+                        ("details_tbl", [u"0040_1", u"clasificacion",
+                                         u"Bus", 2, u"4,2"])]
+
+    def test_records_are_generated_with_the_year(self):
+        road_records = RoadRecords(2010, "details_tbl", self.records)
+
+        self.assertEqual(len(road_records), 4)
+        self.assertEqual(list(road_records),
+                         [(table, record + [2010])
+                          for table, record in self.records])
+
+        # repeated texts are kept once
+        self.assertEqual(len(road_records.texts), 7)
+
+    def test_pickled_records(self):
+        road_records = RoadRecords(2010, "details_tbl", self.records)
+
+        unpickled = pickle.loads(pickle.dumps(road_records, 2))
+        unpickled.add("details_tbl", [u"0040_2", u"ruta", u"TMDA", 1,
+                                      u"500"])
+
+        self.assertEqual(list(unpickled)[:4], list(road_records))
+        self.assertEqual(len(unpickled.texts), 8)
+
+    def test_simple_records_come_first(self):
+        road_records = RoadRecords(2010, "details_tbl", self.records)
+
+        with self.assertRaises(ValueError):
+            road_records.add("simple_tbl", [u"0040_2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
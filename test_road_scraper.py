@@ -0,0 +1,131 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import dnv_scraper
+from openpyxl import load_workbook
+from dnv_scraper import (RoadScraper, scrape_road_links, get_year_url,
+                         scrape_traffic_data)
+from traffic_data import TrafficData
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "benchmarks"))
+from fixtures import build_corpus
+from fixture_server import FixtureServer
+
+
+class FixtureServerTestCase(unittest.TestCase):
+    """Serve a small corpus of the DNV site for 2010."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.roads = build_corpus(os.path.join(self.tmp_dir, "corpus"),
+                                  ["2010"], num_roads=3, num_sections=10)
+
+        self.server = FixtureServer(os.path.join(self.tmp_dir,
+                                                 "corpus")).start()
+        self.base_url_part1 = dnv_scraper.base_url_part1
+        dnv_scraper.base_url_part1 = (self.server.get_base_url() +
+                                      "SelCE_WEB/tmda_libro_web_")
+
+        # pages read by other tests must be fetched again
+        RoadScraper.DETAILS_MEMO.clear()
+
+    def tearDown(self):
+        dnv_scraper.base_url_part1 = self.base_url_part1
+        RoadScraper.DETAILS_MEMO.clear()
+        self.server.stop()
+        shutil.rmtree(self.tmp_dir)
+
+
+class TestRoadLinks(FixtureServerTestCase):
+
+    def test_roads_keep_the_order_of_the_index_page(self):
+        road_links = scrape_road_links(get_year_url("2010"))
+
+        self.assertEqual(road_links.keys(), self.roads)
+
+
+class TestRoadScraper(FixtureServerTestCase):
+
+    def test_same_records_with_concurrent_details(self):
+        road_links = scrape_road_links(get_year_url("2010"))
+
+        for road in sorted(road_links):
+            records = list(RoadScraper(road, road_links[road], road_links,
+                                       1).iter_records())
+
+            RoadScraper.DETAILS_MEMO.clear()
+            concurrent_records = list(RoadScraper(
+                road, road_links[road], road_links, 4).iter_records())
+
+            self.assertIn(RoadScraper.DETAILS_TBL,
+                          [table for table, record in records])
+            self.assertEqual(records, concurrent_records)
+
+    def test_first_record_before_all_pages_are_fetched(self):
+        road_links = scrape_road_links(get_year_url("2010"))
+        road = sorted(road_links)[0]
+
+        self.server.reset_counters()
+        records = list(RoadScraper(road, road_links[road],
+                                   road_links).iter_records())
+        all_requests = self.server.requests
+
+        RoadScraper.DETAILS_MEMO.clear()
+        self.server.reset_counters()
+        records_iter = RoadScraper(road, road_links[road],
+                                   road_links).iter_records()
+
+        self.assertEqual(next(records_iter), records[0])
+        self.assertLess(self.server.requests, all_requests)
+        self.assertEqual([records[0]] + list(records_iter), records)
+
+    def test_streamed_output_same_than_scraped_roads(self):
+        road_links = scrape_road_links(get_year_url("2010"))
+        roads = sorted(road_links)
+        output = os.path.join(self.tmp_dir, "streamed.xlsx")
+        expected_output = os.path.join(self.tmp_dir, "expected.xlsx")
+
+        scrape_traffic_data(["2010"], roads, output)
+
+        # write the records of each road once it is scraped as a whole
+        traffic_data = TrafficData(expected_output)
+        for road in roads:
+            road_scraper = RoadScraper(road, road_links[road], road_links)
+            road_scraper.scrape()
+
+            for record in road_scraper.get_simple_records():
+                traffic_data.write_simple_record(record + ["2010"])
+            for record in road_scraper.get_details_records():
+                traffic_data.write_details_record(record + ["2010"])
+        traffic_data.save(expected_output)
+
+        self.assertEqual(_read_rows(output), _read_rows(expected_output))
+
+
+class TestScrapeTrafficDataWorkers(FixtureServerTestCase):
+
+    def test_same_output_with_a_pool_of_processes(self):
+        output = os.path.join(self.tmp_dir, "single.xlsx")
+        pool_output = os.path.join(self.tmp_dir, "pool.xlsx")
+
+        scrape_traffic_data(["2010"], None, output)
+        scrape_traffic_data(["2010"], None, pool_output, workers=3)
+
+        # rows are compared in order, not just their contents
+        self.assertEqual(_read_rows(output), _read_rows(pool_output))
+
+
+def _read_rows(excel):
+    """Return the values of the rows of each sheet of an excel."""
+
+    wb = load_workbook(excel, use_iterators=True)
+
+    return [(ws.title, [[cell.value for cell in row]
+                        for row in ws.iter_rows()])
+            for ws in wb.worksheets]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from section_query import IntervalTree, SectionIndex, _to_km
+from traffic_data import TrafficData
+
+
+class TestIntervalTree(unittest.TestCase):
+
+    def test_query_returns_overlapping_intervals(self):
+        rand = random.Random(0)
+        intervals = []
+        for item in xrange(500):
+            start = rand.uniform(0, 1000)
+            intervals.append((start, start + rand.uniform(0, 30), item))
+        tree = IntervalTree(intervals)
+
+        for num_query in xrange(100):
+            start = rand.uniform(0, 1000)
+            end = start + rand.uniform(0, 50)
+            self.assertEqual(sorted(tree.query(start, end)),
+                             [item for interval_start, interval_end, item
+                              in intervals if interval_start <= end and
+                              interval_end >= start])
+
+
+class TestSectionIndex(unittest.TestCase):
+
+    SECTIONS = [(2010, u"0040_1", u"0", u"19,75", u"131"),
+                (2010, u"0040_2", u"19,75", u"83,43", u"3024"),
+                (2011, u"0040_1", u"0", u"27,61", u"4070"),
+                (2011, u"0040_2", u"27,61", u"47,17", u"1428"),
+                (2011, u"0003_1", u"0", u"29,29", u"1286")]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp_dir, "output.xlsx")
+
+        traffic_data = TrafficData(self.output)
+        for year, id_tramo, start, end, tmda in self.SECTIONS:
+            traffic_data.write_simple_record(
+                [id_tramo, u"23", u"Santa Cruz", u"", start, end, tmda,
+                 None, None, None, year])
+        traffic_data.write_details_record([u"0040_1", u"clasificacion",
+                                           u"Bus", 1, u"4,2", 2010])
+        traffic_data.write_details_record([u"0040_1", u"ruta", u"TMDA", 1,
+                                           u"131", 2010])
+        traffic_data.save()
+
+        self.index = SectionIndex(self.output,
+                                  details_tables=["clasificacion"])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sections_of_a_stretch_in_each_year(self):
+        series = self.index.get_series("0040", 10, 30)
+
+        self.assertEqual(
+            [(year, [(section["id_tramo"], section["TMDA"])
+                     for section in sections])
+             for year, sections in series.items()],
+            [(2010, [(u"0040_1", 131), (u"0040_2", 3024)]),
+             (2011, [(u"0040_1", 4070), (u"0040_2", 1428)])])
+
+        # a section that just touches the stretch is not in it
+        self.assertEqual([section["id_tramo"] for section
+                          in self.index.query("0040", 0, 19.75, [2010])],
+                         [u"0040_1"])
+
+        self.assertEqual(self.index.get_details(2010, u"0040_1"),
+                         [(u"clasificacion", u"Bus", 1, u"4,2")])
+
+    def test_align_section(self):
+        section, = self.index.query("0040", 19.75, 83.43, [2010])
+
+        aligned = self.index.align_section(section)
+        self.assertEqual(aligned.keys(), [2011])
+
+        other, fraction = aligned[2011]
+        self.assertEqual(other["id_tramo"], u"0040_2")
+        self.assertAlmostEqual(fraction, (47.17 - 27.61) / (83.43 - 19.75))
+
+
+class TestToKm(unittest.TestCase):
+
+    def test_dots_are_thousands_separators_unless_numbers_are_typed(self):
+        self.assertEqual(_to_km(u"1.234"), 1234)
+        self.assertEqual(_to_km(u"1.234,5"), 1234.5)
+        self.assertEqual(_to_km(u"394,43"), 394.43)
+        self.assertEqual(_to_km(u"394.43"), 394.43)
+        self.assertEqual(_to_km(u"1234.0"), 1234)
+        self.assertEqual(_to_km(19.75), 19.75)
+        self.assertEqual(_to_km(u"s/d"), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
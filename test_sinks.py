@@ -0,0 +1,222 @@
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import zlib
+from collections import OrderedDict
+from openpyxl import load_workbook
+from sinks import ExcelSink, ParquetSink, SqliteSink, CsvSink, NdjsonSink
+from sinks import pyarrow
+from traffic_data import TrafficData
+
+
+class TestExcelSink(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp_dir, "output.xlsx")
+        self.tables = OrderedDict([("principal", ["id_tramo", "TMDA"]),
+                                   ("ver_detalle", ["id_tramo", "fila"])])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def get_rows(self):
+        wb = load_workbook(self.output)
+        return [(ws.title, [[cell.value for cell in row]
+                            for row in ws.iter_rows()])
+                for ws in wb.worksheets]
+
+    def test_full_sheet_goes_on_in_a_new_one(self):
+        sink = ExcelSink(self.output, self.tables)
+        sink.CHUNK_SIZE = 2
+        sink.MAX_ROWS = 3
+
+        sink.write("principal", [u"0003_1", 500])
+        for fila in xrange(5):
+            sink.write("ver_detalle", [u"0003_1", fila])
+        sink.save()
+
+        self.assertEqual(self.get_rows(), [
+            (u"principal", [[u"id_tramo", u"TMDA"], [u"0003_1", 500]]),
+            (u"ver_detalle", [[u"id_tramo", u"fila"], [u"0003_1", 0],
+                              [u"0003_1", 1]]),
+            (u"ver_detalle_2", [[u"id_tramo", u"fila"], [u"0003_1", 2],
+                                [u"0003_1", 3]]),
+            (u"ver_detalle_3", [[u"id_tramo", u"fila"], [u"0003_1", 4]])])
+
+
+class TestStreamSinks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tables = OrderedDict([("principal", ["id_tramo", "TMDA"]),
+                                   ("ver_detalle", ["id_tramo", "valor"])])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_records_are_readable_after_each_road(self):
+        sink = CsvSink(os.path.join(self.tmp_dir, "output.csv.gz"),
+                       self.tables)
+        sink.write("principal", [u"0003_1", 500])
+        sink.end_road(2010, "0003")
+
+        # the file is still open, but the road can be read already
+        path = os.path.join(self.tmp_dir, "output_principal.csv.gz")
+        with open(path, "rb") as f:
+            partial = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(
+                f.read())
+        self.assertEqual(partial, "id_tramo,TMDA\r\n0003_1,500\r\n")
+
+        sink.write("principal", [u"0040_1", None])
+        sink.save()
+
+        with gzip.open(path, "rb") as f:
+            self.assertEqual(f.read(), partial + "0040_1,\r\n")
+
+    def test_ndjson_records(self):
+        sink = NdjsonSink(os.path.join(self.tmp_dir, "output.ndjson.gz"),
+                          self.tables)
+        sink.write("ver_detalle", [u"0003_1", u"R\xedo"])
+        sink.write("ver_detalle", [u"0003_1", 394.43])
+        sink.save()
+
+        path = os.path.join(self.tmp_dir, "output_ver_detalle.ndjson.gz")
+        with gzip.open(path, "rb") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(records, [
+            {"id_tramo": u"0003_1", "valor": u"R\xedo"},
+            {"id_tramo": u"0003_1", "valor": 394.43}])
+
+    def test_files_are_moved_to_the_output_saved(self):
+        sink = CsvSink(os.path.join(self.tmp_dir, "partial.csv.gz"),
+                       self.tables)
+        sink.write("principal", [u"0003_1", 500])
+        sink.save(os.path.join(self.tmp_dir, "output.csv.gz"))
+
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ["output_principal.csv.gz",
+                          "output_ver_detalle.csv.gz"])
+
+
+class TestSqliteSink(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.tmp_dir, "output.sqlite")
+        self.tables = OrderedDict([("principal", ["id_tramo", "TMDA",
+                                                  "Anio"])])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_road(self, year, road, records):
+        sink = SqliteSink(self.output, self.tables)
+        sink.start_road(year, road)
+        for record in records:
+            sink.write("principal", record)
+        sink.end_road(year, road)
+        sink.save()
+
+    def get_rows(self):
+        connection = sqlite3.connect(self.output)
+        rows = connection.execute("SELECT * FROM principal ORDER BY Anio, "
+                                  "id_tramo").fetchall()
+        connection.close()
+        return rows
+
+    def test_records_and_roads_are_kept_between_runs(self):
+        self.write_road(2010, u"0040", [[u"0040_1", u"131", 2010]])
+        self.write_road(2010, u"0003", [[u"0003_1", 1286, 2010]])
+
+        self.assertEqual(self.get_rows(), [(u"0003_1", 1286, 2010),
+                                           (u"0040_1", u"131", 2010)])
+        sink = SqliteSink(self.output, self.tables)
+        self.assertTrue(sink.has_road(2010, u"0040"))
+        self.assertFalse(sink.has_road(2011, u"0040"))
+        sink.save()
+
+    def test_road_written_again_replaces_its_sections(self):
+        self.write_road(2010, u"0040", [[u"0040_1", u"131", 2010],
+                                        [u"0040_2", u"3024", 2010]])
+        self.write_road(2010, u"00401", [[u"00401_1", u"5", 2010]])
+        self.write_road(2011, u"0040", [[u"0040_1", u"4070", 2011]])
+
+        # the road has one section less now
+        self.write_road(2010, u"0040", [[u"0040_1", u"140", 2010]])
+
+        self.assertEqual(self.get_rows(), [(u"00401_1", u"5", 2010),
+                                           (u"0040_1", u"140", 2010),
+                                           (u"0040_1", u"4070", 2011)])
+
+    def test_variables_repeated_in_a_row_are_kept(self):
+        self.tables = OrderedDict([("ver_detalle", [
+            "id_tramo", "id_tabla", "variable", "fila", "valor", "Anio"])])
+
+        sink = SqliteSink(self.output, self.tables)
+        sink.start_road(2010, u"0040")
+        for record in [[u"0040_1", u"ruta", u"TMDA", 1, u"131", 2010],
+                       [u"0040_1", u"ruta", u"TMDA", 1, u"140", 2010],
+                       [u"0040_1", u"ruta", u"TMDA", 2, u"150", 2010]]:
+            sink.write("ver_detalle", record)
+        sink.end_road(2010, u"0040")
+        sink.save()
+
+        connection = sqlite3.connect(self.output)
+        rows = connection.execute("SELECT fila, ocurrencia, valor FROM "
+                                  "ver_detalle ORDER BY rowid").fetchall()
+        connection.close()
+
+        self.assertEqual(rows, [(1, 1, u"131"), (1, 2, u"140"),
+                                (2, 1, u"150")])
+
+
+@unittest.skipUnless(pyarrow, "pyarrow is not installed")
+class TestParquetSink(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tables = OrderedDict([("ver_detalle", ["id_tramo", "fila",
+                                                    "valor", "Anio"])])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_columns_are_typed(self):
+        sink = ParquetSink(os.path.join(self.tmp_dir, "output.parquet"),
+                           self.tables)
+        sink.ROW_GROUP_SIZE = 2
+        sink.write("ver_detalle", [u"0003_1", 1, u"394,43", u"2010"])
+        sink.write("ver_detalle", [u"0003_1", 2, u"Liv", 2010])
+        sink.write("ver_detalle", [u"0003_2", u"", u"1.234", 2010])
+        sink.save()
+
+        table = pyarrow.parquet.read_table(
+            os.path.join(self.tmp_dir, "output_ver_detalle.parquet"))
+        self.assertEqual(table.num_columns, 5)
+        self.assertEqual(table.to_pydict(), {
+            "id_tramo": [u"0003_1", u"0003_1", u"0003_2"],
+            "fila": [1, 2, None],
+            "valor": [u"394,43", u"Liv", u"1.234"],
+            "valor_num": [394.43, None, 1234.0],
+            "Anio": [2010, 2010, 2010]})
+
+
+class TestOutputFormat(unittest.TestCase):
+
+    def test_format_is_taken_from_the_extension(self):
+        self.assertEqual(TrafficData.get_output_format("out.ndjson.gz"),
+                         "ndjson.gz")
+        self.assertEqual(TrafficData.get_output_format(None), "xlsx")
+
+        for output in ["out.csv", "out.json"]:
+            with self.assertRaises(ValueError):
+                TrafficData(output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import unittest
+from dnv_scraper import RoadScraper
+from table_extractor import extract_road_rows, extract_detail_tables
+
+PAGE = u"""<html><head>
+<meta http-equiv="Content-Type" content="text/html; charset=iso-8859-1">
+</head><body>
+{}
+</body></html>"""
+
+ROAD_ROWS = u"""<table>
+<tr><th>Tramo</th><th>Distrito</th></tr>
+<tr><td class="FILA">0040-1</td><td class="FILA">23</td>
+<td class="FILA">Santa Cruz</td><td class="FILA"> RÍO GALLEGOS </td>
+<td class="FILA">0</td><td class="FILA">19,75</td>
+<td class="FILA"><a href="../html_tramos/8101.html">ver detalle</a></td>
+<td class="FILA">Cobertura</td></tr>
+<tr><td class="FILA impar">0040-2</td><td class="FILA">23</td>
+<td class="FILA">Santa Cruz</td><td class="FILA">ACC. RÍO</td>
+<td class="FILA">19,75</td><td class="FILA">83,43</td>
+<td class="FILA"></td><td class="FILA"></td></tr>
+<tr><td class="FILA">total</td><td class="FILA">83,43</td></tr>
+</table>
+<table></table>"""
+
+DETAIL_TABLES = u"""<h4>Ruta</h4>
+<table><thead><tr><th>Nº Distrito</th><th>Límites del Tramo</th></tr></thead>
+<tbody><tr><td>23</td><td>RIO TURBIO (I) - INT.R.P.7</td></tr></tbody>
+</table>
+<h4>Velocidad</h4>
+<table><thead><tr><th>Estimador</th><th>Liv</th></tr></thead>
+<tbody><tr><td>P85</td><td>135,6</td></tr><tr><td>VM</td><td>110,4</td></tr>
+</tbody></table>
+<h4>Clasificación</h4>
+<table><thead></thead><tbody></tbody></table>"""
+
+
+def to_page(body):
+    return PAGE.format(body).encode("iso-8859-1")
+
+
+def to_malformed_page(body):
+    """Drop closing tags of cells and rows, as sloppy html does."""
+    return to_page(body.replace(u"</td>", u"").replace(u"</tr>", u""))
+
+
+class TestTableExtractor(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = RoadScraper.PARSER
+        RoadScraper.PARSER = "lxml"
+
+    def tearDown(self):
+        RoadScraper.PARSER = self.parser
+
+    def test_road_rows_are_the_ones_of_beautifulsoup(self):
+        html = to_page(ROAD_ROWS)
+
+        self.assertEqual(extract_road_rows(html), [
+            ([u"0040-1", u"23", u"Santa Cruz", u"R\xcdO GALLEGOS", u"0",
+              u"19,75", u"ver detalle", u"Cobertura"],
+             u"../html_tramos/8101.html"),
+            ([u"0040-2", u"23", u"Santa Cruz", u"ACC. R\xcdO", u"19,75",
+              u"83,43", u"", u""], None)])
+
+        for html in [html, to_malformed_page(ROAD_ROWS), to_page(u""),
+                     to_page(u"<table><tr><td class='FILA'>1</table>")]:
+            self.assertEqual(extract_road_rows(html),
+                             RoadScraper._extract_road_rows(html))
+
+    def test_detail_tables_are_the_ones_of_beautifulsoup(self):
+        html = to_page(DETAIL_TABLES)
+
+        self.assertEqual(extract_detail_tables(html), {
+            u"ruta": [[u"N\xba Distrito", u"L\xedmites del Tramo"],
+                      [u"23", u"RIO TURBIO (I) - INT.R.P.7"]],
+            u"velocidad": [[u"Estimador", u"Liv"], [u"P85", u"135,6"],
+                           [u"VM", u"110,4"]],
+            u"clasificacion": []})
+
+        for html in [html, to_malformed_page(DETAIL_TABLES), to_page(u"")]:
+            self.assertEqual(extract_detail_tables(html),
+                             RoadScraper._parse_detail_tables(html))
+
+
+if __name__ == '__main__':
+    unittest.main()
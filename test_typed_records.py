@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import unittest
+from typed_records import RecordTyper
+from traffic_data import TrafficData
+
+
+class TestRecordTyper(unittest.TestCase):
+
+    def setUp(self):
+        self.typer = RecordTyper("simple_tbl",
+                                 TrafficData.get_simple_tbl_fields(),
+                                 "details_tbl",
+                                 TrafficData.get_details_tbl_fields())
+
+    def test_simple_fields_are_typed_by_schema(self):
+        record = [u"0040_1", u"23", u"Santa Cruz", u"TRAMO 1", u"1.394,43",
+                  u"1.400", u"1.234", u"ver detalle", u"", u"link", "2010"]
+
+        (table, typed), = self.typer.type_records([("simple_tbl", record)])
+
+        self.assertEqual(typed, [u"0040_1", 23, u"Santa Cruz", u"TRAMO 1",
+                                 1394.43, 1400.0, 1234, u"ver detalle", u"",
+                                 u"link", 2010])
+        self.assertIsInstance(typed[5], float)
+
+    def test_detail_values_are_typed_by_variable(self):
+        records = [("details_tbl", [u"0040_1", u"ruta", u"Distrito", 1,
+                                    u"23", "2010"]),
+                   ("simple_tbl", [u"0040_1"] + [u""] * 9 + ["2010"]),
+                   ("details_tbl", [u"0040_1", u"velocidad", u"Liv", 1,
+                                    u"114", "2010"]),
+                   ("details_tbl", [u"0040_1", u"velocidad", u"Liv", 2,
+                                    u"110,4", "2010"]),
+                   ("details_tbl", [u"0040_1", u"ruta", u"TMDA", 1,
+                                    u"1.234", "2010"])]
+
+        typed = list(self.typer.type_records(records))
+
+        # order of records is kept
+        self.assertEqual([table for table, record in typed],
+                         [table for table, record in records])
+
+        values = [record[4] for table, record in typed
+                  if table == "details_tbl"]
+        self.assertEqual(values, [u"23", 114.0, 110.4, 1234])
+        self.assertIsInstance(values[1], float)
+        self.assertIsInstance(values[3], int)
+
+    def test_unparseable_cells_are_kept_and_counted(self):
+        records = [("details_tbl", [u"0040_1", u"ruta", u"TMDA", 1, value,
+                                    "2010"])
+                   for value in [u"s/d", u"s/d", u"", u"500"]]
+
+        values = [record[4] for table, record
+                  in self.typer.type_records(records)]
+
+        self.assertEqual(values, [u"s/d", u"s/d", None, 500])
+        self.assertEqual(self.typer.errors, {("details_tbl", u"TMDA"): 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from road_records import RoadRecords
+from work_queue import WorkQueue, UnitFailedError
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = WorkQueue(os.path.join(self.tmp_dir, "queue.sqlite"))
+        self.road_links = {u"0040": u"http://host/0040.html",
+                           u"0003": u"http://host/0003.html"}
+        self.queue.enqueue([(2010, u"0040", self.road_links),
+                            (2010, u"0003", self.road_links)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_units_are_leased_in_order_and_published(self):
+        self.assertEqual(self.queue.lease("a"),
+                         (2010, u"0040", self.road_links))
+        self.assertEqual(self.queue.lease("b")[:2], (2010, u"0003"))
+        self.assertIsNone(self.queue.lease("c"))
+
+        records = RoadRecords(2010, "details_tbl", [
+            ("simple_tbl", [u"0003_1", u"23", None]),
+            ("details_tbl", [u"0003_1", u"ruta", u"TMDA", 1, u"500"])])
+        self.queue.complete(2010, u"0003", records,
+                            ((2, 1), {"records": 2}))
+
+        self.assertIsNone(self.queue.get_result(2010, u"0040"))
+        result_records, worker_stats = self.queue.get_result(2010, u"0003")
+        self.assertEqual(list(result_records), list(records))
+        self.assertEqual(worker_stats, [[2, 1], {"records": 2}])
+        self.assertEqual(self.queue.get_counts(), {"leased": 1, "done": 1})
+
+    def test_released_unit_is_scraped_again_when_resumed(self):
+        self.queue.lease("a")
+        self.queue.complete(2010, u"0040", RoadRecords(2010, "details_tbl"))
+        self.queue.release(2010, u"0040")
+
+        queue = WorkQueue(self.queue.queue_path, resume=True)
+        queue.enqueue([(2010, u"0040", self.road_links)])
+
+        self.assertEqual(queue.lease("b")[:2], (2010, u"0040"))
+
+    def test_expired_lease_is_leased_again(self):
+        self.queue.lease("crashed", lease_seconds=-1)
+
+        self.assertEqual(self.queue.lease("b")[:2], (2010, u"0040"))
+
+    def test_unit_whose_leases_expired_fails(self):
+        self.queue.MAX_ATTEMPTS = 2
+
+        self.queue.lease("crashed", lease_seconds=-1)
+        self.queue.lease("hanged", lease_seconds=-1)
+
+        self.assertEqual(self.queue.lease("c")[:2], (2010, u"0003"))
+        with self.assertRaises(UnitFailedError):
+            self.queue.get_result(2010, u"0040")
+
+    def test_failed_unit_is_retried(self):
+        self.queue.MAX_ATTEMPTS = 2
+
+        self.queue.lease("a")
+        self.queue.fail(2010, u"0040", "a", "HttpError")
+        self.assertEqual(self.queue.lease("b")[:2], (2010, u"0040"))
+        self.queue.fail(2010, u"0040", "b", "HttpError")
+
+        with self.assertRaises(UnitFailedError):
+            self.queue.get_result(2010, u"0040")
+        self.assertEqual(self.queue.lease("c")[:2], (2010, u"0003"))
+
+
+if __name__ == '__main__':
+    unittest.main()
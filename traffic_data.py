@@ -1,8 +1,15 @@
-from openpyxl import Workbook
-from utils import write_ws
+import os
+from collections import OrderedDict
+from sinks import (ExcelSink, ParquetSink, SqliteSink, CsvSink, NdjsonSink,
+                   CsvZstdSink, NdjsonZstdSink)
 
 
 class TrafficData():
+    """Store simple and details records of traffic data.
+
+    Records are written to a sink chosen by "output_format", or by the
+    extension of the output if no format is passed (xlsx by default).
+    """
 
     # DATA
     WS_SIMPLE_TBL_NAME = "principal"
@@ -13,17 +20,26 @@ class TrafficData():
     FIELDS_DETAILS_TBL = ["id_tramo", "id_tabla", "variable", "fila", "valor",
                           "Anio"]
     EXCEL_OUTPUT = "dnv_traffic_data.xlsx"
+    SINKS = OrderedDict([("xlsx", ExcelSink),
+                         ("parquet", ParquetSink),
+                         ("sqlite", SqliteSink),
+                         ("csv.gz", CsvSink),
+                         ("csv.zst", CsvZstdSink),
+                         ("ndjson.gz", NdjsonSink),
+                         ("ndjson.zst", NdjsonZstdSink)])
 
-    def __init__(self):
+    def __init__(self, output=None, output_format=None):
 
-        # create excel to save data
-        self.wb = Workbook(optimized_write=True)
+        output_format = output_format or self.get_output_format(output)
+        sink_class = self.SINKS[output_format]
 
-        # create sheet to store records of simple table
-        self.ws_simple = self.wb.create_sheet(title=self.WS_SIMPLE_TBL_NAME)
+        # use default output name, with the extension of the format
+        if not output:
+            output = (os.path.splitext(self.EXCEL_OUTPUT)[0] +
+                      sink_class.EXTENSION)
 
-        # create sheet to store records of details table
-        self.ws_details = self.wb.create_sheet(title=self.WS_DETAILS_TBL_NAME)
+        # create sink to save data
+        self.sink = sink_class(output, self.get_tables())
 
     # PUBLIC
     @classmethod
@@ -34,14 +50,50 @@ class TrafficData():
     def get_details_tbl_fields(self):
         return self.FIELDS_DETAILS_TBL
 
+    @classmethod
+    def get_tables(self):
+        return OrderedDict([(self.WS_SIMPLE_TBL_NAME, self.FIELDS_SIMPLE_TBL),
+                            (self.WS_DETAILS_TBL_NAME,
+                             self.FIELDS_DETAILS_TBL)])
+
+    @classmethod
+    def get_output_format(self, output):
+        """Return the format of an output from its extension (the first one
+        of SINKS if no output is passed).
+
+        Raises ValueError if the extension is not the one of any format."""
+
+        if not output:
+            return self.SINKS.keys()[0]
+
+        for output_format, sink_class in self.SINKS.items():
+            if output.endswith(sink_class.EXTENSION):
+                return output_format
+
+        raise ValueError("Unknown format of output {}, its extension should "
+                         "be one of: {}".format(output, ", ".join(
+                             sink_class.EXTENSION
+                             for sink_class in self.SINKS.values())))
+
     def write_simple_record(self, record):
-        dict_record = dict(zip(self.FIELDS_SIMPLE_TBL, record))
-        write_ws(self.ws_simple, dict_record, self.FIELDS_SIMPLE_TBL)
+        self.sink.write(self.WS_SIMPLE_TBL_NAME, record)
 
     def write_details_record(self, record):
-        dict_record = dict(zip(self.FIELDS_DETAILS_TBL, record))
-        write_ws(self.ws_details, dict_record, self.FIELDS_DETAILS_TBL)
+        self.sink.write(self.WS_DETAILS_TBL_NAME, record)
+
+    def has_road(self, year, road):
+        """Return True if the output already has all records of a road of a
+        year (only sinks that keep previous runs, like sqlite, may have)."""
+        return self.sink.has_road(year, road)
+
+    def start_road(self, year, road):
+        """Tell the sink the records of a road of a year are about to be
+        written (sinks keeping previous runs, like sqlite, replace them)."""
+        self.sink.start_road(year, road)
+
+    def end_road(self, year, road):
+        """Tell the sink all records of a road of a year were written."""
+        self.sink.end_road(year, road)
 
     def save(self, excel_output=None):
-        excel_output = excel_output or self.EXCEL_OUTPUT
-        self.wb.save(excel_output)
+        self.sink.save(excel_output)
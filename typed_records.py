@@ -0,0 +1,158 @@
+"""Typing of scraped records, from texts to numbers.
+
+Cells are scraped as texts written in argentinian format ("394,43",
+"1.234"). RecordTyper converts the records of a road into ints and floats,
+one column at a time, following a schema of each field of the principal
+table and of each variable (header) of the detail tables.
+"""
+
+from collections import Counter
+from utils import parse_number, remove_accents
+
+
+class RecordTyper():
+    """Convert numeric fields of (table, record) tuples into numbers.
+
+    Records of a road are converted at once, column by column: each
+    distinct text of a column is parsed only once. Cells of a numeric column
+    that are not numbers are kept as texts and counted as errors, while
+    empty cells become None.
+    """
+
+    # DATA
+    INTEGER = "integer"
+    DECIMAL = "decimal"
+    # integers if all numbers of the column are integers, decimals otherwise
+    NUMBER = "number"
+    TEXT = "text"
+
+    SIMPLE_SCHEMA = {"Nro distrito": INTEGER, "Ini": DECIMAL, "Fin": DECIMAL,
+                     "TMDA": INTEGER, "Anio": INTEGER}
+    DETAILS_SCHEMA = {"fila": INTEGER, "Anio": INTEGER}
+
+    # variables of detail tables (without accents, see remove_accents) that
+    # are texts, values of any other variable are numbers
+    TEXT_VARIABLES = ["distrito", "limitesdeltramo", "estimador"]
+    VALUE_FIELD = "valor"
+    VARIABLE_FIELD = "variable"
+
+    def __init__(self, simple_table, simple_fields, details_table,
+                 details_fields):
+
+        self.simple_table = simple_table
+        self.details_table = details_table
+
+        self.fields = {simple_table: simple_fields,
+                       details_table: details_fields}
+        self.schemas = {
+            simple_table: [self.SIMPLE_SCHEMA.get(field, self.TEXT)
+                           for field in simple_fields],
+            details_table: [self.DETAILS_SCHEMA.get(field, self.TEXT)
+                            for field in details_fields]}
+
+        self.value_index = details_fields.index(self.VALUE_FIELD)
+        self.variable_index = details_fields.index(self.VARIABLE_FIELD)
+
+        # texts that could not be parsed, by (table, field or variable)
+        self.errors = Counter()
+
+    # PUBLIC
+    def type_records(self, records):
+        """Generate (table, record) tuples with their numeric fields
+        converted, once all the records passed were read."""
+
+        records_by_table = {self.simple_table: [], self.details_table: []}
+        tables = []
+        for table, record in records:
+            records_by_table[table].append(record)
+            tables.append(table)
+
+        # convert each table column by column, in place
+        for table, table_records in records_by_table.items():
+            if table_records:
+                self._type_table(table, table_records)
+
+        # keep the order in which records were generated
+        positions = {self.simple_table: 0, self.details_table: 0}
+        for table in tables:
+            yield table, records_by_table[table][positions[table]]
+            positions[table] += 1
+
+    def get_errors_report(self):
+        """Return lines reporting the texts that could not be parsed."""
+
+        return [u"{}.{}: {} cells".format(table, field, count)
+                for (table, field), count in sorted(self.errors.items())]
+
+    # PRIVATE
+    def _type_table(self, table, table_records):
+
+        columns = zip(*table_records)
+
+        for index, column_type in enumerate(self.schemas[table]):
+            if column_type != self.TEXT:
+                columns[index] = self._type_column(
+                    columns[index], column_type,
+                    (table, self.fields[table][index]))
+
+        # values of detail tables are typed by their variable
+        if table == self.details_table:
+            columns[self.value_index] = self._type_values(
+                columns[self.variable_index], columns[self.value_index])
+
+        table_records[:] = [list(record) for record in zip(*columns)]
+
+    def _type_column(self, column, column_type, error_key):
+        """Return a column with its texts parsed as "column_type"."""
+
+        counts = Counter(column)
+        numbers = {text: parse_number(text) for text in counts}
+
+        if column_type == self.NUMBER:
+            column_type = self.INTEGER
+            if any(number is not None and number != int(number)
+                   for number in numbers.itervalues()):
+                column_type = self.DECIMAL
+
+        # keep texts that are not numbers as they are
+        values = {}
+        for text, number in numbers.iteritems():
+            if number is None:
+                values[text] = self._get_empty_or_text(text, error_key,
+                                                       counts[text])
+            elif column_type == self.INTEGER and number == int(number):
+                values[text] = int(number)
+            else:
+                values[text] = number
+
+        return [values[text] for text in column]
+
+    def _type_values(self, variables, values):
+        """Return values of detail tables typed as a column by variable."""
+
+        typed_values = list(values)
+
+        indexes_by_variable = {}
+        for index, variable in enumerate(variables):
+            indexes_by_variable.setdefault(variable, []).append(index)
+
+        for variable, indexes in indexes_by_variable.iteritems():
+            if remove_accents(variable) in self.TEXT_VARIABLES:
+                continue
+
+            typed_column = self._type_column(
+                [values[index] for index in indexes], self.NUMBER,
+                (self.details_table, variable))
+            for index, value in zip(indexes, typed_column):
+                typed_values[index] = value
+
+        return typed_values
+
+    def _get_empty_or_text(self, text, error_key, count):
+
+        if text is None or not unicode(text).strip():
+            return None
+
+        self.errors[error_key] += count
+
+        return text
@@ -1,12 +1,18 @@
-import urllib2
 from bs4 import BeautifulSoup
+from collections import deque
+from itertools import izip_longest
+import os
+import sqlite3
 import unicodedata
+from http_session import HttpSession
+from metrics import get_metrics
 from openpyxl import Workbook, load_workbook
 from pprint import pprint
 
 
 def compare_excels(excel1, excel2):
-    """Compare two excels based on row iteration."""
+    """Compare two excels cell by cell, with rows in the same order (see
+    output_diff to compare the records of outputs in any format)."""
 
     # load workbooks
     wb1 = load_workbook(excel1, use_iterators=True)
@@ -19,27 +25,85 @@ def compare_excels(excel1, excel2):
     # iterate sheets
     for ws1, ws2 in zip(wb1.worksheets, wb2.worksheets):
 
-        # iterate rows
-        for row1, row2 in zip(ws1.iter_rows(), ws2.iter_rows()):
+        # iterate rows, a missing row or cell is not equal to any other
+        for row1, row2 in izip_longest(ws1.iter_rows(), ws2.iter_rows(),
+                                       fillvalue=()):
 
             # iterate cells
-            for cell1, cell2 in zip(row1, row2):
+            for cell1, cell2 in izip_longest(row1, row2):
 
                 # evaluate cells value for equality
-                if not cell1.value == cell2.value:
+                if cell1 is None or cell2 is None or \
+                        not cell1.value == cell2.value:
                     return False
 
     return True
 
 
+# DATA
+# maximum simultaneous connections opened against the same host
+MAX_CONNECTIONS_PER_HOST = HttpSession.MAX_PER_HOST
+
+# HttpCache used by get_html_from_static_site, if any
+_http_cache = None
+
+# HttpSession keeping persistent connections used by all fetches
+_http_session = HttpSession()
+
+
+def set_max_connections_per_host(max_connections):
+    """Set the cap of simultaneous connections opened against each host by
+    the shared HttpSession."""
+
+    global MAX_CONNECTIONS_PER_HOST
+
+    MAX_CONNECTIONS_PER_HOST = max_connections
+    _http_session.set_max_per_host(max_connections)
+
+
+def set_http_cache(http_cache):
+    """Set an HttpCache that all fetches go through (None to disable it)."""
+
+    global _http_cache
+    _http_cache = http_cache
+
+
+def get_http_cache():
+    """Return the HttpCache that all fetches go through, or None."""
+    return _http_cache
+
+
+def set_http_session(http_session):
+    """Set the HttpSession used by all fetches."""
+
+    global _http_session
+    _http_session = http_session
+
+
+def fetch_from_static_site(url, headers=None):
+    """Fetch a static url, using the shared HttpSession.
+
+    Returns a (status, headers, body) tuple. A 304 (not modified) response is
+    returned with an empty body instead of being raised.
+
+    It is thread safe, and the session never opens more than its
+    "max_per_host" connections against the same host."""
+
+    with get_metrics().timer("fetch_seconds"):
+        response = _http_session.get(url, headers)
+
+    get_metrics().add("pages")
+
+    return response
+
+
 def get_html_from_static_site(url):
-    """Gets html from a static url, using urllib2."""
+    """Gets html from a static url, through the http cache if there is one."""
 
-    headers_browser = {'User-Agent': 'Chrome/16.0.912.77'}
-    request = urllib2.Request(url, '', headers=headers_browser)
-    response = urllib2.urlopen(request)
+    if _http_cache:
+        return _http_cache.get_html(url, fetch_from_static_site)
 
-    return response.read()
+    return fetch_from_static_site(url)[2]
 
 
 def get_bs_from_static_site(url, parser="html5lib"):
@@ -62,6 +126,95 @@ def extract_key_value_pairs_from_bs(key_value_pairs, main_tag, attribute):
     return RV
 
 
+def imap_bounded(pool, func, iterable, window):
+    """Apply func to each item of iterable in a pool, generating results in
+    order.
+
+    Unlike pool.imap, the iterable is consumed in the calling thread (so its
+    errors are raised here) and no more than "window" items are sent to the
+    pool ahead of the result being consumed."""
+
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+
+        if len(pending) >= window:
+            yield pending.popleft().get()
+
+    while pending:
+        yield pending.popleft().get()
+
+
+def parse_number(text):
+    """Parse a number written in argentinian format ("394,43", "1.234").
+
+    Dots are thousands separators and the comma is the decimal one. Returns a
+    float, or None if text is empty or is not a number."""
+
+    if isinstance(text, (int, long, float)):
+        return float(text)
+
+    text = text.strip() if text else text
+    if not text:
+        return None
+
+    try:
+        return float(text.replace(".", "").replace(",", "."))
+    except ValueError:
+        return None
+
+
+def parse_integer(text):
+    """Parse an integer written in argentinian format ("1.234").
+
+    Returns None if text is empty or is not an integer number."""
+
+    if isinstance(text, (int, long)):
+        return text
+
+    number = parse_number(text)
+    if number is None or number != int(number):
+        return None
+
+    return int(number)
+
+
+def parse_written_number(value):
+    """Parse a number as it is written in any output: a number, a text in
+    argentinian format ("394,43", "1.234") or a text with a decimal dot, as
+    typed numbers are written in csv outputs ("394.43", "1234.0").
+
+    A single dot followed by three digits is a thousands separator, as in
+    parse_number, any other single dot without a comma is a decimal one.
+    Returns a float, or None if value is empty or is not a number."""
+
+    if isinstance(value, basestring):
+        text = value.strip()
+        integer, dot, decimals = text.partition(".")
+
+        if dot and "," not in text and "." not in decimals and \
+                len(decimals) != 3:
+            try:
+                return float(text)
+            except ValueError:
+                return None
+
+    return parse_number(value)
+
+
+def get_thread_connection(local, path, **kwargs):
+    """Return the sqlite connection to "path" of this thread, kept in a
+    threading.local (sqlite connections can't be shared by threads, nor by
+    processes forked from this one). Keyword arguments are the ones of
+    sqlite3.connect."""
+
+    if getattr(local, "pid", None) != os.getpid():
+        local.pid = os.getpid()
+        local.connection = sqlite3.connect(path, **kwargs)
+
+    return local.connection
+
+
 def remove_accents(data):
     return ''.join(x for x in unicodedata.normalize('NFKD', data)
                    if unicodedata.category(x)[0] == 'L').lower()
@@ -0,0 +1,237 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from road_records import RoadRecords
+from utils import get_thread_connection
+
+
+class UnitFailedError(Exception):
+    """A unit of a WorkQueue failed in all its attempts."""
+
+    def __init__(self, year, road, error):
+        Exception.__init__(self, "Road {} of year {} failed: {}".format(
+            road, year, error))
+        self.year = year
+        self.road = road
+        self.error = error
+
+
+class WorkQueue():
+    """Durable queue of (year, road) units to be scraped by many workers,
+    stored in a SQLite file that workers of any node can reach.
+
+    A coordinator enqueues the units of a run and takes their results in
+    order. Workers lease the first unit pending for LEASE_SECONDS, scrape it
+    and publish its records. A unit whose lease expired (its worker crashed
+    or hanged) can be leased again by other worker, and a unit that failed
+    or whose lease expired is retried until it was tried MAX_ATTEMPTS times.
+
+    Records are published as the compressed json of a RoadRecords (see
+    RoadRecords.to_dict), with the stats of the worker (see
+    _pop_worker_stats), and dropped once the coordinator wrote them (see
+    release). Any broker with the same methods can stand in for this one.
+    """
+
+    # DATA
+    UNITS_TABLE = "units"
+    LEASE_SECONDS = 30 * 60
+    MAX_ATTEMPTS = 3
+    TIMEOUT = 60
+    PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+    def __init__(self, queue_path, resume=False):
+
+        self.queue_path = queue_path
+        self.local = threading.local()
+
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS {} (year TEXT, road TEXT, "
+                "seq INTEGER, job TEXT, state TEXT, worker TEXT, "
+                "lease_until REAL, attempts INTEGER DEFAULT 0, error TEXT, "
+                "result BLOB, PRIMARY KEY (year, road))".format(
+                    self.UNITS_TABLE))
+
+        # start a new queue, unless resuming the previous one
+        if not resume:
+            self.clear()
+
+    # PUBLIC
+    def enqueue(self, jobs):
+        """Add (year, road, road_links) jobs, to be leased in the same
+        order. Units already in the queue are kept as they are, unless their
+        records were released: they are scraped again."""
+
+        with self._transaction() as connection:
+            seq = connection.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM {}".format(
+                    self.UNITS_TABLE)).fetchone()[0]
+
+            # the job is kept as json, with the year as it was passed
+            for year, road, road_links in jobs:
+                seq += 1
+                connection.execute(
+                    "INSERT OR IGNORE INTO {} (year, road, seq, job, state) "
+                    "VALUES (?, ?, ?, ?, ?)".format(self.UNITS_TABLE),
+                    (unicode(year), road, seq,
+                     json.dumps([year, road, road_links]), self.PENDING))
+
+                connection.execute(
+                    "UPDATE {} SET state = ?, attempts = 0 WHERE year = ? "
+                    "AND road = ? AND state = ? AND result IS NULL".format(
+                        self.UNITS_TABLE),
+                    (self.PENDING, unicode(year), road, self.DONE))
+
+    def lease(self, worker, lease_seconds=None):
+        """Lease the first unit pending (or whose lease expired) to a worker.
+
+        Returns a (year, road, road_links) job, or None if there are no units
+        to lease now."""
+
+        now = time.time()
+
+        with self._transaction() as connection:
+
+            # an expired lease was an attempt too
+            connection.execute(
+                "UPDATE {} SET state = ?, error = ? WHERE state = ? AND "
+                "lease_until < ? AND attempts >= ?".format(self.UNITS_TABLE),
+                (self.FAILED, "lease expired in the last attempt",
+                 self.LEASED, now, self.MAX_ATTEMPTS))
+
+            row = connection.execute(
+                "SELECT year, road, job FROM {} WHERE state = ? OR "
+                "(state = ? AND lease_until < ?) ORDER BY seq LIMIT 1".format(
+                    self.UNITS_TABLE),
+                (self.PENDING, self.LEASED, now)).fetchone()
+
+            if not row:
+                return None
+
+            year, road, job = row
+            connection.execute(
+                "UPDATE {} SET state = ?, worker = ?, lease_until = ?, "
+                "attempts = attempts + 1 WHERE year = ? AND road = ?".format(
+                    self.UNITS_TABLE),
+                (self.LEASED, worker,
+                 now + (lease_seconds or self.LEASE_SECONDS), year, road))
+
+        return tuple(json.loads(job))
+
+    def complete(self, year, road, records, worker_stats=None):
+        """Publish the records (a RoadRecords) of a unit, unless other worker
+        already did."""
+
+        result = zlib.compress(json.dumps(
+            {"records": records.to_dict(), "worker_stats": worker_stats}))
+
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE {} SET state = ?, result = ?, error = NULL WHERE "
+                "year = ? AND road = ? AND state != ?".format(
+                    self.UNITS_TABLE),
+                (self.DONE, sqlite3.Binary(result), unicode(year), road,
+                 self.DONE))
+
+    def fail(self, year, road, worker, error):
+        """Record the error of the attempt of a worker to scrape a unit, to
+        be retried unless it was tried MAX_ATTEMPTS times."""
+
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE {} SET state = CASE WHEN attempts < ? THEN ? ELSE ? "
+                "END, error = ? WHERE year = ? AND road = ? AND "
+                "state = ? AND worker = ?".format(self.UNITS_TABLE),
+                (self.MAX_ATTEMPTS, self.PENDING, self.FAILED, error,
+                 unicode(year), road, self.LEASED, worker))
+
+    def get_result(self, year, road):
+        """Return the (records, worker_stats) of a unit, or None if it is
+        not done yet. Raises UnitFailedError if it failed."""
+
+        row = self._get_connection().execute(
+            "SELECT state, error, result FROM {} WHERE year = ? AND "
+            "road = ?".format(self.UNITS_TABLE),
+            (unicode(year), road)).fetchone()
+
+        if not row:
+            raise KeyError((year, road))
+
+        state, error, result = row
+        if state == self.FAILED:
+            raise UnitFailedError(year, road, error)
+        if state != self.DONE:
+            return None
+
+        result = json.loads(zlib.decompress(result))
+
+        return (RoadRecords.from_dict(result["records"]),
+                result["worker_stats"])
+
+    def release(self, year, road):
+        """Drop the records of a unit once they were written to the
+        output."""
+
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE {} SET result = NULL WHERE year = ? AND "
+                "road = ?".format(self.UNITS_TABLE), (unicode(year), road))
+
+    def is_finished(self):
+        """Return True if no unit is pending or leased."""
+
+        row = self._get_connection().execute(
+            "SELECT COUNT(*) FROM {} WHERE state IN (?, ?)".format(
+                self.UNITS_TABLE), (self.PENDING, self.LEASED)).fetchone()
+
+        return row[0] == 0
+
+    def get_counts(self):
+        """Return a dict with the number of units in each state."""
+
+        return dict(self._get_connection().execute(
+            "SELECT state, COUNT(*) FROM {} GROUP BY state".format(
+                self.UNITS_TABLE)).fetchall())
+
+    def clear(self):
+        """Remove all units of the queue."""
+
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM {}".format(self.UNITS_TABLE))
+
+    @classmethod
+    def get_worker_name(cls):
+        """Return a name for a worker process of this node."""
+        return "{}:{}".format(socket.gethostname(), os.getpid())
+
+    # PRIVATE
+    def _get_connection(self):
+        return get_thread_connection(self.local, self.queue_path,
+                                     timeout=self.TIMEOUT,
+                                     isolation_level=None)
+
+    def _transaction(self):
+        """Return a context manager running a transaction that takes the
+        write lock of the database at once (so no two workers lease the same
+        unit)."""
+        return _ImmediateTransaction(self._get_connection())
+
+
+class _ImmediateTransaction():
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.connection.execute("ROLLBACK")
+        else:
+            self.connection.execute("COMMIT")